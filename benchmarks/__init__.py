@@ -0,0 +1,4 @@
+from .synthetic import generate_database
+from .suite import OPERATIONS, compare, run_suite
+
+__all__ = ["generate_database", "OPERATIONS", "compare", "run_suite"]
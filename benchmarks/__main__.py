@@ -0,0 +1,56 @@
+import argparse
+import json
+import os
+import tempfile
+
+from .suite import OPERATIONS, compare, run_suite
+from .synthetic import generate_database
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Generate a synthetic payroll database and time the core operations")
+    parser.add_argument("--employees", type=int, default=2000)
+    parser.add_argument("--months", type=int, default=24)
+    parser.add_argument("--positions", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--db", help="database file to create (default: a temporary file)")
+    parser.add_argument("--only", nargs="+", choices=sorted(OPERATIONS), metavar="OP",
+                        help="run only these operations")
+    parser.add_argument("--output", "-o", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="slowdown ratio reported as a regression (default 1.25)")
+    args = parser.parse_args(argv)
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="efs_bench_"), "bench.db")
+    print(f"Generating {args.employees} employees x {args.months} months "
+          f"x {args.positions} positions in {db_path}")
+    meta = generate_database(db_path, args.employees, args.months, args.positions, seed=args.seed)
+
+    def progress(name, result):
+        print(f"  {name:<32} median {result['median_ms']:10.3f} ms   p95 {result['p95_ms']:10.3f} ms")
+
+    results = run_suite(db_path, meta, samples=args.samples, only=args.only, progress=progress)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows = compare(results, baseline, args.threshold)
+        print(f"\n{'operation':<32} {'baseline':>12} {'current':>12} {'ratio':>8}")
+        for name, before, after, ratio, status in rows:
+            flag = "" if status == "ok" else f"  {status}"
+            print(f"{name:<32} {before:10.3f}ms {after:10.3f}ms {ratio:8.2f}{flag}")
+        return 1 if any(row[4] == "regression" for row in rows) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,157 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from .synthetic import PASSWORD, generate_database
+
+# Load test for the JSON/HTTP service: starts "python -m finance serve" on a
+# free localhost port against a synthetic database, then drives it with
+# many keep-alive clients running a mix of dashboard, login, report and
+# save requests, and reports throughput and latency percentiles.
+
+MIX = (("dashboard", 60), ("login", 15), ("report", 20), ("save", 5))
+
+
+async def _request(reader, writer, method, path, body=None, token=None):
+    payload = json.dumps(body).encode() if body is not None else b""
+    head = f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(payload)}\r\n"
+    if token:
+        head += f"Authorization: Bearer {token}\r\n"
+    writer.write(head.encode() + b"\r\n" + payload)
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode().partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    data = json.loads(await reader.readexactly(length)) if length else None
+    return status, data
+
+
+async def _client(host, port, meta, deadline, latencies, errors, seed):
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    year = meta["start_year"] + (meta["months"] - 1) // 12
+    month = (meta["months"] - 1) % 12 + 1
+
+    def employee():
+        return f"Employee {rng.randint(1, meta['employees']):06d}"
+
+    _, admin = await _request(reader, writer, "POST", "/login",
+                              {"username": "admin", "password": PASSWORD})
+    _, user = await _request(reader, writer, "POST", "/login",
+                             {"username": employee(), "password": PASSWORD})
+    kinds = [kind for kind, weight in MIX for _ in range(weight)]
+    reports = ["monthly-payroll", "employee-summary", "department-summary"]
+
+    try:
+        while time.perf_counter() < deadline:
+            kind = rng.choice(kinds)
+            started = time.perf_counter()
+            if kind == "dashboard":
+                status, _ = await _request(reader, writer, "GET", "/dashboard",
+                                           token=user["token"])
+            elif kind == "login":
+                status, _ = await _request(reader, writer, "POST", "/login",
+                                           {"username": employee(), "password": PASSWORD})
+            elif kind == "report":
+                path = (f"/reports/{rng.choice(reports)}?month={month}&year={year}"
+                        f"&offset={rng.randrange(0, max(1, meta['employees']), 100)}&limit=100")
+                status, _ = await _request(reader, writer, "GET", path, token=admin["token"])
+            else:
+                status, _ = await _request(reader, writer, "POST", "/records", {
+                    "employee_id": rng.randint(1, meta["employees"]), "month": month,
+                    "year": year, "overtime_hours": rng.choice((0, 4, 8))},
+                    token=admin["token"])
+            latencies.setdefault(kind, []).append((time.perf_counter() - started) * 1000)
+            if status != 200:
+                errors[kind] = errors.get(kind, 0) + 1
+    finally:
+        writer.close()
+
+
+def _percentiles(values):
+    values = sorted(values)
+
+    def pick(q):
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    return {"count": len(values), "p50_ms": pick(0.50), "p95_ms": pick(0.95),
+            "p99_ms": pick(0.99), "max_ms": values[-1], "mean_ms": statistics.fmean(values)}
+
+
+async def run_load(host, port, meta, clients, duration):
+    latencies, errors = {}, {}
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(_client(host, port, meta, deadline, latencies, errors, seed)
+                           for seed in range(clients)))
+    elapsed = time.perf_counter() - started
+    everything = [v for values in latencies.values() for v in values]
+    return {
+        "clients": clients,
+        "seconds": elapsed,
+        "requests": len(everything),
+        "requests_per_second": len(everything) / elapsed,
+        "errors": errors,
+        "latency": _percentiles(everything),
+        "by_request": {kind: _percentiles(values) for kind, values in latencies.items()},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load",
+                                     description="Load test the JSON/HTTP service on localhost")
+    parser.add_argument("--employees", type=int, default=2000)
+    parser.add_argument("--months", type=int, default=12)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--output", "-o", help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="efs_load_"), "load.db")
+    meta = generate_database(db_path, args.employees, args.months)
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    server = subprocess.Popen(
+        [sys.executable, "-m", "finance", "--db", db_path, "serve", "--port", "0",
+         "--workers", str(args.workers)],
+        cwd=root, stdout=subprocess.PIPE, text=True)
+    try:
+        line = server.stdout.readline()
+        host, port = line.rsplit("//", 1)[1].strip().rsplit(":", 1)
+        results = asyncio.run(run_load(host, int(port), meta, args.clients, args.duration))
+    finally:
+        server.terminate()
+        server.wait()
+
+    results["meta"] = {**meta, "workers": args.workers}
+    latency = results["latency"]
+    print(f"{results['requests']} requests from {args.clients} clients in {results['seconds']:.1f}s: "
+          f"{results['requests_per_second']:,.0f} req/s")
+    print(f"latency p50 {latency['p50_ms']:.2f} ms  p95 {latency['p95_ms']:.2f} ms  "
+          f"p99 {latency['p99_ms']:.2f} ms  max {latency['max_ms']:.2f} ms")
+    for kind, stats in results["by_request"].items():
+        print(f"  {kind:<10} {stats['count']:>7}  p50 {stats['p50_ms']:7.2f}  "
+              f"p99 {stats['p99_ms']:7.2f} ms  errors {results['errors'].get(kind, 0)}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 1 if results["errors"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,247 @@
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from glob import glob
+
+from finance import Database
+from finance.employees import employee_history, get_employee_for_user
+from finance.export import export_report
+from finance.pack import build_annual_pack
+from finance.payslips import generate_payslips
+from finance.payroll import run_payroll, save_financial_record, write_financial_record
+from finance.reports import REPORT_TYPES, ReportPager, fetch_report
+from finance.rules import PayrollHistory, RuleSet, simulate
+from finance.snapshot import Snapshot, write_snapshot
+from finance.users import authenticate
+from finance.writer import GroupCommitWriter
+
+from .synthetic import PASSWORD
+
+
+class Context:
+    # Shared state handed to every operation
+    def __init__(self, db, meta, seed=0):
+        self.db = db
+        self.meta = meta
+        self.rng = random.Random(seed)
+        self.employees = meta["employees"]
+        last = meta["months"] - 1
+        self.year = meta["start_year"] + last // 12
+        self.month = last % 12 + 1
+        self.tmpdir = tempfile.mkdtemp(prefix="efs_bench_")
+
+    def employee_id(self):
+        return self.rng.randint(1, self.employees)
+
+    def username(self):
+        return f"Employee {self.employee_id():06d}"
+
+
+def _login(ctx):
+    authenticate(ctx.db, ctx.username(), PASSWORD)
+
+
+def _save_record(ctx):
+    save_financial_record(ctx.db, ctx.employee_id(), ctx.month, ctx.year,
+                          ctx.rng.choice((0, 4, 8)), ctx.rng.choice((0, 100)), 0, 0)
+
+
+def _concurrent_saves(ctx, threads=8, per_thread=50):
+    # Eight callers saving at once through one group-commit writer
+    writer = GroupCommitWriter(ctx.db)
+    ids = [[ctx.employee_id() for _ in range(per_thread)] for _ in range(threads)]
+
+    def save(batch):
+        futures = [writer.submit(write_financial_record, i, ctx.month, ctx.year, 4)
+                   for i in batch]
+        for future in futures:
+            future.result()
+
+    workers = [threading.Thread(target=save, args=(batch,)) for batch in ids]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    writer.close()
+
+
+def _report(report_type):
+    def fetch(ctx):
+        with ctx.db.connection() as conn:
+            fetch_report(conn, report_type, ctx.month, ctx.year)
+    return fetch
+
+
+def _report_open(report_type):
+    # What a report window does before it can show anything
+    def open_report(ctx):
+        ReportPager(ctx.db, report_type, ctx.month, ctx.year).prefetch()
+    return open_report
+
+
+def _dashboard(ctx):
+    employee = get_employee_for_user(ctx.db, ctx.username())
+    employee_history(ctx.db, employee[0])
+
+
+def _export(ext):
+    def export(ctx):
+        path = os.path.join(ctx.tmpdir, f"monthly_payroll{ext}")
+        export_report(ctx.db, "Monthly Payroll", ctx.month, ctx.year, path)
+    return export
+
+
+def _annual_pack(ctx):
+    build_annual_pack(ctx.db, ctx.year, os.path.join(ctx.tmpdir, "annual_pack.xlsx"))
+
+
+def _payslips(force):
+    # Every slip of the month, or a re-run where nothing changed
+    def render(ctx):
+        generate_payslips(ctx.db, ctx.month, ctx.year, os.path.join(ctx.tmpdir, "payslips"),
+                          force=force)
+    return render
+
+
+def _payroll_run(ctx):
+    run_payroll(ctx.db, ctx.month, ctx.year, overwrite=True)
+
+
+WHAT_IF_RULES = RuleSet({"default": {"overtime_tiers": [[10, 1.5], [None, 2.0]],
+                                     "deduction_cap_pct": 50}})
+
+
+def _what_if(ctx):
+    # Re-pricing the whole history; loading it happens once per screen
+    if not hasattr(ctx, "history"):
+        ctx.history = PayrollHistory.load(ctx.db)
+    simulate(ctx.history, WHAT_IF_RULES, 3.0, {"Manager": 5.0})
+
+
+def _snapshot_export(ctx):
+    write_snapshot(ctx.db, os.path.join(ctx.tmpdir, "history.snap"))
+
+
+def _what_if_snapshot(ctx):
+    # Mapping the exported history and re-pricing it, load included
+    path = os.path.join(ctx.tmpdir, "history.snap")
+    if not os.path.exists(path):
+        write_snapshot(ctx.db, path)
+    simulate(PayrollHistory.from_snapshot(Snapshot.open(path)), WHAT_IF_RULES, 3.0,
+             {"Manager": 5.0})
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _cold_start(code):
+    # A fresh interpreter each time, so nothing is already imported
+    def start(ctx):
+        subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True,
+                       stdout=subprocess.DEVNULL)
+    return start
+
+
+def _gui_script():
+    return glob(os.path.join(ROOT, "employee_finance_system*.py"))[0]
+
+
+def _slug(report_type):
+    return report_type.lower().replace(" ", "_")
+
+
+# name -> (function, calls per sample). Cheap operations are looped so each
+# sample is long enough to time reliably; results are per call.
+OPERATIONS = {
+    "login": (_login, 200),
+    "save_financial_record": (_save_record, 50),
+    "group_commit_400_saves": (_concurrent_saves, 1),
+    **{f"report_{_slug(t)}": (_report(t), 1) for t in REPORT_TYPES},
+    **{f"report_open_{_slug(t)}": (_report_open(t), 1) for t in REPORT_TYPES},
+    "employee_dashboard": (_dashboard, 200),
+    "export_xlsx": (_export(".xlsx"), 1),
+    "export_csv": (_export(".csv"), 1),
+    "annual_pack": (_annual_pack, 1),
+    "payslips": (_payslips(True), 1),
+    "payslips_unchanged": (_payslips(False), 1),
+    "payroll_run": (_payroll_run, 1),
+    "what_if_simulation": (_what_if, 1),
+    "snapshot_export": (_snapshot_export, 1),
+    "what_if_snapshot": (_what_if_snapshot, 1),
+    "cold_start_cli": (_cold_start("from finance.cli import build_parser; build_parser()"), 1),
+    # Module import only; creating the Tk root needs a display
+    "cold_start_gui": (_cold_start(f"import runpy; runpy.run_path({_gui_script()!r}, run_name='bench')"), 1),
+}
+
+
+def _time(func, ctx, calls, samples):
+    func(ctx)  # warm up caches and prepared statements
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        for _ in range(calls):
+            func(ctx)
+        timings.append((time.perf_counter() - started) * 1000 / calls)
+    timings.sort()
+    return {
+        "calls": calls,
+        "samples": samples,
+        "min_ms": timings[0],
+        "median_ms": statistics.median(timings),
+        "p95_ms": timings[min(len(timings) - 1, int(round(0.95 * (len(timings) - 1))))],
+        "mean_ms": statistics.fmean(timings),
+    }
+
+
+def run_suite(db_path, meta, samples=5, only=None, progress=None):
+    db = Database(db_path)
+    ctx = Context(db, meta)
+    results = {}
+    try:
+        for name, (func, calls) in OPERATIONS.items():
+            if only and name not in only:
+                continue
+            results[name] = _time(func, ctx, calls, samples)
+            if progress:
+                progress(name, results[name])
+    finally:
+        db.close()
+
+    return {
+        "meta": {
+            **meta,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold=1.25):
+    # Returns (name, baseline ms, current ms, ratio, status) per operation
+    # present in both runs; status is "regression" past threshold,
+    # "improvement" below its inverse, otherwise "ok".
+    rows = []
+    for name, result in current["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if not before:
+            continue
+        ratio = result["median_ms"] / before["median_ms"] if before["median_ms"] else float("inf")
+        if ratio > threshold:
+            status = "regression"
+        elif ratio < 1 / threshold:
+            status = "improvement"
+        else:
+            status = "ok"
+        rows.append((name, before["median_ms"], result["median_ms"], ratio, status))
+    return rows
@@ -0,0 +1,88 @@
+import os
+import random
+
+import pandas as pd
+
+from finance import Database
+from finance.money import to_minor
+from finance.payroll import run_payroll
+from finance.schema import init_database
+
+POSITION_TITLES = ["Accountant", "Analyst", "Cashier", "Clerk", "Developer", "Driver",
+                   "Engineer", "Manager", "Nurse", "Receptionist", "Sales", "Technician"]
+
+PASSWORD = "password"
+
+
+def _positions(count):
+    # Realistic titles first, then numbered grades once they run out
+    titles = []
+    for i in range(count):
+        title = POSITION_TITLES[i % len(POSITION_TITLES)]
+        grade = i // len(POSITION_TITLES)
+        titles.append(f"{title} {grade + 1}" if grade else title)
+    return titles
+
+
+def generate_database(path, employees=1000, months=12, positions=10,
+                      start_year=2020, seed=0):
+    # Builds a fresh database at path with the real schema and migrations,
+    # then fills every month through the real payroll run.
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    rng = random.Random(seed)
+    titles = _positions(positions)
+    db = Database(path)
+    try:
+        init_database(db)
+
+        people = []
+        for i in range(employees):
+            position = rng.choice(titles)
+            salary = to_minor(rng.lognormvariate(8.0, 0.35))
+            joined = f"{rng.randint(2000, start_year)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+            people.append((i + 1, f"Employee {i + 1:06d}", position, salary, joined))
+
+        with db.transaction() as conn:
+            conn.executemany("""INSERT INTO employees (id, name, position, base_salary, join_date)
+                                VALUES (?, ?, ?, ?, ?)""", people)
+            conn.executemany("INSERT INTO users (username, password, role) VALUES (?, ?, 'employee')",
+                             ((p[1], PASSWORD) for p in people))
+            conn.execute("INSERT INTO users (username, password, role) VALUES ('admin', ?, 'admin')",
+                         (PASSWORD,))
+            # About one in eight takes a loan in the first month, repaid over
+            # six months to two years through the ledger
+            loans = []
+            for person in people:
+                if rng.random() < 0.125:
+                    principal = rng.choice((1000, 2000, 3000, 5000))
+                    loans.append((person[0], to_minor(principal),
+                                  to_minor(principal / rng.choice((6, 12, 24)))))
+            conn.executemany(f"""INSERT INTO loans (employee_id, kind, principal, installment,
+                                                    start_year, start_month)
+                                 VALUES (?, 'loan', ?, ?, {int(start_year)}, 1)""", loans)
+
+        for offset in range(months):
+            year, month = start_year + offset // 12, offset % 12 + 1
+            # About a third of staff work overtime or get an incentive each
+            # month, and a few take an advance
+            adjustments = pd.DataFrame({
+                "employee_id": range(1, employees + 1),
+                "overtime_hours": [rng.choice((0, 0, 0, 4, 8, 12, 20)) for _ in range(employees)],
+                "incentives": [rng.choice((0, 0, 0, 100, 250)) for _ in range(employees)],
+                "advances": [rng.choice((0,) * 9 + (200,)) for _ in range(employees)],
+            })
+            run_payroll(db, month, year, adjustments)
+    finally:
+        db.close()
+
+    return {
+        "employees": employees,
+        "months": months,
+        "positions": positions,
+        "start_year": start_year,
+        "records": employees * months,
+        "seed": seed,
+    }
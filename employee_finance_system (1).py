@@ -1,8 +1,34 @@
+import json
+import os
+import tempfile
 import tkinter as tk
-from tkinter import ttk, messagebox
-import sqlite3
+import webbrowser
+from tkinter import ttk, messagebox, filedialog
+from concurrent.futures import CancelledError
 from datetime import datetime
-import pandas as pd
+
+from finance import Database, DEFAULT_DB_PATH
+from finance.cache import ReportCache, scope_versions
+from finance.employees import (employee_history, get_employee_for_user, has_employees,
+                                write_employee)
+from finance.export import ExportJob
+from finance.importer import IMPORTERS
+from finance.ledger import outstanding_balance, write_loan
+from finance.metrics import metrics, timed
+from finance.pack import AnnualPackJob
+from finance.payslips import PayslipJob, iter_payslips, payslip_filename, render_payslip
+from finance.payroll import load_adjustments, run_payroll, write_financial_record
+from finance.reports import REPORT_TYPES, ReportCancelled, ReportRunner
+from finance.rules import PayrollHistory, RuleSet, parse_raises, simulate
+from finance.schema import init_database
+from finance.search import search_employees
+from finance.users import authenticate, register_user
+from finance.writer import GroupCommitWriter
+
+# How often report windows check on their worker thread
+REPORT_POLL_MS = 100
+# Pause after the last keystroke before the employee search runs
+SEARCH_DEBOUNCE_MS = 150
 
 class CustomStyle:
     # Color scheme
@@ -34,8 +60,223 @@ class CustomStyle:
         button.bind("<Enter>", on_enter)
         button.bind("<Leave>", on_leave)
 
+class VirtualTable(tk.Frame):
+    # A Treeview backed by a ReportPager. It keeps one item per visible row
+    # and rewrites their values as the user scrolls, fetching only the rows
+    # in view, so a report of any size opens in constant time and memory.
+    # Clicking a heading sorts by that column in SQL.
+    def __init__(self, parent, pager, visible_rows=25):
+        super().__init__(parent)
+        self.pager = pager
+        self.first = 0
+        self.visible_rows = visible_rows
+        self._items = []
+        
+        self.tree = ttk.Treeview(self, columns=pager.columns, show="headings",
+                                 height=visible_rows, selectmode="browse")
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        
+        for column in pager.columns:
+            self.tree.heading(column, text=self._heading_text(column),
+                              command=lambda c=column: self.sort_by(c))
+            self.tree.column(column, width=100)
+        
+        self.tree.bind("<MouseWheel>", lambda e: self.scroll_to(self.first - e.delta // 40))
+        self.tree.bind("<Button-4>", lambda e: self.scroll_to(self.first - 3))
+        self.tree.bind("<Button-5>", lambda e: self.scroll_to(self.first + 3))
+        self.tree.bind("<Prior>", lambda e: self.scroll_to(self.first - self.visible_rows))
+        self.tree.bind("<Next>", lambda e: self.scroll_to(self.first + self.visible_rows))
+        self.tree.bind("<Home>", lambda e: self.scroll_to(0))
+        self.tree.bind("<End>", lambda e: self.scroll_to(self.pager.count()))
+        self.tree.bind("<Configure>", self._on_resize)
+        
+        self._render()
+
+    def _heading_text(self, column):
+        text = column.replace('_', ' ').title()
+        if column == self.pager.sort_column:
+            text += " \u25bc" if self.pager.descending else " \u25b2"
+        return text
+
+    def _on_resize(self, event):
+        row_height = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        # Leave room for the heading row
+        rows = max(1, event.height // row_height - 1)
+        if rows != self.visible_rows:
+            self.visible_rows = rows
+            self._render()
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * self.pager.count()))
+        elif unit == "pages":
+            self.scroll_to(self.first + int(amount) * self.visible_rows)
+        else:
+            self.scroll_to(self.first + int(amount))
+
+    def scroll_to(self, first):
+        first = max(0, min(first, self.pager.count() - self.visible_rows))
+        if first != self.first:
+            self.first = first
+            self._render()
+        return "break"
+
+    def sort_by(self, column):
+        descending = column == self.pager.sort_column and not self.pager.descending
+        self.pager.sort(column, descending)
+        for c in self.pager.columns:
+            self.tree.heading(c, text=self._heading_text(c))
+        self.first = 0
+        self._render()
+
+    @timed("treeview", "report table")
+    def _render(self):
+        rows = self.pager.rows(self.first, self.first + self.visible_rows)
+        
+        # Reuse the existing items; only add or drop the difference
+        while len(self._items) > len(rows):
+            self.tree.delete(self._items.pop())
+        for item, row in zip(self._items, rows):
+            self.tree.item(item, values=row)
+        for row in rows[len(self._items):]:
+            self._items.append(self.tree.insert("", tk.END, values=row))
+        
+        total = self.pager.count()
+        if total:
+            self.scrollbar.set(self.first / total, (self.first + len(rows)) / total)
+        else:
+            self.scrollbar.set(0, 1)
+
+class EmployeeSearch(tk.Frame):
+    # Type-ahead employee picker backed by the full-text index. Each keystroke
+    # restarts a short timer and only the last one queries, so typing a name
+    # runs one indexed search instead of loading every employee up front.
+    def __init__(self, parent, db, limit=10, delay_ms=SEARCH_DEBOUNCE_MS):
+        super().__init__(parent, bg=CustomStyle.BACKGROUND_COLOR)
+        self.db = db
+        self.limit = limit
+        self.delay_ms = delay_ms
+        self.selected_id = None
+        self._results = []
+        self._pending = None
+        
+        self.entry = tk.Entry(self, font=('Arial', 10), bg="white", relief=tk.FLAT, width=30)
+        self.entry.pack(ipady=5)
+        tk.Frame(self, height=2, bg=CustomStyle.PRIMARY_COLOR).pack(fill=tk.X)
+        self.listbox = tk.Listbox(self, height=6, width=40, activestyle="none",
+                                  exportselection=False)
+        self.listbox.pack(pady=(2, 0))
+        
+        self.entry.bind("<KeyRelease>", self._on_key)
+        self.entry.bind("<Down>", self._focus_results)
+        self.listbox.bind("<<ListboxSelect>>", self._on_select)
+
+    def _on_key(self, event):
+        if event.keysym in ("Down", "Up", "Return", "Tab"):
+            return
+        self.selected_id = None
+        if self._pending:
+            self.after_cancel(self._pending)
+        self._pending = self.after(self.delay_ms, self._search)
+
+    def _search(self):
+        self._pending = None
+        self._results = search_employees(self.db, self.entry.get(), self.limit)
+        self.listbox.delete(0, tk.END)
+        for _, name, position in self._results:
+            self.listbox.insert(tk.END, f"{name} ({position})")
+
+    def _focus_results(self, event):
+        if self._results:
+            self.listbox.focus_set()
+            self.listbox.selection_set(0)
+            self.listbox.event_generate("<<ListboxSelect>>")
+
+    def _on_select(self, event):
+        selection = self.listbox.curselection()
+        if selection:
+            employee_id, name, _ = self._results[selection[0]]
+            self.selected_id = employee_id
+            self.entry.delete(0, tk.END)
+            self.entry.insert(0, name)
+
+    def reset(self):
+        if self._pending:
+            self.after_cancel(self._pending)
+            self._pending = None
+        self.selected_id = None
+        self._results = []
+        self.entry.delete(0, tk.END)
+        self.listbox.delete(0, tk.END)
+
+class ViewManager:
+    # Builds each screen once, into its own frame, and swaps frames on
+    # navigation instead of destroying and rebuilding every widget. A build
+    # function lays out the screen and returns its refresh(stale) callback
+    # (or None), which runs on every visit. stale is True on the first visit,
+    # when key changed (e.g. another user logged in) or when any of the
+    # data_versions scopes the screen reads was written since its last
+    # refresh, so screens only re-query when their tables changed.
+    def __init__(self, root, db):
+        self.root = root
+        self.db = db
+        self.current = None
+        self.built = 0
+        self.reused = 0
+        self._views = {}
+
+    def show(self, name, build, scopes=(), key=None):
+        view = self._views.get(name)
+        if view is None:
+            frame = tk.Frame(self.root)
+            with timed("screen build", name):
+                view = self._views[name] = {"frame": frame, "refresh": build(frame),
+                                            "token": None}
+            self.built += 1
+        else:
+            self.reused += 1
+        
+        if self.current is not view:
+            if self.current is not None:
+                self.current["frame"].pack_forget()
+            view["frame"].pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
+            self.current = view
+        
+        token = (key, self._versions(scopes))
+        stale = view["token"] != token
+        view["token"] = token
+        if view["refresh"]:
+            view["refresh"](stale)
+        return view["frame"]
+
+    def _versions(self, scopes):
+        if not scopes:
+            return ()
+        with self.db.connection() as conn:
+            return scope_versions(conn, scopes)
+
+def reset_entries(entries, placeholders=None):
+    # Puts form fields back to how the screen was first built
+    for field, entry in entries.items():
+        entry.delete(0, tk.END)
+        if placeholders:
+            entry.insert(0, placeholders[field])
+
+def fill_tree(tree, rows):
+    # Rewrites the existing items' values and only adds or drops the
+    # difference, like VirtualTable
+    items = tree.get_children()
+    if len(items) > len(rows):
+        tree.delete(*items[len(rows):])
+    for item, row in zip(items, rows):
+        tree.item(item, values=row)
+    for row in rows[len(items):]:
+        tree.insert("", tk.END, values=row)
+
 class EmployeeFinanceSystem:
-    def __init__(self):
+    def __init__(self, db_path=DEFAULT_DB_PATH):
         self.root = tk.Tk()
         self.root.title("Employee Financial Management System")
         self.root.geometry("1000x700")
@@ -51,48 +292,23 @@ class EmployeeFinanceSystem:
         )
         
         # Initialize database
+        self.db = Database(db_path)
         self.init_database()
+        # Record and employee saves share group commits with any other writer
+        self.writer = GroupCommitWriter(self.db)
+        # Set EMPLOYEE_FINANCE_REPORT_CACHE to a file path to keep report
+        # results across restarts
+        self.report_cache = ReportCache(disk_path=os.environ.get("EMPLOYEE_FINANCE_REPORT_CACHE"))
+        self.report_runner = ReportRunner(self.db, cache=self.report_cache)
+        # (data version token, PayrollHistory) behind the what-if screen
+        self.simulation_history = None
         
-        # Start with login frame
-        self.current_frame = None
+        # Screens are built on first visit and kept, hidden, for the next
+        self.views = ViewManager(self.root, self.db)
         self.show_login()
 
     def init_database(self):
-        conn = sqlite3.connect('employee_finance.db')
-        c = conn.cursor()
-        
-        # Create users table
-        c.execute('''CREATE TABLE IF NOT EXISTS users
-                    (id INTEGER PRIMARY KEY,
-                     username TEXT UNIQUE NOT NULL,
-                     password TEXT NOT NULL,
-                     role TEXT NOT NULL)''')
-        
-        # Create employees table
-        c.execute('''CREATE TABLE IF NOT EXISTS employees
-                    (id INTEGER PRIMARY KEY,
-                     name TEXT UNIQUE NOT NULL,
-                     position TEXT NOT NULL,
-                     base_salary REAL NOT NULL,
-                     join_date DATE NOT NULL)''')
-        
-        # Create financial_records table
-        c.execute('''CREATE TABLE IF NOT EXISTS financial_records
-                    (id INTEGER PRIMARY KEY,
-                     employee_id INTEGER,
-                     month TEXT NOT NULL,
-                     year INTEGER NOT NULL,
-                     base_salary REAL NOT NULL,
-                     overtime_hours REAL DEFAULT 0,
-                     overtime_pay REAL DEFAULT 0,
-                     incentives REAL DEFAULT 0,
-                     advances REAL DEFAULT 0,
-                     loans REAL DEFAULT 0,
-                     net_salary REAL NOT NULL,
-                     FOREIGN KEY (employee_id) REFERENCES employees (id))''')
-        
-        conn.commit()
-        conn.close()
+        init_database(self.db)
 
     def create_custom_entry(self, parent, placeholder=""):
         entry_frame = tk.Frame(parent, bg=CustomStyle.BACKGROUND_COLOR)
@@ -123,11 +339,13 @@ class EmployeeFinanceSystem:
         
         return entry
 
+    @timed("screen")
     def show_manage_finances(self):
-        self.clear_frame()
-        
+        self.views.show("manage_finances", self._build_manage_finances, scopes=("employees",))
+
+    def _build_manage_finances(self, frame):
         # Create main container
-        container = tk.Frame(self.current_frame, bg=CustomStyle.BACKGROUND_COLOR)
+        container = tk.Frame(frame, bg=CustomStyle.BACKGROUND_COLOR)
         container.pack(expand=True, fill=tk.BOTH, padx=50, pady=20)
         
         tk.Label(
@@ -138,80 +356,69 @@ class EmployeeFinanceSystem:
             fg=CustomStyle.TEXT_COLOR
         ).pack(pady=20)
         
-        # Create employee selection dropdown
-        try:
-            conn = sqlite3.connect('employee_finance.db')
-            c = conn.cursor()
-            c.execute("SELECT id, name FROM employees")
-            employees = c.fetchall()
-            conn.close()
-            
-            if not employees:
+        # Employee selection
+        tk.Label(
+            container,
+            text="Select Employee:",
+            font=('Arial', 12),
+            bg=CustomStyle.BACKGROUND_COLOR,
+            fg=CustomStyle.TEXT_COLOR
+        ).pack(pady=5)
+        
+        employee_search = EmployeeSearch(container, self.db)
+        employee_search.pack(pady=5)
+        
+        # Month, year and financial entries, with their placeholders
+        fields = {'Month': 'Month (MM)', 'Year': 'Year (YYYY)', 'Overtime Hours': 'Overtime Hours',
+                  'Incentives': 'Incentives', 'Advances': 'Advances', 'Loans': 'Loans'}
+        entries = {}
+        
+        for field, placeholder in fields.items():
+            entries[field] = self.create_custom_entry(container, placeholder)
+        
+        # Buttons
+        button_frame = tk.Frame(container, bg=CustomStyle.BACKGROUND_COLOR)
+        button_frame.pack(pady=20)
+        
+        save_button = tk.Button(
+            button_frame,
+            text="Save Record",
+            command=lambda: self.save_financial_record(
+                employee_search.selected_id,
+                entries['Month'].get(),
+                entries['Year'].get(),
+                entries
+            )
+        )
+        CustomStyle.apply_button_style(save_button)
+        save_button.pack(side=tk.LEFT, padx=10)
+        
+        back_button = tk.Button(
+            button_frame,
+            text="Back",
+            command=self.show_admin_dashboard
+        )
+        CustomStyle.apply_button_style(back_button)
+        back_button.pack(side=tk.LEFT, padx=10)
+        
+        state = {"has_employees": None}
+        
+        def refresh(stale):
+            # The employee check only runs again after employees changed
+            try:
+                if stale or state["has_employees"] is None:
+                    state["has_employees"] = has_employees(self.db)
+            except Exception as e:
+                messagebox.showerror("Error", f"Failed to load employees: {str(e)}")
+                self.show_admin_dashboard()
+                return
+            if not state["has_employees"]:
                 messagebox.showerror("Error", "No employees found. Please add employees first.")
                 self.show_admin_dashboard()
                 return
-            
-            # Employee selection
-            tk.Label(
-                container,
-                text="Select Employee:",
-                font=('Arial', 12),
-                bg=CustomStyle.BACKGROUND_COLOR,
-                fg=CustomStyle.TEXT_COLOR
-            ).pack(pady=5)
-            
-            employee_var = tk.StringVar()
-            employee_dict = {emp[1]: emp[0] for emp in employees}
-            
-            employee_dropdown = ttk.Combobox(
-                container,
-                textvariable=employee_var,
-                values=list(employee_dict.keys()),
-                state="readonly",
-                width=28,
-                style="Custom.TCombobox"
-            )
-            employee_dropdown.pack(pady=5)
-            
-            # Month and Year entries
-            month_entry = self.create_custom_entry(container, "Month (MM)")
-            year_entry = self.create_custom_entry(container, "Year (YYYY)")
-            
-            # Financial entries
-            fields = {'Overtime Hours': '', 'Incentives': '', 'Advances': '', 'Loans': ''}
-            entries = {}
-            
-            for field, value in fields.items():
-                entries[field] = self.create_custom_entry(container, field)
-            
-            # Buttons
-            button_frame = tk.Frame(container, bg=CustomStyle.BACKGROUND_COLOR)
-            button_frame.pack(pady=20)
-            
-            save_button = tk.Button(
-                button_frame,
-                text="Save Record",
-                command=lambda: self.save_financial_record(
-                    employee_dict.get(employee_var.get()),
-                    month_entry.get(),
-                    year_entry.get(),
-                    entries
-                )
-            )
-            CustomStyle.apply_button_style(save_button)
-            save_button.pack(side=tk.LEFT, padx=10)
-            
-            back_button = tk.Button(
-                button_frame,
-                text="Back",
-                command=self.show_admin_dashboard
-            )
-            CustomStyle.apply_button_style(back_button)
-            back_button.pack(side=tk.LEFT, padx=10)
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load employees: {str(e)}")
-            self.show_admin_dashboard()
+            employee_search.reset()
+            reset_entries(entries, fields)
+        return refresh
 
     def save_financial_record(self, employee_id, month, year, entries):
         # Input validation
@@ -220,346 +427,883 @@ class EmployeeFinanceSystem:
             return
         
         try:
-            # Get base salary
-            conn = sqlite3.connect('employee_finance.db')
-            c = conn.cursor()
-            c.execute("SELECT base_salary FROM employees WHERE id=?", (employee_id,))
-            result = c.fetchone()
-            
-            if not result:
-                messagebox.showerror("Error", "Employee not found in database")
-                return
-                
-            base_salary = result[0]
-            
-            # Calculate overtime pay (assuming 1.5x hourly rate)
-            hourly_rate = base_salary / 160  # assuming 160 working hours per month
-            overtime_hours = float(entries['Overtime Hours'].get() or 0)
-            overtime_pay = overtime_hours * hourly_rate * 1.5
-            
-            # Calculate net salary
-            net_salary = (base_salary +
-                         overtime_pay +
-                         float(entries['Incentives'].get() or 0) -
-                         float(entries['Advances'].get() or 0) -
-                         float(entries['Loans'].get() or 0))
-            
-            # Save record
-            c.execute("""INSERT INTO financial_records 
-                        (employee_id, month, year, base_salary, overtime_hours,
-                         overtime_pay, incentives, advances, loans, net_salary)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                     (employee_id, month, year, base_salary, overtime_hours,
-                      overtime_pay, float(entries['Incentives'].get() or 0),
-                      float(entries['Advances'].get() or 0),
-                      float(entries['Loans'].get() or 0), net_salary))
-            
-            conn.commit()
-            conn.close()
-            messagebox.showinfo("Success", "Financial record saved successfully!")
-            self.show_admin_dashboard()
+            amounts = [float(entries[field].get() or 0)
+                       for field in ('Overtime Hours', 'Incentives', 'Advances', 'Loans')]
         except ValueError:
             messagebox.showerror("Error", "Please enter valid numbers for all financial fields")
+            return
+        
+        try:
+            self.writer.submit(write_financial_record, employee_id, month, year, *amounts).result()
+            messagebox.showinfo("Success", "Financial record saved successfully!")
+            self.show_admin_dashboard()
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
         except Exception as e:
             messagebox.showerror("Error", f"An error occurred: {str(e)}")
 
     
+    @timed("screen")
     def show_add_employee(self):
-        self.clear_frame()
-        
-        tk.Label(self.current_frame, text="Add New Employee", font=('Arial', 14, 'bold')).pack(pady=20)
+        self.views.show("add_employee", self._build_add_employee)
+
+    def _build_add_employee(self, frame):
+        tk.Label(frame, text="Add New Employee", font=('Arial', 14, 'bold')).pack(pady=20)
         
         fields = {'Name': '', 'Position': '', 'Base Salary': '', 'Join Date': ''}
         entries = {}
         
         for field, value in fields.items():
-            tk.Label(self.current_frame, text=field).pack(pady=5)
-            entry = tk.Entry(self.current_frame)
+            tk.Label(frame, text=field).pack(pady=5)
+            entry = tk.Entry(frame)
             entry.insert(0, value)
             entry.pack(pady=5)
             entries[field] = entry
         
-        tk.Button(self.current_frame, text="Add Employee", 
+        tk.Button(frame, text="Add Employee", 
                  command=lambda: self.add_employee(entries)).pack(pady=10)
-        tk.Button(self.current_frame, text="Back", 
+        tk.Button(frame, text="Back", 
                  command=self.show_admin_dashboard).pack(pady=5)
+        return lambda stale: reset_entries(entries, fields)
 
     def add_employee(self, entries):
         try:
-            conn = sqlite3.connect('employee_finance.db')
-            c = conn.cursor()
-            c.execute("""INSERT INTO employees (name, position, base_salary, join_date)
-                        VALUES (?, ?, ?, ?)""",
-                     (entries['Name'].get(),
-                      entries['Position'].get(),
-                      float(entries['Base Salary'].get()),
-                      entries['Join Date'].get()))
-            conn.commit()
-            conn.close()
+            self.writer.submit(write_employee,
+                               entries['Name'].get(),
+                               entries['Position'].get(),
+                               entries['Base Salary'].get(),
+                               entries['Join Date'].get()).result()
             messagebox.showinfo("Success", "Employee added successfully!")
             self.show_admin_dashboard()
         except Exception as e:
             messagebox.showerror("Error", f"An error occurred: {str(e)}")
 
 
+    @timed("screen")
     def show_login(self):
-        self.clear_frame()
-        
-        tk.Label(self.current_frame, text="Employee Financial Management System", font=('Arial', 16, 'bold')).pack(pady=20)
+        self.views.show("login", self._build_login)
+
+    def _build_login(self, frame):
+        tk.Label(frame, text="Employee Financial Management System", font=('Arial', 16, 'bold')).pack(pady=20)
         
-        tk.Label(self.current_frame, text="Username:").pack(pady=5)
-        username_entry = tk.Entry(self.current_frame)
+        tk.Label(frame, text="Username:").pack(pady=5)
+        username_entry = tk.Entry(frame)
         username_entry.pack(pady=5)
         
-        tk.Label(self.current_frame, text="Password:").pack(pady=5)
-        password_entry = tk.Entry(self.current_frame, show="*")
+        tk.Label(frame, text="Password:").pack(pady=5)
+        password_entry = tk.Entry(frame, show="*")
         password_entry.pack(pady=5)
         
-        tk.Button(self.current_frame, text="Login", command=lambda: self.login(username_entry.get(), password_entry.get())).pack(pady=10)
-        tk.Button(self.current_frame, text="Register", command=self.show_register).pack(pady=5)
-    def clear_frame(self):
-        if self.current_frame:
-            self.current_frame.destroy()
-        self.current_frame = tk.Frame(self.root)
-        self.current_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
+        tk.Button(frame, text="Login", command=lambda: self.login(username_entry.get(), password_entry.get())).pack(pady=10)
+        tk.Button(frame, text="Register", command=self.show_register).pack(pady=5)
+        return lambda stale: reset_entries({'Username': username_entry, 'Password': password_entry})
+
+    @timed("screen")
     def show_register(self):
-        self.clear_frame()
-        
-        tk.Label(self.current_frame, text="Register New User", font=('Arial', 14, 'bold')).pack(pady=20)
+        self.views.show("register", self._build_register)
+
+    def _build_register(self, frame):
+        tk.Label(frame, text="Register New User", font=('Arial', 14, 'bold')).pack(pady=20)
         
-        tk.Label(self.current_frame, text="Username:").pack(pady=5)
-        username_entry = tk.Entry(self.current_frame)
+        tk.Label(frame, text="Username:").pack(pady=5)
+        username_entry = tk.Entry(frame)
         username_entry.pack(pady=5)
         
-        tk.Label(self.current_frame, text="Password:").pack(pady=5)
-        password_entry = tk.Entry(self.current_frame, show="*")
+        tk.Label(frame, text="Password:").pack(pady=5)
+        password_entry = tk.Entry(frame, show="*")
         password_entry.pack(pady=5)
         
         role_var = tk.StringVar(value="employee")
-        tk.Radiobutton(self.current_frame, text="Employee", variable=role_var, value="employee").pack()
-        tk.Radiobutton(self.current_frame, text="HR Admin", variable=role_var, value="admin").pack()
+        tk.Radiobutton(frame, text="Employee", variable=role_var, value="employee").pack()
+        tk.Radiobutton(frame, text="HR Admin", variable=role_var, value="admin").pack()
         
-        tk.Button(self.current_frame, text="Register", 
+        tk.Button(frame, text="Register", 
                  command=lambda: self.register_user(username_entry.get(), 
                                                   password_entry.get(), 
                                                   role_var.get())).pack(pady=10)
-        tk.Button(self.current_frame, text="Back to Login", command=self.show_login).pack(pady=5)
+        tk.Button(frame, text="Back to Login", command=self.show_login).pack(pady=5)
+        
+        def refresh(stale):
+            reset_entries({'Username': username_entry, 'Password': password_entry})
+            role_var.set("employee")
+        return refresh
     def register_user(self, username, password, role):
-        if not username or not password:
-            messagebox.showerror("Error", "Please fill in all fields")
-            return
-            
         try:
-            conn = sqlite3.connect('employee_finance.db')
-            c = conn.cursor()
-            c.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
-                     (username, password, role))
-            conn.commit()
-            conn.close()
+            register_user(self.db, username, password, role)
             messagebox.showinfo("Success", "Registration successful!")
             self.show_login()
-        except sqlite3.IntegrityError:
-            messagebox.showerror("Error", "Username already exists")
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
         except Exception as e:
             messagebox.showerror("Error", f"An error occurred: {str(e)}")
 
+    @timed("screen")
     def show_admin_dashboard(self):
-        self.clear_frame()
-        
-        tk.Label(self.current_frame, text="Admin Dashboard", font=('Arial', 16, 'bold')).pack(pady=20)
+        self.views.show("admin_dashboard", self._build_admin_dashboard)
+
+    def _build_admin_dashboard(self, frame):
+        tk.Label(frame, text="Admin Dashboard", font=('Arial', 16, 'bold')).pack(pady=20)
         
         # Create buttons for different admin functions
-        tk.Button(self.current_frame, text="Add New Employee", 
+        tk.Button(frame, text="Add New Employee", 
                  command=self.show_add_employee).pack(pady=5)
-        tk.Button(self.current_frame, text="Manage Financial Records", 
+        tk.Button(frame, text="Manage Financial Records", 
                  command=self.show_manage_finances).pack(pady=5)
-        tk.Button(self.current_frame, text="Generate Reports", 
+        tk.Button(frame, text="Import Data", 
+                 command=self.show_import).pack(pady=5)
+        tk.Button(frame, text="Run Monthly Payroll", 
+                 command=self.show_payroll_run).pack(pady=5)
+        tk.Button(frame, text="Loans and Advances", 
+                 command=self.show_loans).pack(pady=5)
+        tk.Button(frame, text="Payslips", 
+                 command=self.show_payslips).pack(pady=5)
+        tk.Button(frame, text="Generate Reports", 
                  command=self.show_reports).pack(pady=5)
-        tk.Button(self.current_frame, text="Logout", 
-                 command=self.show_login).pack(pady=20)        
+        tk.Button(frame, text="What-if Pay Simulation", 
+                 command=self.show_simulation).pack(pady=5)
+        tk.Button(frame, text="Diagnostics", 
+                 command=self.show_diagnostics).pack(pady=5)
+        tk.Button(frame, text="Logout", 
+                 command=self.show_login).pack(pady=20)
+
     def login(self, username, password):
         if not username or not password:
             messagebox.showerror("Error", "Please fill in all fields")
             return
             
-        conn = sqlite3.connect('employee_finance.db')
-        c = conn.cursor()
-        c.execute("SELECT role FROM users WHERE username=? AND password=?", (username, password))
-        result = c.fetchone()
-        conn.close()
-        
-        if result:
-            self.current_user = {'username': username, 'role': result[0]}
-            if result[0] == 'admin':
+        role = authenticate(self.db, username, password)
+        
+        if role:
+            self.current_user = {'username': username, 'role': role}
+            if role == 'admin':
                 self.show_admin_dashboard()
             else:
                 self.show_employee_dashboard(username)
         else:
             messagebox.showerror("Error", "Invalid username or password")
     
-    def show_reports(self):
-        self.clear_frame()
+    @timed("screen")
+    def show_import(self):
+        self.views.show("import", self._build_import)
+
+    def _build_import(self, frame):
+        tk.Label(frame, text="Import Data", 
+                font=('Arial', 14, 'bold')).pack(pady=20)
+        
+        kind_var = tk.StringVar(value="employees")
+        tk.Radiobutton(frame, text="Employees", 
+                      variable=kind_var, value="employees").pack()
+        tk.Radiobutton(frame, text="Financial Records", 
+                      variable=kind_var, value="financial_records").pack()
+        
+        tk.Button(frame, text="Choose File and Import",
+                 command=lambda: self.import_data(kind_var.get())).pack(pady=10)
+        tk.Button(frame, text="Back",
+                 command=self.show_admin_dashboard).pack(pady=5)
+        return lambda stale: kind_var.set("employees")
+
+    def import_data(self, kind):
+        path = filedialog.askopenfilename(
+            filetypes=[("CSV or Excel", "*.csv *.xlsx"), ("All files", "*.*")])
+        if not path:
+            return
+        
+        try:
+            result = IMPORTERS[kind](self.db, path)
+        except Exception as e:
+            messagebox.showerror("Error", f"Import failed: {str(e)}")
+            return
+        
+        message = (f"Imported {result.imported} rows in {result.seconds:.2f}s "
+                   f"({result.rows_per_second:,.0f} rows/s).")
+        if result.rejected:
+            message += f"\n{result.rejected} rows rejected, see {result.reject_path}"
+        messagebox.showinfo("Import Complete", message)
+
+    @timed("screen")
+    def show_payroll_run(self):
+        self.views.show("payroll_run", self._build_payroll_run)
+
+    def _build_payroll_run(self, frame):
+        tk.Label(frame, text="Run Monthly Payroll", 
+                font=('Arial', 14, 'bold')).pack(pady=20)
+        
+        tk.Label(frame, text="Month (MM):").pack(pady=5)
+        month_entry = tk.Entry(frame)
+        month_entry.pack(pady=5)
+        
+        tk.Label(frame, text="Year (YYYY):").pack(pady=5)
+        year_entry = tk.Entry(frame)
+        year_entry.pack(pady=5)
+        
+        # Optional CSV with employee_id (or name), overtime_hours, incentives,
+        # advances and loans columns
+        adjustments_var = tk.StringVar()
+        tk.Label(frame, text="Adjustments file (optional):").pack(pady=5)
+        tk.Label(frame, textvariable=adjustments_var).pack()
+        tk.Button(frame, text="Choose CSV...",
+                 command=lambda: adjustments_var.set(filedialog.askopenfilename(
+                     filetypes=[("CSV files", "*.csv"), ("All files", "*.*")]))).pack(pady=5)
+        
+        # Without this employees already saved for the month are left as they are
+        overwrite_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(frame, text="Overwrite records already saved for this month",
+                      variable=overwrite_var).pack(pady=5)
+        
+        tk.Button(frame, text="Run Payroll",
+                 command=lambda: self.run_payroll(
+                     month_entry.get(),
+                     year_entry.get(),
+                     adjustments_var.get(),
+                     overwrite_var.get())).pack(pady=10)
+        tk.Button(frame, text="Back",
+                 command=self.show_admin_dashboard).pack(pady=5)
+        
+        def refresh(stale):
+            reset_entries({'Month': month_entry, 'Year': year_entry})
+            adjustments_var.set("")
+            overwrite_var.set(False)
+        return refresh
+
+    def run_payroll(self, month, year, adjustments_file, overwrite):
+        try:
+            adjustments = load_adjustments(adjustments_file) if adjustments_file else None
+            result = run_payroll(self.db, month, year, adjustments, overwrite=overwrite)
+            skipped = (f"\n{result.skipped} employees already saved for the month were left as they are."
+                       if result.skipped else "")
+            messagebox.showinfo(
+                "Success",
+                f"Payroll for {result.month:02d}/{result.year} saved for {result.rows} employees "
+                f"in {result.seconds:.2f}s ({result.rows_per_second:,.0f} records/s){skipped}")
+            self.show_admin_dashboard()
+        except Exception as e:
+            messagebox.showerror("Error", f"Payroll run failed: {str(e)}")
+
+    @timed("screen")
+    def show_payslips(self):
+        self.views.show("payslips", self._build_payslips)
+
+    def _build_payslips(self, frame):
+        tk.Label(frame, text="Payslips", 
+                font=('Arial', 14, 'bold')).pack(pady=20)
+        
+        tk.Label(frame, text="Month (MM):").pack(pady=5)
+        month_entry = tk.Entry(frame)
+        month_entry.pack(pady=5)
+        
+        tk.Label(frame, text="Year (YYYY):").pack(pady=5)
+        year_entry = tk.Entry(frame)
+        year_entry.pack(pady=5)
+        
+        # Without this only slips whose figures changed since the last run
+        # into the same folder are rendered again
+        force_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(frame, text="Re-render every payslip",
+                      variable=force_var).pack(pady=5)
+        
+        tk.Button(frame, text="Choose Folder and Generate",
+                 command=lambda: self.generate_payslips(
+                     month_entry.get(), year_entry.get(), force_var.get())).pack(pady=10)
+        tk.Button(frame, text="Back",
+                 command=self.show_admin_dashboard).pack(pady=5)
         
-        tk.Label(self.current_frame, text="Generate Reports", 
+        def refresh(stale):
+            reset_entries({'Month': month_entry, 'Year': year_entry})
+            force_var.set(False)
+        return refresh
+
+    def generate_payslips(self, month, year, force):
+        directory = filedialog.askdirectory(title="Folder for the payslips")
+        if not directory:
+            return
+        
+        try:
+            job = self.report_runner.run_job(PayslipJob(month, year, directory, force))
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to generate payslips: {str(e)}")
+            return
+        
+        # Rendering happens in worker processes; this only watches
+        payslip_window = tk.Toplevel(self.root)
+        payslip_window.title("Generating Payslips")
+        status_label = tk.Label(payslip_window, text="Starting...", width=40)
+        status_label.pack(padx=20, pady=10)
+        progress = ttk.Progressbar(payslip_window, mode="indeterminate", length=300)
+        progress.pack(padx=20, pady=5)
+        progress.start(10)
+        tk.Button(payslip_window, text="Cancel", command=job.cancel).pack(pady=10)
+        payslip_window.protocol("WM_DELETE_WINDOW", job.cancel)
+        
+        def poll():
+            if not job.done():
+                status_label.configure(text=f"{job.rendered:,} rendered, "
+                                            f"{job.unchanged:,} unchanged...")
+                payslip_window.after(REPORT_POLL_MS, poll)
+                return
+            
+            payslip_window.destroy()
+            try:
+                result = job.result()
+            except (ReportCancelled, CancelledError):
+                return
+            except Exception as e:
+                messagebox.showerror("Error", f"Failed to generate payslips: {str(e)}")
+                return
+            messagebox.showinfo("Success", f"{result.rendered:,} payslips rendered, "
+                                           f"{result.unchanged:,} unchanged, in {result.directory}")
+        
+        payslip_window.after(REPORT_POLL_MS, poll)
+
+    @timed("screen")
+    def show_diagnostics(self):
+        self.views.show("diagnostics", self._build_diagnostics)
+
+    def _build_diagnostics(self, frame):
+        tk.Label(frame, text="Diagnostics", 
+                font=('Arial', 14, 'bold')).pack(pady=10)
+        
+        # Switching on only affects connections opened from now on, so the
+        # idle pooled ones are replaced
+        enabled_var = tk.BooleanVar(value=metrics.enabled)
+        def toggle():
+            metrics.enabled = enabled_var.get()
+            self.db.recycle()
+        tk.Checkbutton(frame, text="Collect timings",
+                      variable=enabled_var, command=toggle).pack()
+        tk.Label(frame,
+                text=f"Queries slower than {metrics.slow_query_ms:g} ms are logged with "
+                     f"their query plan", fg="gray").pack()
+        screens_label = tk.Label(frame, fg="gray")
+        screens_label.pack()
+        
+        tk.Label(frame, text="Slowest operations",
+                font=('Arial', 12, 'bold')).pack(pady=(10, 0))
+        columns = ["Kind", "Name", "Count", "Mean ms", "p95 ms", "Max ms", "Total ms"]
+        operations = ttk.Treeview(frame, columns=columns, show="headings", height=10)
+        for column in columns:
+            operations.heading(column, text=column)
+            operations.column(column, width=320 if column == "Name" else 70,
+                              anchor="w" if column in ("Kind", "Name") else "e")
+        operations.pack(fill=tk.BOTH, expand=True, padx=20)
+        
+        tk.Label(frame, text="Slow queries",
+                font=('Arial', 12, 'bold')).pack(pady=(10, 0))
+        queries = ttk.Treeview(frame, columns=["ms", "At", "SQL"],
+                               show="headings", height=6)
+        queries.heading("ms", text="ms")
+        queries.heading("At", text="At")
+        queries.heading("SQL", text="SQL")
+        queries.column("ms", width=70, anchor="e")
+        queries.column("At", width=140)
+        queries.column("SQL", width=500)
+        queries.pack(fill=tk.BOTH, expand=True, padx=20)
+        
+        plan = tk.Text(frame, height=6, width=100)
+        plan.pack(padx=20, pady=5)
+        slow = []
+        def show_plan(event):
+            selection = queries.selection()
+            if selection:
+                entry = slow[queries.index(selection[0])]
+                plan.delete("1.0", tk.END)
+                plan.insert(tk.END, entry["sql"] + "\n\n" +
+                            "\n".join(entry["plan"] or ["(no query plan)"]))
+        queries.bind("<<TreeviewSelect>>", show_plan)
+        
+        # Timings live in memory, not in the database, so every visit and
+        # every Refresh re-reads them
+        def refresh(stale=True):
+            enabled_var.set(metrics.enabled)
+            screens_label.configure(text=f"Screens: {self.views.built} built, "
+                                         f"{self.views.reused} visits reused a built screen")
+            fill_tree(operations, [
+                (kind, name, stats["count"], f"{stats['mean_ms']:.2f}",
+                 f"{stats['p95_ms']:.2f}", f"{stats['max_ms']:.2f}", f"{stats['total_ms']:.1f}")
+                for kind, name, stats in metrics.slowest(100)])
+            slow[:] = metrics.slow_queries()
+            fill_tree(queries, [(f"{entry['ms']:.1f}", entry["at"], entry["sql"])
+                                for entry in slow])
+            plan.delete("1.0", tk.END)
+        
+        buttons = tk.Frame(frame)
+        buttons.pack(pady=10)
+        tk.Button(buttons, text="Refresh", command=refresh).pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Reset",
+                 command=lambda: (metrics.reset(), refresh())).pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Export...",
+                 command=self.export_metrics).pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Back",
+                 command=self.show_admin_dashboard).pack(side=tk.LEFT, padx=5)
+        return refresh
+
+    def export_metrics(self):
+        filename = filedialog.asksaveasfilename(
+            initialfile=f"metrics_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+            defaultextension=".json",
+            filetypes=[("JSON", "*.json"), ("Prometheus text", "*.prom")])
+        if not filename:
+            return
+        try:
+            metrics.write(filename)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to export timings: {str(e)}")
+            return
+        messagebox.showinfo("Success", f"Timings exported to {filename}")
+
+    @timed("screen")
+    def show_simulation(self):
+        self.views.show("simulation", self._build_simulation)
+
+    def _build_simulation(self, frame):
+        tk.Label(frame, text="What-if Pay Simulation", 
+                font=('Arial', 14, 'bold')).pack(pady=20)
+        
+        form = tk.Frame(frame)
+        form.pack()
+        tk.Label(form, text="Year (blank for all):").grid(row=0, column=0, sticky="e", pady=2)
+        year_entry = tk.Entry(form)
+        year_entry.grid(row=0, column=1, pady=2)
+        tk.Label(form, text="Raise % for everyone:").grid(row=1, column=0, sticky="e", pady=2)
+        raise_entry = tk.Entry(form)
+        raise_entry.insert(0, "0")
+        raise_entry.grid(row=1, column=1, pady=2)
+        tk.Label(form, text="Per position (e.g. Manager=10, Clerk=5):").grid(
+            row=2, column=0, sticky="e", pady=2)
+        positions_entry = tk.Entry(form, width=40)
+        positions_entry.grid(row=2, column=1, pady=2)
+        
+        projection_var = tk.BooleanVar()
+        tk.Checkbutton(frame, text="Project on current base salaries",
+                      variable=projection_var).pack(pady=5)
+        
+        # Optional JSON rule set (see finance.rules); blank keeps today's formula
+        rules_var = tk.StringVar()
+        tk.Label(frame, text="Pay rules file (optional):").pack(pady=5)
+        tk.Label(frame, textvariable=rules_var).pack()
+        tk.Button(frame, text="Choose JSON...",
+                 command=lambda: rules_var.set(filedialog.askopenfilename(
+                     filetypes=[("JSON files", "*.json"), ("All files", "*.*")]))).pack(pady=5)
+        
+        columns = ["Position", "Records", "Current", "Simulated", "Change", "Change %"]
+        tree = ttk.Treeview(frame, columns=columns, show="headings", height=10)
+        for column in columns:
+            tree.heading(column, text=column)
+            tree.column(column, width=110, anchor="e" if column != "Position" else "w")
+        summary_label = tk.Label(frame, text="")
+        
+        tk.Button(frame, text="Simulate",
+                 command=lambda: self.run_simulation(
+                     year_entry.get(), raise_entry.get(), positions_entry.get(),
+                     rules_var.get(), projection_var.get(), tree, summary_label)).pack(pady=10)
+        summary_label.pack()
+        tree.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
+        tk.Button(frame, text="Back",
+                 command=self.show_admin_dashboard).pack(pady=5)
+        
+        def refresh(stale):
+            reset_entries({'Year': year_entry, 'Raise': raise_entry, 'Positions': positions_entry},
+                          {'Year': '', 'Raise': '0', 'Positions': ''})
+            projection_var.set(False)
+            rules_var.set("")
+            fill_tree(tree, [])
+            summary_label.configure(text="")
+        return refresh
+
+    def run_simulation(self, year, raise_pct, position_raises, rules_file, projection,
+                       tree, summary_label):
+        try:
+            year = int(year) if year.strip() else None
+            everyone, positions = parse_raises(
+                [raise_pct or "0", *filter(str.strip, position_raises.split(","))])
+            rules = None
+            if rules_file:
+                with open(rules_file) as f:
+                    rules = RuleSet(json.load(f))
+            
+            # History is loaded once and re-priced in memory on every click
+            # until a save changes the underlying records
+            with self.db.connection() as conn:
+                token = (year, tuple(conn.execute("SELECT scope, version FROM data_versions")))
+            if self.simulation_history is None or self.simulation_history[0] != token:
+                self.simulation_history = (token, PayrollHistory.load(self.db, year))
+            result = simulate(self.simulation_history[1], rules, everyone, positions, projection)
+        except Exception as e:
+            messagebox.showerror("Error", f"Simulation failed: {str(e)}")
+            return
+        
+        tree.delete(*tree.get_children())
+        for p in result.by_position:
+            tree.insert("", "end", values=(
+                p["position"], f"{p['records']:,}", f"{p['current_total']:,.2f}",
+                f"{p['simulated_total']:,.2f}", f"{p['change']:+,.2f}",
+                f"{p['change_pct']:+.2f}%"))
+        summary_label.configure(
+            text=f"Total {result.current_total:,.2f} -> {result.simulated_total:,.2f} "
+                 f"({result.rows:,} records in {result.seconds:.3f}s)")
+
+    @timed("screen")
+    def show_loans(self):
+        self.views.show("loans", self._build_loans)
+
+    def _build_loans(self, frame):
+        tk.Label(frame, text="Issue Loan or Advance", 
+                font=('Arial', 14, 'bold')).pack(pady=20)
+        
+        tk.Label(frame, text="Select Employee:").pack(pady=5)
+        employee_search = EmployeeSearch(frame, self.db)
+        employee_search.pack(pady=5)
+        
+        kind_var = tk.StringVar(value="loan")
+        tk.Radiobutton(frame, text="Loan", 
+                      variable=kind_var, value="loan").pack()
+        tk.Radiobutton(frame, text="Advance", 
+                      variable=kind_var, value="advance").pack()
+        
+        # Deductions start with the given payroll month and repeat monthly
+        # until the principal is repaid
+        fields = ['Principal', 'Monthly Installment (blank: all at once for advances)',
+                  'First Month (MM)', 'First Year (YYYY)']
+        entries = {}
+        for field in fields:
+            tk.Label(frame, text=field).pack(pady=2)
+            entries[field] = tk.Entry(frame)
+            entries[field].pack(pady=2)
+        
+        balance_label = tk.Label(frame, text="")
+        balance_label.pack(pady=5)
+        
+        tk.Button(frame, text="Issue",
+                 command=lambda: self.issue_loan(employee_search.selected_id, kind_var.get(),
+                                                 [entries[f].get() for f in fields],
+                                                 balance_label)).pack(pady=10)
+        tk.Button(frame, text="Back",
+                 command=self.show_admin_dashboard).pack(pady=5)
+        
+        def refresh(stale):
+            employee_search.reset()
+            kind_var.set("loan")
+            reset_entries(entries)
+            balance_label.configure(text="")
+        return refresh
+
+    def issue_loan(self, employee_id, kind, values, balance_label):
+        if not employee_id:
+            messagebox.showerror("Error", "Please select an employee")
+            return
+        principal, installment, month, year = values
+        try:
+            self.writer.submit(write_loan, employee_id, kind, principal, month, year,
+                               installment or None).result()
+        except Exception as e:
+            messagebox.showerror("Error", f"An error occurred: {str(e)}")
+            return
+        balances = outstanding_balance(self.db, employee_id)
+        balance_label.configure(text=f"Employee now owes {balances['loan']:,.2f} in loans "
+                                     f"and {balances['advance']:,.2f} in advances")
+        messagebox.showinfo("Success", f"{kind.capitalize()} issued successfully!")
+
+    @timed("screen")
+    def show_reports(self):
+        self.views.show("reports", self._build_reports)
+
+    def _build_reports(self, frame):
+        tk.Label(frame, text="Generate Reports", 
                 font=('Arial', 14, 'bold')).pack(pady=20)
         
         # Create report type selection
-        report_types = ["Monthly Payroll", "Employee Summary", "Department Summary"]
-        report_var = tk.StringVar(value=report_types[0])
+        report_var = tk.StringVar(value=REPORT_TYPES[0])
         
-        for report_type in report_types:
-            tk.Radiobutton(self.current_frame, text=report_type,
+        for report_type in REPORT_TYPES:
+            tk.Radiobutton(frame, text=report_type,
                           variable=report_var, value=report_type).pack()
         
-        tk.Label(self.current_frame, text="Month (MM):").pack(pady=5)
-        month_entry = tk.Entry(self.current_frame)
+        tk.Label(frame, text="Month (MM):").pack(pady=5)
+        month_entry = tk.Entry(frame)
         month_entry.pack(pady=5)
         
-        tk.Label(self.current_frame, text="Year (YYYY):").pack(pady=5)
-        year_entry = tk.Entry(self.current_frame)
+        tk.Label(frame, text="Year (YYYY):").pack(pady=5)
+        year_entry = tk.Entry(frame)
         year_entry.pack(pady=5)
         
-        tk.Button(self.current_frame, text="Generate Report",
+        tk.Button(frame, text="Generate Report",
                  command=lambda: self.generate_report(
                      report_var.get(),
                      month_entry.get(),
                      year_entry.get())).pack(pady=10)
-        tk.Button(self.current_frame, text="Back",
+        tk.Button(frame, text="Annual Pack for Year...",
+                 command=lambda: self.export_annual_pack(year_entry.get())).pack(pady=5)
+        tk.Button(frame, text="Back",
                  command=self.show_admin_dashboard).pack(pady=5)
+        
+        stats_label = tk.Label(frame, fg="gray")
+        stats_label.pack(pady=10)
+        
+        def refresh(stale):
+            report_var.set(REPORT_TYPES[0])
+            reset_entries({'Month': month_entry, 'Year': year_entry})
+            stats = self.report_cache.stats()
+            stats_label.configure(
+                text=f"Report cache: {stats['hits']} hits, {stats['misses']} misses "
+                     f"({stats['hit_rate']:.0%}), {stats['invalidations']} invalidated, "
+                     f"{stats['rows']:,} rows cached")
+        return refresh
 
     def generate_report(self, report_type, month, year):
         try:
-            conn = sqlite3.connect('employee_finance.db')
-            
-            if report_type == "Monthly Payroll":
-                query = """
-                    SELECT e.name, e.position, f.base_salary, f.overtime_pay,
-                           f.incentives, f.advances, f.loans, f.net_salary
-                    FROM employees e
-                    JOIN financial_records f ON e.id = f.employee_id
-                    WHERE f.month = ? AND f.year = ?
-                """
-            elif report_type == "Employee Summary":
-                query = """
-                    SELECT e.name, e.position,
-                           AVG(f.net_salary) as avg_salary,
-                           SUM(f.overtime_pay) as total_overtime,
-                           SUM(f.incentives) as total_incentives
-                    FROM employees e
-                    JOIN financial_records f ON e.id = f.employee_id
-                    WHERE f.year = ?
-                    GROUP BY e.id
-                """
-            else:  # Department Summary
-                query = """
-                    SELECT e.position as department,
-                           COUNT(DISTINCT e.id) as employee_count,
-                           AVG(f.net_salary) as avg_salary,
-                           SUM(f.net_salary) as total_salary
-                    FROM employees e
-                    JOIN financial_records f ON e.id = f.employee_id
-                    WHERE f.month = ? AND f.year = ?
-                    GROUP BY e.position
-                """
-            
-            params = (month, year) if report_type != "Employee Summary" else (year,)
-            df = pd.read_sql_query(query, conn, params=params)
-            conn.close()
-
-            # Create a new window for the report
-            report_window = tk.Toplevel(self.root)
-            report_window.title(f"{report_type} Report")
-            report_window.geometry("800x600")
-            
-            # Create a treeview to display the report
-            tree = ttk.Treeview(report_window)
-            tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-            
-            # Configure columns based on DataFrame
-            tree["columns"] = list(df.columns)
-            tree["show"] = "headings"
-            
-            for column in df.columns:
-                tree.heading(column, text=column.replace('_', ' ').title())
-                tree.column(column, width=100)
-            
-            # Add data to treeview
-            for _, row in df.iterrows():
-                tree.insert("", tk.END, values=list(row))
-            
-            # Add export button
-            tk.Button(report_window, text="Export to Excel",
-                     command=lambda: self.export_to_excel(df, report_type)).pack(pady=10)
-            
+            job = self.report_runner.submit(report_type, month, year)
         except Exception as e:
             messagebox.showerror("Error", f"An error occurred: {str(e)}")
+            return
+        
+        # Create a new window for the report; the query runs on a worker
+        # thread so several reports can be open and loading at once
+        report_window = tk.Toplevel(self.root)
+        report_window.title(f"{report_type} Report")
+        report_window.geometry("800x600")
+        
+        status_frame = tk.Frame(report_window)
+        status_frame.pack(expand=True)
+        status_label = tk.Label(status_frame, text="Running report...")
+        status_label.pack(pady=10)
+        progress = ttk.Progressbar(status_frame, mode="indeterminate", length=300)
+        progress.pack(pady=5)
+        progress.start(10)
+        tk.Button(status_frame, text="Cancel",
+                 command=lambda: (job.cancel(), report_window.destroy())).pack(pady=10)
+        
+        # Closing the window also stops the query
+        report_window.protocol("WM_DELETE_WINDOW",
+                               lambda: (job.cancel(), report_window.destroy()))
+        
+        def poll():
+            if not report_window.winfo_exists():
+                return
+            if not job.done():
+                report_window.after(REPORT_POLL_MS, poll)
+                return
+            
+            progress.stop()
+            status_frame.destroy()
+            try:
+                pager = job.result()
+            except (ReportCancelled, CancelledError):
+                report_window.destroy()
+                return
+            except Exception as e:
+                report_window.destroy()
+                messagebox.showerror("Error", f"An error occurred: {str(e)}")
+                return
+            self.show_report_result(report_window, pager, report_type, month, year)
+        
+        report_window.after(REPORT_POLL_MS, poll)
 
-    def export_to_excel(self, df, report_type):
+    @timed("screen")
+    def show_report_result(self, report_window, pager, report_type, month, year):
+        tk.Label(report_window, text=f"{pager.count():,} rows").pack(pady=(10, 0))
+        
+        # Only the rows on screen ever exist in the Treeview
+        table = VirtualTable(report_window, pager)
+        table.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        # Add export button
+        tk.Button(report_window, text="Export...",
+                 command=lambda: self.export_report(report_type, month, year)).pack(pady=10)
+
+    def export_report(self, report_type, month, year):
+        default_name = f"{report_type.lower().replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        filename = filedialog.asksaveasfilename(
+            initialfile=default_name,
+            defaultextension=".xlsx",
+            filetypes=[("Excel workbook", "*.xlsx"), ("CSV", "*.csv"),
+                       ("Parquet", "*.parquet"), ("Feather", "*.feather")])
+        if not filename:
+            return
+        
         try:
-            filename = f"{report_type.lower().replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-            df.to_excel(filename, index=False)
-            messagebox.showinfo("Success", f"Report exported successfully to {filename}")
+            job = self.report_runner.run_job(ExportJob(report_type, month, year, filename))
         except Exception as e:
             messagebox.showerror("Error", f"Failed to export report: {str(e)}")
+            return
+        
+        # Rows stream from SQLite straight into the file on a worker thread
+        export_window = tk.Toplevel(self.root)
+        export_window.title("Exporting Report")
+        status_label = tk.Label(export_window, text="Exporting...", width=40)
+        status_label.pack(padx=20, pady=10)
+        progress = ttk.Progressbar(export_window, mode="indeterminate", length=300)
+        progress.pack(padx=20, pady=5)
+        progress.start(10)
+        tk.Button(export_window, text="Cancel", command=job.cancel).pack(pady=10)
+        export_window.protocol("WM_DELETE_WINDOW", job.cancel)
+        
+        def poll():
+            if not job.done():
+                status_label.configure(text=f"Exported {job.rows_written:,} rows...")
+                export_window.after(REPORT_POLL_MS, poll)
+                return
+            
+            export_window.destroy()
+            try:
+                result = job.result()
+            except (ReportCancelled, CancelledError):
+                return
+            except Exception as e:
+                messagebox.showerror("Error", f"Failed to export report: {str(e)}")
+                return
+            messagebox.showinfo("Success", f"Report exported successfully to {result.path}")
+        
+        export_window.after(REPORT_POLL_MS, poll)
+
+    def export_annual_pack(self, year):
+        filename = filedialog.asksaveasfilename(
+            initialfile=f"annual_pack_{year}",
+            defaultextension=".xlsx",
+            filetypes=[("Excel workbook", "*.xlsx")])
+        if not filename:
+            return
+        
+        try:
+            job = self.report_runner.run_job(AnnualPackJob(year, filename))
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to build annual pack: {str(e)}")
+            return
+        
+        # Every monthly report runs in worker processes; this only watches
+        pack_window = tk.Toplevel(self.root)
+        pack_window.title("Annual Pack")
+        status_label = tk.Label(pack_window, text="Starting...", width=40)
+        status_label.pack(padx=20, pady=10)
+        progress = ttk.Progressbar(pack_window, mode="determinate", length=300)
+        progress.pack(padx=20, pady=5)
+        tk.Button(pack_window, text="Cancel", command=job.cancel).pack(pady=10)
+        pack_window.protocol("WM_DELETE_WINDOW", job.cancel)
+        
+        def poll():
+            if not job.done():
+                if job.total:
+                    status_label.configure(text=f"{job.finished} of {job.total} reports done...")
+                    progress.configure(maximum=job.total, value=job.finished)
+                pack_window.after(REPORT_POLL_MS, poll)
+                return
+            
+            pack_window.destroy()
+            try:
+                result = job.result()
+            except (ReportCancelled, CancelledError):
+                return
+            except Exception as e:
+                messagebox.showerror("Error", f"Failed to build annual pack: {str(e)}")
+                return
+            messagebox.showinfo("Success", f"Annual pack ({result.sheets} sheets) "
+                                           f"saved to {result.path}")
+        
+        pack_window.after(REPORT_POLL_MS, poll)
 
+    @timed("screen")
     def show_employee_dashboard(self, username):
-        self.clear_frame()
-        
-        tk.Label(self.current_frame, text=f"Welcome, {username}!", 
-                font=('Arial', 16, 'bold')).pack(pady=20)
-        
-        # Get employee details
-        conn = sqlite3.connect('employee_finance.db')
-        c = conn.cursor()
-        c.execute("""SELECT e.* 
-                    FROM employees e
-                    JOIN users u ON e.name = u.username
-                    WHERE u.username = ?""", (username,))
-        employee = c.fetchone()
-        
-        if employee:
-            # Display employee information
-            info_frame = tk.LabelFrame(self.current_frame, text="Employee Information", padx=10, pady=10)
-            info_frame.pack(fill="x", padx=20, pady=10)
+        # Re-queried only for another user or after employees, their records
+        # or the loan ledger changed
+        self.views.show("employee_dashboard", self._build_employee_dashboard,
+                        scopes=("employees", "financial_records", "loans"), key=username)
+
+    def _build_employee_dashboard(self, frame):
+        welcome_label = tk.Label(frame, font=('Arial', 16, 'bold'))
+        welcome_label.pack(pady=20)
+        
+        # Employee details, hidden for users not linked to an employee
+        details = tk.Frame(frame)
+        
+        info_frame = tk.LabelFrame(details, text="Employee Information", padx=10, pady=10)
+        info_frame.pack(fill="x", padx=20, pady=10)
+        
+        labels = ["ID", "Name", "Position", "Base Salary", "Join Date"]
+        info_labels = [tk.Label(info_frame) for _ in labels]
+        for label in info_labels:
+            label.pack(anchor="w")
+        balance_label = tk.Label(info_frame)
+        balance_label.pack(anchor="w")
+        
+        # Show recent financial records
+        tk.Label(details, text="Recent Financial Records", 
+                font=('Arial', 12, 'bold')).pack(pady=10)
+        
+        # Create treeview for financial records
+        tree = ttk.Treeview(details)
+        tree.pack(fill=tk.BOTH, expand=True, padx=20)
+        
+        tree["columns"] = ["Month", "Year", "Base Salary", "Overtime", "Incentives", 
+                         "Advances", "Loans", "Net Salary"]
+        tree["show"] = "headings"
+        
+        for column in tree["columns"]:
+            tree.heading(column, text=column)
+            tree.column(column, width=100)
+        
+        state = {"employee_id": None}
+        tk.Button(details, text="Open Payslip",
+                 command=lambda: self.open_payslip(state["employee_id"], tree)).pack(pady=10)
+        
+        # Add logout button
+        logout_button = tk.Button(frame, text="Logout", command=self.show_login)
+        logout_button.pack(pady=20)
+        
+        def refresh(stale):
+            if not stale:
+                return
+            username = self.current_user['username']
+            welcome_label.configure(text=f"Welcome, {username}!")
             
-            labels = ["ID", "Name", "Position", "Base Salary", "Join Date"]
+            # Get employee details
+            employee = get_employee_for_user(self.db, username)
+            if not employee:
+                state["employee_id"] = None
+                details.pack_forget()
+                return
+        
+            state["employee_id"] = employee[0]
             for i, label in enumerate(labels):
-                tk.Label(info_frame, text=f"{label}: {employee[i]}").pack(anchor="w")
-            
-            # Show recent financial records
-            tk.Label(self.current_frame, text="Recent Financial Records", 
-                    font=('Arial', 12, 'bold')).pack(pady=10)
-            
-            # Create treeview for financial records
-            tree = ttk.Treeview(self.current_frame)
-            tree.pack(fill=tk.BOTH, expand=True, padx=20)
-            
-            tree["columns"] = ["Month", "Year", "Base Salary", "Overtime", "Incentives", 
-                             "Advances", "Loans", "Net Salary"]
-            tree["show"] = "headings"
-            
-            for column in tree["columns"]:
-                tree.heading(column, text=column)
-                tree.column(column, width=100)
+                info_labels[i].configure(text=f"{label}: {employee[i]}")
+            balances = outstanding_balance(self.db, employee[0])
+            balance_label.configure(text=f"Outstanding Loans: {balances['loan']:,.2f}   "
+                                         f"Outstanding Advances: {balances['advance']:,.2f}")
             
             # Get recent financial records
-            c.execute("""SELECT month, year, base_salary, overtime_pay, incentives,
-                               advances, loans, net_salary
-                        FROM financial_records
-                        WHERE employee_id = ?
-                        ORDER BY year DESC, month DESC LIMIT 12""", (employee[0],))
-            
-            for record in c.fetchall():
-                tree.insert("", tk.END, values=record)
-        
-        conn.close()
+            records = employee_history(self.db, employee[0])
+            with timed("treeview", "employee history"):
+                fill_tree(tree, records)
+            details.pack(fill=tk.BOTH, expand=True, before=logout_button)
+        return refresh
+
+    def open_payslip(self, employee_id, tree):
+        selection = tree.selection()
+        if not selection:
+            messagebox.showerror("Error", "Select a month first")
+            return
+        month, year = tree.item(selection[0], "values")[:2]
         
-        # Add logout button
-        tk.Button(self.current_frame, text="Logout", 
-                 command=self.show_login).pack(pady=20)
+        try:
+            with self.db.connection() as conn:
+                rows = list(iter_payslips(conn, month, year, [employee_id]))
+            if not rows:
+                messagebox.showerror("Error", "No payslip for that month")
+                return
+            path = os.path.join(tempfile.gettempdir(), payslip_filename(rows[0]))
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(render_payslip(rows[0]))
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to open payslip: {str(e)}")
+            return
+        # The browser's print dialog saves it as PDF
+        webbrowser.open(f"file://{path}")
 
     def run(self):
-        self.root.mainloop()
+        try:
+            self.root.mainloop()
+        finally:
+            self.report_runner.shutdown()
+            self.writer.close()
+            self.report_cache.close()
+            self.db.close()
 
 if __name__ == "__main__":
     app = EmployeeFinanceSystem()
@@ -0,0 +1,3 @@
+from .db import Database, DEFAULT_DB_PATH
+
+__all__ = ["Database", "DEFAULT_DB_PATH"]
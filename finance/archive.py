@@ -0,0 +1,331 @@
+import hashlib
+import os
+import secrets
+import shutil
+import sqlite3
+import time
+from datetime import date
+from urllib.parse import quote
+
+from .money import rebuild_in_minor_units
+from .records import RECORD_COLUMNS, normalize_year
+from .summaries import SUMMARY_TABLES
+
+# Closed years can be moved out of the main database into one SQLite file
+# per year under <db name>-archive/. The main database keeps a registry of
+# archived years; reads for an archived year ATTACH its file read-only
+# (immutable, memory-mapped) on the connection that needs it and query it
+# under the schema name archive_<year>, so hot-year queries never touch an
+# archive. Each file carries the year's financial_records and its rows of
+# the two summary tables, so every report works unchanged against it.
+# Archived years are read-only; restore one to change it.
+ARCHIVE_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS archived_years
+       (year INTEGER PRIMARY KEY,
+        path TEXT NOT NULL,
+        records INTEGER NOT NULL,
+        checksum TEXT NOT NULL,
+        archived_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP)''',
+]
+
+ARCHIVE_MMAP_SIZE = 268435456
+# SQLite allows 10 attached databases by default; leave room for callers
+MAX_ATTACHED = 8
+SCHEMA_PREFIX = "archive_"
+
+
+class ArchiveResult:
+    def __init__(self, year, path, records, seconds):
+        self.year = year
+        self.path = path
+        self.records = records
+        self.seconds = seconds
+
+    def __repr__(self):
+        return (f"ArchiveResult({self.year}: {self.records} records, {self.path}, "
+                f"{self.seconds:.3f}s)")
+
+
+def create_archive_registry(conn):
+    for statement in ARCHIVE_SCHEMA:
+        conn.execute(statement)
+
+
+def archive_dir(db_path):
+    return os.path.splitext(os.path.abspath(db_path))[0] + "-archive"
+
+
+def _main_path(conn):
+    return next(row[2] for row in conn.execute("PRAGMA database_list") if row[1] == "main")
+
+
+def _resolve(conn, path):
+    # Registry paths are relative to the main database, so the database and
+    # its archive directory can be moved together
+    return os.path.join(os.path.dirname(_main_path(conn)), path)
+
+
+def archived_years(conn):
+    # {year: absolute archive path}
+    return {year: _resolve(conn, path)
+            for year, path in conn.execute("SELECT year, path FROM archived_years")}
+
+
+def attach_year(conn, year, path):
+    # Attaches the year's archive to conn unless it already is; returns the
+    # schema name to query it under. Attachments stay for the connection's
+    # lifetime, so a pooled connection pays for the ATTACH once per year.
+    schema = f"{SCHEMA_PREFIX}{int(year)}"
+    attached = {name: file for _, name, file in conn.execute("PRAGMA database_list")}
+    if attached.get(schema) == path:
+        return schema
+    if schema in attached:
+        conn.execute(f"DETACH DATABASE {schema}")
+    else:
+        archives = [name for name in attached if name.startswith(SCHEMA_PREFIX)]
+        for name in archives[:max(0, len(archives) - MAX_ATTACHED + 1)]:
+            try:
+                conn.execute(f"DETACH DATABASE {name}")
+            except sqlite3.OperationalError:
+                pass  # still in use by an open statement
+    conn.execute(f"ATTACH DATABASE ? AS {schema}",
+                 (f"file:{quote(path)}?mode=ro&immutable=1",))
+    conn.execute(f"PRAGMA {schema}.mmap_size={ARCHIVE_MMAP_SIZE}")
+    return schema
+
+
+def records_schema(conn, year):
+    # "main" for a hot year; otherwise the archive, attached to conn
+    row = conn.execute("SELECT path FROM archived_years WHERE year = ?", (year,)).fetchone()
+    if row is None:
+        return "main"
+    return attach_year(conn, year, _resolve(conn, row[0]))
+
+
+def check_writable(conn, year):
+    if conn.execute("SELECT 1 FROM archived_years WHERE year = ?", (year,)).fetchone():
+        raise ValueError(f"{year} is archived; restore it before changing its records")
+
+
+def _checksum(conn, schema="main", year=None):
+    # Every record's values in period order, independent of rowids
+    digest = hashlib.sha256()
+    count = 0
+    sql = (f"SELECT {', '.join(RECORD_COLUMNS)} FROM {schema}.financial_records"
+           + (" WHERE year = ?" if year is not None else "")
+           + " ORDER BY employee_id, year, month")
+    for row in conn.execute(sql, () if year is None else (year,)):
+        digest.update(repr(row).encode())
+        count += 1
+    return count, digest.hexdigest()
+
+
+def archive_year(db, year, vacuum=False):
+    # Moves a closed year into its own file. The main database's write lock
+    # is held throughout, so no save can slip into the year mid-move; the
+    # archive is written and synced before any row leaves the main file.
+    year = normalize_year(year)
+    if year >= date.today().year:
+        raise ValueError("Only closed years (before the current one) can be archived")
+    started = time.perf_counter()
+
+    with db.transaction() as conn:
+        if conn.execute("SELECT 1 FROM archived_years WHERE year = ?", (year,)).fetchone():
+            raise ValueError(f"{year} is already archived")
+        expected = _checksum(conn, year=year)
+        if not expected[0]:
+            raise ValueError(f"No records for {year}")
+        ddl = [sql for (sql,) in conn.execute(
+            """SELECT sql FROM sqlite_master
+               WHERE tbl_name = 'financial_records' AND type IN ('table', 'index')
+                 AND sql IS NOT NULL
+               ORDER BY type = 'index'""")]
+
+        directory = archive_dir(db.path)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"financial_records_{year}_{secrets.token_hex(4)}.db")
+        _write_archive(path, _main_path(conn), year, ddl, expected)
+
+        conn.execute("INSERT INTO archived_years (year, path, records, checksum) VALUES (?, ?, ?, ?)",
+                     (year, os.path.relpath(path, os.path.dirname(_main_path(conn))), *expected))
+        # Summary and data-version triggers drop the year from the main tables
+        conn.execute("DELETE FROM financial_records WHERE year = ?", (year,))
+
+    if vacuum:
+        # Under WAL the rewritten pages only reach the file at a checkpoint
+        with db.connection() as conn:
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return ArchiveResult(year, path, expected[0], time.perf_counter() - started)
+
+
+def _write_archive(path, main_path, year, ddl, expected):
+    partial = path + ".partial"
+    out = sqlite3.connect(partial, isolation_level=None, uri=True)
+    try:
+        out.execute("PRAGMA synchronous=FULL")
+        out.execute("BEGIN")
+        for statement in ddl + SUMMARY_TABLES:
+            out.execute(statement)
+        out.execute("CREATE TABLE archive_info (key TEXT PRIMARY KEY, value)")
+        # A second reader of the main file sees the same committed state the
+        # caller's write transaction is holding still
+        out.execute("ATTACH DATABASE ? AS source", (f"file:{quote(main_path)}?mode=ro",))
+        out.execute("INSERT INTO financial_records SELECT * FROM source.financial_records "
+                    "WHERE year = ?", (year,))
+        out.execute("INSERT INTO employee_year_summary "
+                    "SELECT * FROM source.employee_year_summary WHERE year = ?", (year,))
+        out.execute("INSERT INTO position_month_summary "
+                    "SELECT * FROM source.position_month_summary WHERE year = ?", (year,))
+        out.executemany("INSERT INTO archive_info VALUES (?, ?)",
+                        [("year", year), ("records", expected[0]), ("checksum", expected[1])])
+        out.execute("COMMIT")
+        out.execute("DETACH DATABASE source")
+        if _checksum(out) != expected:
+            raise RuntimeError(f"Archive of {year} does not match the source records")
+        out.execute("ANALYZE")
+    except BaseException:
+        out.close()
+        os.remove(partial)
+        raise
+    out.close()
+    os.replace(partial, path)
+
+
+def convert_archives_to_minor_units(conn):
+    # For the migration to integer cents (finance.money), inside its
+    # transaction: rewrites every archive under a new name with its money in
+    # cents and points the registry at it. Returns the old files, which the
+    # caller deletes once the registry change is committed.
+    replaced, written = [], []
+    try:
+        for year, path in sorted(archived_years(conn).items()):
+            records = conn.execute("SELECT records FROM archived_years WHERE year = ?",
+                                   (year,)).fetchone()[0]
+            new_path = os.path.join(os.path.dirname(path),
+                                    f"financial_records_{year}_{secrets.token_hex(4)}.db")
+            checksum = _convert_archive(path, new_path, year, records)
+            written.append(new_path)
+            conn.execute("UPDATE archived_years SET path = ?, checksum = ? WHERE year = ?",
+                         (os.path.relpath(new_path, os.path.dirname(_main_path(conn))),
+                          checksum, year))
+            replaced.append(path)
+    except BaseException:
+        for path in written:
+            os.remove(path)
+        raise
+    return replaced
+
+
+def _convert_archive(path, new_path, year, records):
+    # Returns the converted records' checksum
+    partial = new_path + ".partial"
+    shutil.copyfile(path, partial)
+    out = sqlite3.connect(partial, isolation_level=None)
+    try:
+        out.execute("PRAGMA synchronous=FULL")
+        out.execute("BEGIN")
+        rebuild_in_minor_units(out, "financial_records")
+        # Employee totals are summed again from the converted records, over
+        # the employees the archive had them for. Department totals depend
+        # on positions at archiving time, so those are converted as stored.
+        out.execute("DROP INDEX IF EXISTS idx_employee_year_summary_year")
+        for table in ("employee_year_summary", "position_month_summary"):
+            out.execute(f"ALTER TABLE {table} RENAME TO {table}_real")
+        for statement in SUMMARY_TABLES:
+            out.execute(statement)
+        out.execute("""INSERT INTO employee_year_summary
+                       SELECT employee_id, year, COUNT(*), SUM(net_salary),
+                              SUM(COALESCE(overtime_pay, 0)), SUM(COALESCE(incentives, 0))
+                       FROM financial_records
+                       WHERE employee_id IN (SELECT employee_id FROM employee_year_summary_real)
+                       GROUP BY employee_id, year""")
+        out.execute("""INSERT INTO position_month_summary
+                       SELECT position, year, month, employee_count, to_minor(total_net_salary)
+                       FROM position_month_summary_real""")
+        for table in ("employee_year_summary", "position_month_summary"):
+            out.execute(f"DROP TABLE {table}_real")
+        count, checksum = _checksum(out)
+        if count != records:
+            raise RuntimeError(f"Archive of {year} has {count} records, expected {records}")
+        out.execute("UPDATE archive_info SET value = ? WHERE key = 'checksum'", (checksum,))
+        out.execute("COMMIT")
+        out.execute("VACUUM")
+        out.execute("ANALYZE")
+    except BaseException:
+        out.close()
+        os.remove(partial)
+        raise
+    out.close()
+    os.replace(partial, new_path)
+    return checksum
+
+
+def restore_year(db, year):
+    # Copies an archived year back into the main tables (their triggers
+    # rebuild its summaries) and deletes the archive file
+    year = normalize_year(year)
+    started = time.perf_counter()
+    columns = ", ".join(RECORD_COLUMNS)
+    with db.transaction() as conn:
+        row = conn.execute("SELECT path, records, checksum FROM archived_years WHERE year = ?",
+                           (year,)).fetchone()
+        if row is None:
+            raise ValueError(f"{year} is not archived")
+        path = _resolve(conn, row[0])
+        schema = attach_year(conn, year, path)
+        try:
+            intact = _checksum(conn, schema) == tuple(row[1:])
+        except sqlite3.DatabaseError:
+            intact = False
+        if not intact:
+            raise ValueError(f"The archive of {year} is damaged ({path}); not restored")
+        records = conn.execute(f"""INSERT INTO main.financial_records ({columns})
+                                   SELECT {columns} FROM {schema}.financial_records""").rowcount
+        conn.execute("DELETE FROM archived_years WHERE year = ?", (year,))
+    with db.connection() as conn:
+        try:
+            conn.execute(f"DETACH DATABASE {schema}")
+        except sqlite3.OperationalError:
+            pass
+    try:
+        os.remove(path)
+    except OSError:
+        pass  # e.g. still open on Windows; the registry no longer points at it
+    return ArchiveResult(year, path, records, time.perf_counter() - started)
+
+
+def verify_archives(db, year=None):
+    # Returns (year, problem) pairs; an empty list means every archive file
+    # is intact, matches its registry entry and the year is gone from main
+    problems = []
+    with db.connection() as conn:
+        registry = {row[0]: row[1:] for row in conn.execute(
+            "SELECT year, path, records, checksum FROM archived_years")}
+        if year is not None:
+            year = normalize_year(year)
+            if year not in registry:
+                return [(year, "not archived")]
+            registry = {year: registry[year]}
+
+        for archived, (path, records, checksum) in sorted(registry.items()):
+            path = _resolve(conn, path)
+            if not os.path.exists(path):
+                problems.append((archived, f"missing file {path}"))
+                continue
+            hot = conn.execute("SELECT COUNT(*) FROM financial_records WHERE year = ?",
+                               (archived,)).fetchone()[0]
+            if hot:
+                problems.append((archived, f"{hot} records still in the main database"))
+            archive = sqlite3.connect(f"file:{quote(path)}?mode=ro", uri=True)
+            try:
+                status = archive.execute("PRAGMA integrity_check").fetchone()[0]
+                if status != "ok":
+                    problems.append((archived, f"integrity check: {status}"))
+                elif _checksum(archive) != (records, checksum):
+                    problems.append((archived, "records do not match the archived checksum"))
+            except sqlite3.DatabaseError as e:
+                problems.append((archived, str(e)))
+            finally:
+                archive.close()
+    return problems
@@ -0,0 +1,208 @@
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Write counters bumped by triggers on every change to employees and
+# financial_records (and the loan ledger, see finance.ledger). Financial
+# records are counted per year, so saving March 2024 leaves cached 2023
+# reports valid.
+DATA_VERSION_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS data_versions
+       (scope TEXT PRIMARY KEY,
+        version INTEGER NOT NULL) WITHOUT ROWID''',
+]
+
+_BUMP = '''
+    INSERT INTO data_versions (scope, version) VALUES ({scope}, 1)
+    ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+'''
+
+_RECORDS_SCOPE = "'financial_records:' || {row}.year"
+
+
+def data_version_triggers(table, scope):
+    # Bumps one fixed scope on every write to table; also used by tables
+    # added in later migrations
+    return [
+        f'''CREATE TRIGGER IF NOT EXISTS data_version_{table}_{event.lower()}
+            AFTER {event} ON {table}
+            BEGIN {_BUMP.format(scope=f"'{scope}'")} END'''
+        for event in ("INSERT", "UPDATE", "DELETE")
+    ]
+
+
+DATA_VERSION_TRIGGERS = data_version_triggers("employees", "employees") + [
+    f'''CREATE TRIGGER IF NOT EXISTS data_version_records_insert
+        AFTER INSERT ON financial_records
+        BEGIN {_BUMP.format(scope=_RECORDS_SCOPE.format(row="NEW"))} END''',
+    f'''CREATE TRIGGER IF NOT EXISTS data_version_records_delete
+        AFTER DELETE ON financial_records
+        BEGIN {_BUMP.format(scope=_RECORDS_SCOPE.format(row="OLD"))} END''',
+    f'''CREATE TRIGGER IF NOT EXISTS data_version_records_update
+        AFTER UPDATE ON financial_records
+        BEGIN
+            {_BUMP.format(scope=_RECORDS_SCOPE.format(row="OLD"))}
+            {_BUMP.format(scope=_RECORDS_SCOPE.format(row="NEW"))}
+        END''',
+]
+
+DEFAULT_MAX_ROWS = 500000
+DEFAULT_DISK_ENTRIES = 2000
+
+
+def create_data_versions(conn):
+    for statement in DATA_VERSION_SCHEMA + DATA_VERSION_TRIGGERS:
+        conn.execute(statement)
+
+
+def data_version(conn, year):
+    # Everything a report for this year depends on, as one comparable token
+    rows = dict(conn.execute(
+        "SELECT scope, version FROM data_versions WHERE scope IN ('employees', 'loans', ?)",
+        (f"financial_records:{year}",)).fetchall())
+    return (rows.get("employees", 0), rows.get(f"financial_records:{year}", 0),
+            rows.get("loans", 0))
+
+
+def scope_versions(conn, scopes):
+    # Comparable token for whole scopes; "financial_records" covers every
+    # year. Screens use it to re-query only when their data changed.
+    return tuple(sorted((scope, version) for scope, version
+                        in conn.execute("SELECT scope, version FROM data_versions")
+                        if scope.split(":")[0] in scopes))
+
+
+class ReportCache:
+    # LRU cache of report results (row counts and pages). Each entry carries
+    # the data version it was computed at; a lookup with a newer version
+    # drops it. Memory is bounded by the total number of cached rows, and an
+    # optional SQLite file keeps results across restarts.
+    def __init__(self, max_rows=DEFAULT_MAX_ROWS, disk_path=None,
+                 disk_entries=DEFAULT_DISK_ENTRIES):
+        self.max_rows = max_rows
+        self.disk_entries = disk_entries
+        self._entries = OrderedDict()
+        self._rows = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+        self._disk = None
+        if disk_path:
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False,
+                                         isolation_level=None)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute('''CREATE TABLE IF NOT EXISTS report_cache
+                                  (key TEXT PRIMARY KEY,
+                                   version TEXT NOT NULL,
+                                   value TEXT NOT NULL,
+                                   used INTEGER NOT NULL)''')
+            self._disk.execute('''CREATE INDEX IF NOT EXISTS idx_report_cache_used
+                                  ON report_cache (used)''')
+            self._tick = self._disk.execute(
+                "SELECT COALESCE(MAX(used), 0) FROM report_cache").fetchone()[0]
+
+    @staticmethod
+    def _size(value):
+        return len(value) if isinstance(value, list) else 1
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == version:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                self._discard(key)
+                self.invalidations += 1
+
+            value = self._disk_get(key, version)
+            if value is not None:
+                self.hits += 1
+                self.disk_hits += 1
+                self._store(key, version, value)
+                return value
+
+            self.misses += 1
+            return None
+
+    def put(self, key, version, value):
+        with self._lock:
+            self._store(key, version, value)
+            self._disk_put(key, version, value)
+
+    def _store(self, key, version, value):
+        size = self._size(value)
+        if size > self.max_rows:
+            return
+        if key in self._entries:
+            self._discard(key)
+        self._entries[key] = (version, value)
+        self._rows += size
+        while self._rows > self.max_rows:
+            oldest = next(iter(self._entries))
+            self._discard(oldest)
+            self.evictions += 1
+
+    def _discard(self, key):
+        _, value = self._entries.pop(key)
+        self._rows -= self._size(value)
+
+    def _disk_get(self, key, version):
+        if self._disk is None:
+            return None
+        row = self._disk.execute("SELECT version, value FROM report_cache WHERE key = ?",
+                                 (json.dumps(key),)).fetchone()
+        if row is None:
+            return None
+        if row[0] != json.dumps(version):
+            self._disk.execute("DELETE FROM report_cache WHERE key = ?", (json.dumps(key),))
+            self.invalidations += 1
+            return None
+        self._tick += 1
+        self._disk.execute("UPDATE report_cache SET used = ? WHERE key = ?",
+                           (self._tick, json.dumps(key)))
+        value = json.loads(row[1])
+        # JSON turns row tuples into lists
+        return [tuple(r) for r in value] if isinstance(value, list) else value
+
+    def _disk_put(self, key, version, value):
+        if self._disk is None:
+            return
+        self._tick += 1
+        self._disk.execute("INSERT OR REPLACE INTO report_cache VALUES (?, ?, ?, ?)",
+                           (json.dumps(key), json.dumps(version), json.dumps(value), self._tick))
+        self._disk.execute('''DELETE FROM report_cache WHERE used <= (
+                                  SELECT used FROM report_cache ORDER BY used DESC
+                                  LIMIT 1 OFFSET ?)''', (self.disk_entries,))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._rows = 0
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM report_cache")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "rows": self._rows,
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions,
+            }
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
+            self._disk = None
@@ -0,0 +1,425 @@
+import argparse
+import csv
+import sys
+
+from .db import DEFAULT_DB_PATH, Database
+from .metrics import metrics
+from .schema import check_database, init_database
+
+# Command-line entry point for scripted and headless use (cron jobs,
+# containers). Every subcommand imports what it needs when it runs, so
+# "--help" or a small command never loads pandas or Tk.
+
+# Commands that change the database, with the actions that do (None: all of
+# them). These bring the schema up to date first; everything else only reads
+# and refuses to run against a file that needs "init".
+WRITE_COMMANDS = {
+    "payroll-run": None,
+    "import": None,
+    "serve": None,
+    "summaries": {"rebuild"},
+    "archive": {"create", "restore"},
+    "loans": {"issue", "rebuild"},
+    "rules": {"set"},
+}
+
+
+def _report_types():
+    from .reports import REPORT_TYPES
+
+    return REPORT_TYPES
+
+
+def cmd_init(db, args):
+    applied = init_database(db)
+    for version, description in applied:
+        print(f"Applied migration {version}: {description}")
+    print(f"Database ready: {db.path}")
+
+
+def cmd_payroll_run(db, args):
+    from .payroll import load_adjustments, run_payroll
+
+    adjustments = load_adjustments(args.adjustments) if args.adjustments else None
+    result = run_payroll(db, args.month, args.year, adjustments, overwrite=args.overwrite)
+    print(f"Payroll {result.month:02d}/{result.year}: {result.rows} records "
+          f"in {result.seconds:.3f}s ({result.rows_per_second:,.0f} records/s)")
+    if result.skipped:
+        print(f"Skipped {result.skipped} employees already saved for the month "
+              f"(--overwrite replaces them)")
+
+
+def cmd_report(db, args):
+    from .reports import prepare_report
+
+    with db.connection() as conn:
+        query, params = prepare_report(conn, args.report_type, args.month, args.year)
+        if args.limit:
+            query = f"SELECT * FROM ({query}) LIMIT {int(args.limit)}"
+        cursor = conn.execute(query, params)
+        writer = csv.writer(sys.stdout, delimiter="\t" if args.tsv else ",")
+        writer.writerow([d[0] for d in cursor.description])
+        while True:
+            rows = cursor.fetchmany(1000)
+            if not rows:
+                break
+            writer.writerows(rows)
+
+
+def cmd_export(db, args):
+    from .export import export_report
+
+    result = export_report(db, args.report_type, args.month, args.year, args.output)
+    print(f"Exported {result.rows} rows to {result.path} in {result.seconds:.3f}s")
+
+
+def cmd_pack(db, args):
+    from .pack import build_annual_pack
+
+    result = build_annual_pack(db, args.year, args.output, workers=args.workers)
+    print(f"Wrote {result.sheets} sheets ({result.rows} rows) to {result.path} "
+          f"in {result.seconds:.3f}s on {result.workers} workers")
+
+
+def cmd_payslips(db, args):
+    from .payslips import generate_payslips, load_template
+    from .records import normalize_month, normalize_year
+
+    directory = (args.output_dir or
+                 f"payslips-{normalize_year(args.year)}-{normalize_month(args.month):02d}")
+    result = generate_payslips(db, args.month, args.year, directory,
+                               template=load_template(args.template), workers=args.workers,
+                               employee_ids=args.employee_ids, force=args.force)
+    print(f"Rendered {result.rendered} payslips ({result.unchanged} unchanged) into "
+          f"{result.directory} in {result.seconds:.3f}s "
+          f"({result.payslips_per_second:,.0f} payslips/s)")
+
+
+def cmd_import(db, args):
+    from .importer import IMPORTERS
+
+    kwargs = {"reject_path": args.rejects}
+    if args.chunk_size:
+        kwargs["chunk_size"] = args.chunk_size
+    result = IMPORTERS[args.kind](db, args.path, **kwargs)
+    print(f"Imported {result.imported} rows in {result.seconds:.3f}s "
+          f"({result.rows_per_second:,.0f} rows/s)")
+    if result.rejected:
+        print(f"{result.rejected} rows rejected, see {result.reject_path}")
+        return 1
+
+
+def cmd_search(db, args):
+    from .search import search_employees
+
+    for employee_id, name, position in search_employees(db, args.text, args.limit):
+        print(f"{employee_id}\t{name}\t{position}")
+
+
+def cmd_summaries(db, args):
+    from .summaries import rebuild_summaries, verify_summaries
+
+    if args.action == "rebuild":
+        rebuild_summaries(db)
+        print("Summary tables rebuilt")
+        return
+    problems = verify_summaries(db)
+    for table, key, expected, stored in problems[:50]:
+        print(f"{table} {key}: expected {expected}, stored {stored}")
+    print(f"{len(problems)} mismatched rows" if problems else "Summary tables OK")
+    return 1 if problems else 0
+
+
+def cmd_archive(db, args):
+    from .archive import archive_year, restore_year, verify_archives
+
+    if args.action in ("create", "restore") and not args.year:
+        raise ValueError(f"archive {args.action} needs a year")
+    if args.action == "create":
+        result = archive_year(db, args.year, vacuum=args.vacuum)
+        print(f"Archived {result.records} records of {result.year} to {result.path} "
+              f"in {result.seconds:.3f}s")
+    elif args.action == "restore":
+        result = restore_year(db, args.year)
+        print(f"Restored {result.records} records of {result.year} in {result.seconds:.3f}s")
+    elif args.action == "list":
+        for year, path, records, archived_at in db.execute(
+                "SELECT year, path, records, archived_at FROM archived_years ORDER BY year"):
+            print(f"{year}\t{records}\t{archived_at}\t{path}")
+    else:
+        problems = verify_archives(db, args.year)
+        for year, problem in problems:
+            print(f"{year}: {problem}")
+        print(f"{len(problems)} problems" if problems else "Archives OK")
+        return 1 if problems else 0
+
+
+def cmd_loans(db, args):
+    from .ledger import (employee_loans, issue_loan, loan_statement, outstanding_balance,
+                         rebuild_ledger, verify_ledger)
+
+    if args.action == "issue":
+        if not (args.employee_id and args.principal and args.month and args.year):
+            raise ValueError("loans issue needs --employee-id, --principal, --month and --year")
+        loan_id = issue_loan(db, args.employee_id, args.kind, args.principal, args.month,
+                             args.year, args.installment, args.note)
+        print(f"Issued {args.kind} {loan_id}")
+    elif args.action == "balance":
+        if not args.employee_id:
+            raise ValueError("loans balance needs --employee-id")
+        balances = outstanding_balance(db, args.employee_id)
+        print(f"loans\t{balances['loan']:.2f}\nadvances\t{balances['advance']:.2f}")
+        for loan in employee_loans(db, args.employee_id):
+            loan_id, kind, principal, installment, repaid, outstanding, year, month = loan[:8]
+            print(f"{kind} {loan_id}: {principal:.2f} from {month:02d}/{year}, "
+                  f"{installment:.2f}/month, {outstanding:.2f} outstanding")
+            if args.verbose:
+                for y, m, amount, balance in loan_statement(db, loan_id):
+                    print(f"  {m:02d}/{y}\t{amount:.2f}\t{balance:.2f}")
+    elif args.action == "rebuild":
+        rebuild_ledger(db)
+        print("Loan balances rebuilt")
+    else:
+        problems = verify_ledger(db)
+        for table, key, expected, stored in problems[:50]:
+            print(f"{table} {key}: expected {expected}, stored {stored}")
+        print(f"{len(problems)} mismatched rows" if problems else "Loan balances OK")
+        return 1 if problems else 0
+
+
+def cmd_rules(db, args):
+    import json
+
+    from .rules import list_rules, save_rules
+
+    if args.action == "set":
+        if not (args.path and args.from_year and args.from_month):
+            raise ValueError("rules set needs FILE, --from-year and --from-month")
+        with open(args.path) as f:
+            version = save_rules(db, json.load(f), args.from_year, args.from_month)
+        print(f"Saved pay rules version {version}")
+        return
+    rules = list_rules(db)
+    for version, year, month, created_at, config in rules:
+        print(f"Version {version}: from {month:02d}/{year} (saved {created_at})")
+        if args.verbose:
+            print(json.dumps(json.loads(config), indent=2))
+    if not rules:
+        print("No pay rules saved; the built-in formula applies")
+
+
+def cmd_simulate(db, args):
+    import json
+
+    from .rules import PayrollHistory, RuleSet, parse_raises, simulate
+
+    rules = None
+    if args.rules:
+        with open(args.rules) as f:
+            rules = RuleSet(json.load(f))
+    if args.snapshot:
+        from .snapshot import Snapshot
+
+        snapshot = Snapshot.open(args.snapshot)
+        if not snapshot.is_current(db):
+            print(f"Warning: {args.snapshot} is older than the latest changes to the data",
+                  file=sys.stderr)
+        history = PayrollHistory.from_snapshot(snapshot, args.year)
+    else:
+        history = PayrollHistory.load(db, args.year)
+    everyone, positions = parse_raises(args.raises)
+    result = simulate(history, rules, everyone, positions, args.projection)
+    print("position\trecords\tcurrent\tsimulated\tchange\tchange_pct")
+    for p in result.by_position:
+        print(f"{p['position']}\t{p['records']}\t{p['current_total']:.2f}\t"
+              f"{p['simulated_total']:.2f}\t{p['change']:.2f}\t{p['change_pct']:.2f}")
+    print(f"Total {result.current_total:,.2f} -> {result.simulated_total:,.2f} "
+          f"({result.rows} records in {result.seconds:.3f}s)", file=sys.stderr)
+
+
+def cmd_snapshot(db, args):
+    from .money import format_minor
+    from .snapshot import Snapshot, write_snapshot
+
+    if args.action == "export":
+        if not args.output:
+            raise ValueError("snapshot export needs --output")
+        result = write_snapshot(db, args.output, args.year)
+        print(f"Wrote {result.rows} records ({result.size:,} bytes) to {result.path} "
+              f"in {result.seconds:.3f}s")
+        return
+    if not args.path:
+        raise ValueError("snapshot info needs a FILE")
+    snapshot = Snapshot.open(args.path)
+    header = snapshot.header
+    print(f"{args.path}: {len(snapshot)} records"
+          + (f" for {header['year']}" if header["year"] is not None else "")
+          + f", taken {header['created_at']}, "
+          + ("current" if snapshot.is_current(db) else "out of date"))
+    print("columns: " + ", ".join(f"{c['name']} ({c['dtype']})" for c in header["columns"]))
+    print("position\tnet_salary")
+    for position, total in snapshot.totals("net_salary").items():
+        print(f"{position}\t{format_minor(total)}")
+
+
+def cmd_serve(db, args):
+    from .service import run
+
+    db.close()
+    run(args.db, args.host, args.port, args.workers)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m finance",
+                                     description="Employee finance system, headless")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH,
+                        help=f"database file (default: {DEFAULT_DB_PATH})")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="time SQL statements and operations and write the histograms "
+                             "here on exit (.prom for Prometheus text, otherwise JSON)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("init", help="create or migrate the database")
+    p.set_defaults(func=cmd_init)
+
+    p = commands.add_parser("payroll-run", help="compute and save a month for all employees")
+    p.add_argument("--month", required=True)
+    p.add_argument("--year", required=True)
+    p.add_argument("--adjustments", help="CSV/XLSX with employee_id or name, "
+                                         "overtime_hours, incentives, advances, loans")
+    p.add_argument("--overwrite", action="store_true",
+                   help="recompute employees already saved for the month, "
+                        "replacing their overtime, incentives and deductions")
+    p.set_defaults(func=cmd_payroll_run)
+
+    def add_report_args(p):
+        # finance.reports is light to import; the names are checked when the
+        # command runs
+        names = [f'"{name}"' for name in _report_types()]
+        p.add_argument("report_type", metavar="REPORT",
+                       help=f"{', '.join(names[:-1])} or {names[-1]}")
+        p.add_argument("--month")
+        p.add_argument("--year", required=True)
+
+    p = commands.add_parser("report", help="print a report as CSV")
+    add_report_args(p)
+    p.add_argument("--limit", type=int)
+    p.add_argument("--tsv", action="store_true", help="tab-separated output")
+    p.set_defaults(func=cmd_report)
+
+    p = commands.add_parser("export", help="export a report to .xlsx, .csv, .parquet or .feather")
+    add_report_args(p)
+    p.add_argument("--output", "-o", required=True)
+    p.set_defaults(func=cmd_export)
+
+    p = commands.add_parser("pack", help="year-end pack: every monthly report in one workbook")
+    p.add_argument("--year", required=True)
+    p.add_argument("--output", "-o", required=True, help=".xlsx file to write")
+    p.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    p.set_defaults(func=cmd_pack)
+
+    p = commands.add_parser("payslips", help="render the month's payslips as HTML")
+    p.add_argument("--month", required=True)
+    p.add_argument("--year", required=True)
+    p.add_argument("--output-dir", "-o", help="default: payslips-YYYY-MM")
+    p.add_argument("--template", help="HTML template with {{field}} placeholders")
+    p.add_argument("--employee-id", dest="employee_ids", type=int, action="append",
+                   help="only this employee; repeatable")
+    p.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    p.add_argument("--force", action="store_true",
+                   help="re-render every payslip, not only the changed ones")
+    p.set_defaults(func=cmd_payslips)
+
+    p = commands.add_parser("import", help="bulk import employees or financial records")
+    p.add_argument("kind", choices=["employees", "financial_records"])
+    p.add_argument("path")
+    p.add_argument("--chunk-size", type=int)
+    p.add_argument("--rejects", help="where to write rejected rows")
+    p.set_defaults(func=cmd_import)
+
+    p = commands.add_parser("search", help="find employees by name or position prefix")
+    p.add_argument("text")
+    p.add_argument("--limit", type=int, default=10)
+    p.set_defaults(func=cmd_search)
+
+    p = commands.add_parser("summaries", help="verify or rebuild the report summary tables")
+    p.add_argument("action", choices=["verify", "rebuild"])
+    p.set_defaults(func=cmd_summaries)
+
+    p = commands.add_parser("archive", help="move closed years to per-year files and back")
+    p.add_argument("action", choices=["create", "restore", "verify", "list"])
+    p.add_argument("year", nargs="?")
+    p.add_argument("--vacuum", action="store_true",
+                   help="shrink the main database file after archiving")
+    p.set_defaults(func=cmd_archive)
+
+    p = commands.add_parser("loans", help="issue loans/advances, show balances, verify the ledger")
+    p.add_argument("action", choices=["issue", "balance", "verify", "rebuild"])
+    p.add_argument("--employee-id", type=int)
+    p.add_argument("--kind", choices=["loan", "advance"], default="loan")
+    p.add_argument("--principal", type=float)
+    p.add_argument("--installment", type=float,
+                   help="deducted each month (advances default to the whole amount)")
+    p.add_argument("--month", help="first payroll month to deduct from")
+    p.add_argument("--year")
+    p.add_argument("--note")
+    p.add_argument("--verbose", "-v", action="store_true", help="show each loan's repayments")
+    p.set_defaults(func=cmd_loans)
+
+    p = commands.add_parser("rules", help="list or save versioned pay rules")
+    p.add_argument("action", choices=["list", "set"])
+    p.add_argument("path", nargs="?", help="JSON rule set (for set)")
+    p.add_argument("--from-year", help="first payroll year the rules apply to")
+    p.add_argument("--from-month", help="first payroll month the rules apply to")
+    p.add_argument("--verbose", "-v", action="store_true", help="print each rule set")
+    p.set_defaults(func=cmd_rules)
+
+    p = commands.add_parser("simulate", help="what-if: re-price payroll history under new rules")
+    p.add_argument("--rules", help="JSON rule set to try (default: the built-in formula)")
+    p.add_argument("--raise", dest="raises", action="append", metavar="[POSITION=]PCT",
+                   help="% raise for everyone or one position; repeatable")
+    p.add_argument("--year", type=int, help="only this year's records")
+    p.add_argument("--projection", action="store_true",
+                   help="use current base salaries instead of the recorded ones")
+    p.add_argument("--snapshot", metavar="FILE",
+                   help="read the history from a snapshot file instead of the database")
+    p.set_defaults(func=cmd_simulate)
+
+    p = commands.add_parser("snapshot", help="export payroll history as memory-mappable columns")
+    p.add_argument("action", choices=["export", "info"])
+    p.add_argument("path", nargs="?", help="snapshot file (for info)")
+    p.add_argument("--output", "-o", help="file to write (for export)")
+    p.add_argument("--year", help="only this year's records (default: every year)")
+    p.set_defaults(func=cmd_snapshot)
+
+    p = commands.add_parser("serve", help="run the JSON/HTTP service")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8080, help="0 picks a free port")
+    p.add_argument("--workers", type=int, default=8, help="SQLite reader threads")
+    p.set_defaults(func=cmd_serve)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.metrics:
+        metrics.enabled = True
+    db = Database(args.db)
+    try:
+        if args.command in WRITE_COMMANDS:
+            actions = WRITE_COMMANDS[args.command]
+            if actions is None or args.action in actions:
+                init_database(db)
+            else:
+                check_database(db)
+        elif args.command != "init":
+            check_database(db)
+        return args.func(db, args) or 0
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        db.close()
+        if args.metrics:
+            metrics.write(args.metrics)
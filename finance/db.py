@@ -0,0 +1,133 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from .metrics import InstrumentedConnection, metrics
+
+DEFAULT_DB_PATH = os.environ.get("EMPLOYEE_FINANCE_DB", "employee_finance.db")
+
+# Pragmas applied to every pooled connection. WAL lets readers keep going
+# while a save is committing, and NORMAL sync is durable under WAL except
+# for the last transactions on power loss.
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -20000,      # ~20 MB page cache per connection
+    "mmap_size": 268435456,    # 256 MB memory-mapped I/O
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+
+
+class Database:
+    def __init__(self, path=DEFAULT_DB_PATH, pool_size=4, pragmas=None,
+                 cached_statements=256):
+        self.path = path
+        self.pool_size = pool_size
+        self.pragmas = dict(PRAGMAS)
+        if pragmas:
+            self.pragmas.update(pragmas)
+        self.cached_statements = cached_statements
+
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def connect(self, **pragmas):
+        # A new connection outside the pool, e.g. for a long-lived writer;
+        # keyword arguments override individual pragmas.
+        # isolation_level=None puts the connection in autocommit mode so that
+        # transaction() controls BEGIN/COMMIT itself. cached_statements keeps
+        # the prepared statements of every screen around between calls.
+        # uri=True lets finance.archive ATTACH its files read-only. Statements
+        # are only timed on connections opened while metrics are on.
+        conn = sqlite3.connect(
+            self.path,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+            uri=True,
+            factory=InstrumentedConnection if metrics.enabled else sqlite3.Connection,
+        )
+        for name, value in {**self.pragmas, **pragmas}.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
+
+    def _acquire(self):
+        if self._closed:
+            raise sqlite3.ProgrammingError("Database pool is closed")
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.pool_size:
+                self._created += 1
+                try:
+                    return self.connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+
+        # Pool exhausted, wait for another caller to hand one back
+        return self._pool.get()
+
+    def _release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+            with self._lock:
+                self._created -= 1
+            return
+        self._pool.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    @contextmanager
+    def transaction(self, immediate=True):
+        # BEGIN IMMEDIATE takes the write lock up front so two writers fail
+        # fast on busy_timeout instead of deadlocking on lock upgrade.
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            else:
+                conn.commit()
+
+    def execute(self, sql, params=()):
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def fetchone(self, sql, params=()):
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchone()
+
+    def recycle(self):
+        # Closes the idle pooled connections so the next callers get fresh
+        # ones, e.g. after metrics are switched on or off
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+    def close(self):
+        self._closed = True
+        self.recycle()
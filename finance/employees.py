@@ -0,0 +1,57 @@
+from .archive import archived_years, attach_year
+from .money import to_minor
+
+# Amounts in currency units; they are stored in cents (finance.money)
+EMPLOYEE_HISTORY_SQL = """
+    SELECT month, year, base_salary / 100.0 AS base_salary,
+           overtime_pay / 100.0 AS overtime_pay, incentives / 100.0 AS incentives,
+           advances / 100.0 AS advances, loans / 100.0 AS loans,
+           net_salary / 100.0 AS net_salary
+    FROM {schema}.financial_records
+    WHERE employee_id = ?
+    ORDER BY year DESC, month DESC LIMIT ?
+"""
+
+
+def get_employee_for_user(db, username):
+    # Employee accounts are linked to their employee row by name
+    return db.fetchone("""SELECT e.id, e.name, e.position,
+                                 e.base_salary / 100.0 AS base_salary, e.join_date
+                          FROM employees e
+                          JOIN users u ON e.name = u.username
+                          WHERE u.username = ?""", (username,))
+
+
+def employee_history(db, employee_id, limit=12):
+    # Most recent months first. Archived years are only attached and read
+    # when the main database has fewer than limit months, newest first.
+    with db.connection() as conn:
+        rows = conn.execute(EMPLOYEE_HISTORY_SQL.format(schema="main"),
+                            (employee_id, limit)).fetchall()
+        if len(rows) < limit:
+            archives = archived_years(conn)
+            for year in sorted(archives, reverse=True):
+                if len(rows) >= limit:
+                    break
+                schema = attach_year(conn, year, archives[year])
+                rows += conn.execute(EMPLOYEE_HISTORY_SQL.format(schema=schema),
+                                     (employee_id, limit - len(rows))).fetchall()
+            rows.sort(key=lambda row: (row[1], row[0]), reverse=True)
+    return rows
+
+
+def write_employee(conn, name, position, base_salary, join_date):
+    # Inserts inside the caller's transaction; returns the new id
+    cursor = conn.execute("""INSERT INTO employees (name, position, base_salary, join_date)
+                             VALUES (?, ?, ?, ?)""",
+                          (name, position, to_minor(base_salary), join_date))
+    return cursor.lastrowid
+
+
+def add_employee(db, name, position, base_salary, join_date):
+    with db.transaction() as conn:
+        return write_employee(conn, name, position, base_salary, join_date)
+
+
+def has_employees(db):
+    return db.fetchone("SELECT EXISTS (SELECT 1 FROM employees)")[0] == 1
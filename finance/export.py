@@ -0,0 +1,190 @@
+import csv
+import os
+import time
+
+from .metrics import timed
+from .reports import ReportCancelled, ReportJob, prepare_report, report_query
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+class CsvExportWriter:
+    def __init__(self, path, columns):
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class XlsxExportWriter:
+    # openpyxl's write-only mode streams rows to disk instead of keeping
+    # every cell of the workbook in memory
+    def __init__(self, path, columns):
+        from openpyxl import Workbook
+
+        self.path = path
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet("Report")
+        self._sheet.append(columns)
+
+    def write(self, rows):
+        for row in rows:
+            self._sheet.append(row)
+
+    def close(self):
+        self._workbook.save(self.path)
+
+
+class ArrowExportWriter:
+    # Writes one Arrow record batch per chunk; the schema is fixed from the
+    # first chunk, widening integer columns that also hold floats
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = columns
+        self._schema = None
+        self._writer = None
+
+    def _infer_schema(self, rows):
+        import pyarrow as pa
+
+        fields = []
+        for i, name in enumerate(self.columns):
+            values = [row[i] for row in rows if row[i] is not None]
+            if any(isinstance(v, str) for v in values):
+                kind = pa.string()
+            elif any(isinstance(v, float) for v in values) or not values:
+                kind = pa.float64()
+            else:
+                kind = pa.int64()
+            fields.append(pa.field(name, kind))
+        return pa.schema(fields)
+
+    def _open(self, schema):
+        raise NotImplementedError
+
+    def write(self, rows):
+        import pyarrow as pa
+
+        if self._schema is None:
+            self._schema = self._infer_schema(rows)
+            self._writer = self._open(self._schema)
+        arrays = [pa.array([row[i] for row in rows], type=field.type)
+                  for i, field in enumerate(self._schema)]
+        self._writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self._schema))
+
+    def close(self):
+        if self._writer is None:
+            # Empty report: still produce a valid file with the column names
+            self._schema = self._infer_schema([])
+            self._writer = self._open(self._schema)
+        self._writer.close()
+
+
+class ParquetExportWriter(ArrowExportWriter):
+    def _open(self, schema):
+        import pyarrow.parquet as pq
+
+        return pq.ParquetWriter(self.path, schema, compression="snappy")
+
+
+class FeatherExportWriter(ArrowExportWriter):
+    # Feather v2 is the Arrow IPC file format
+    def _open(self, schema):
+        import pyarrow as pa
+
+        return pa.ipc.new_file(self.path, schema)
+
+
+EXPORT_WRITERS = {
+    ".xlsx": XlsxExportWriter,
+    ".csv": CsvExportWriter,
+    ".parquet": ParquetExportWriter,
+    ".feather": FeatherExportWriter,
+}
+
+
+class ExportResult:
+    def __init__(self, path, rows, seconds):
+        self.path = path
+        self.rows = rows
+        self.seconds = seconds
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else float("inf")
+
+    def __repr__(self):
+        return (f"ExportResult({self.path}: {self.rows} rows in {self.seconds:.3f}s, "
+                f"{self.rows_per_second:,.0f} rows/s)")
+
+
+def writer_for(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in EXPORT_WRITERS:
+        raise ValueError(f"Unsupported export format: {ext or path} "
+                         f"(use {', '.join(EXPORT_WRITERS)})")
+    return EXPORT_WRITERS[ext]
+
+
+def export_query(conn, query, params, path, chunk_size=DEFAULT_CHUNK_SIZE,
+                 progress=None, cancelled=None):
+    # Streams the cursor to the file chunk by chunk; the format follows the
+    # file extension. A failed or cancelled export leaves no partial file.
+    writer_class = writer_for(path)
+    with timed("export", os.path.splitext(path)[1].lower()):
+        started = time.perf_counter()
+        cursor = conn.execute(query, params)
+        writer = writer_class(path, [d[0] for d in cursor.description])
+        rows = 0
+        try:
+            while True:
+                chunk = cursor.fetchmany(chunk_size)
+                if not chunk:
+                    break
+                if cancelled and cancelled():
+                    raise ReportCancelled()
+                writer.write(chunk)
+                rows += len(chunk)
+                if progress:
+                    progress(rows)
+            writer.close()
+        except BaseException:
+            cursor.close()
+            try:
+                writer.close()
+            finally:
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+        return ExportResult(path, rows, time.perf_counter() - started)
+
+
+def export_report(db, report_type, month, year, path, **kwargs):
+    with db.connection() as conn:
+        query, params = prepare_report(conn, report_type, month, year)
+        return export_query(conn, query, params, path, **kwargs)
+
+
+class ExportJob(ReportJob):
+    # Runs an export on a ReportRunner worker, cancellable like a report
+    def __init__(self, report_type, month, year, path):
+        super().__init__(report_type, month, year)
+        # Validate up front so bad input fails before reaching the worker
+        report_query(report_type, month, year)
+        writer_for(path)
+        self.path = path
+        self.rows_written = 0
+
+    def work(self, db, conn):
+        query, params = prepare_report(conn, self.report_type, self.month, self.year)
+        return export_query(conn, query, params, self.path,
+                            progress=self._progress,
+                            cancelled=lambda: self.cancelled)
+
+    def _progress(self, rows):
+        self.rows_written = rows
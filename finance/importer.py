@@ -0,0 +1,239 @@
+import csv
+import json
+import os
+import time
+from datetime import date
+
+from .archive import check_writable
+from .money import MINOR_UNITS, to_minor
+from .records import UPSERT_RECORD_SQL, normalize_amount, normalize_month, normalize_year
+from .rules import rules_for_period
+
+DEFAULT_CHUNK_SIZE = 5000
+
+MONEY_FIELDS = ("overtime_hours", "overtime_pay", "incentives", "advances", "loans")
+
+
+class ImportResult:
+    def __init__(self, path, imported, rejected, seconds, reject_path=None):
+        self.path = path
+        self.imported = imported
+        self.rejected = rejected
+        self.seconds = seconds
+        self.reject_path = reject_path
+
+    @property
+    def rows(self):
+        return self.imported + self.rejected
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else float("inf")
+
+    def __repr__(self):
+        return (f"ImportResult({self.path}: {self.imported} imported, {self.rejected} rejected "
+                f"in {self.seconds:.3f}s, {self.rows_per_second:,.0f} rows/s)")
+
+
+class _RejectWriter:
+    # Opens the reject file on the first bad row only
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._file = None
+        self._writer = None
+
+    def write(self, line, row, error):
+        if self._writer is None:
+            self._file = open(self.path, "w", newline="", encoding="utf-8")
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(["line", "error", *row.keys()])
+        self._writer.writerow([line, error, *row.values()])
+        self.count += 1
+
+    def close(self):
+        if self._file:
+            self._file.close()
+
+
+def iter_rows(path):
+    # Yields (line number, dict) pairs one at a time, whatever the file size
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".xlsx", ".xlsm"):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [_column_name(h) for h in next(rows, ())]
+            for line, values in enumerate(rows, start=2):
+                if all(v is None for v in values):
+                    continue
+                yield line, dict(zip(header, values))
+        finally:
+            workbook.close()
+    else:
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            reader = csv.DictReader(f)
+            reader.fieldnames = [_column_name(h) for h in reader.fieldnames or ()]
+            for row in reader:
+                yield reader.line_num, row
+
+
+def _column_name(header):
+    # "Base Salary" -> "base_salary", so files exported from the app load back
+    return str(header or "").strip().lower().replace(" ", "_")
+
+
+def _text(row, field):
+    value = row.get(field)
+    value = "" if value is None else str(value).strip()
+    if not value:
+        raise ValueError(f"Missing {field}")
+    return value
+
+
+def _number(row, field, default=0.0):
+    value = row.get(field)
+    if value is None or str(value).strip() == "":
+        return default
+    return normalize_amount(value, field)
+
+
+def _join_date(row):
+    value = row.get("join_date")
+    if isinstance(value, date):
+        return value.strftime("%Y-%m-%d")
+    try:
+        return date.fromisoformat(_text(row, "join_date")[:10]).isoformat()
+    except ValueError:
+        raise ValueError(f"Invalid join_date: {value!r}")
+
+
+def _chunks(rows, size):
+    chunk = []
+    for item in rows:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _run_import(db, path, chunk_size, reject_path, write_chunk):
+    reject_path = reject_path or f"{os.path.splitext(path)[0]}.rejects.csv"
+    rejects = _RejectWriter(reject_path)
+    imported = 0
+    started = time.perf_counter()
+    try:
+        # One transaction per chunk bounds memory and lock time; a crash
+        # part way keeps every chunk committed so far.
+        for chunk in _chunks(iter_rows(path), chunk_size):
+            with db.transaction() as conn:
+                imported += write_chunk(conn, chunk, rejects)
+    finally:
+        rejects.close()
+    return ImportResult(path, imported, rejects.count, time.perf_counter() - started,
+                        reject_path if rejects.count else None)
+
+
+def import_employees(db, path, chunk_size=DEFAULT_CHUNK_SIZE, reject_path=None):
+    # Columns: name, position, base_salary, join_date (YYYY-MM-DD). Existing
+    # names are looked up inside each chunk's transaction and SQLite assigns
+    # the ids, so employees added meanwhile by the GUI or the service are
+    # seen as duplicates rather than colliding with the import.
+    def write_chunk(conn, chunk, rejects):
+        wanted = json.dumps([str(row.get("name") or "").strip() for _, row in chunk])
+        names = {name for (name,) in conn.execute(
+            "SELECT name FROM employees WHERE name IN (SELECT value FROM json_each(?))",
+            (wanted,))}
+        batch = []
+        for line, row in chunk:
+            try:
+                name = _text(row, "name")
+                if name in names:
+                    raise ValueError(f"Employee already exists: {name}")
+                base_salary = _number(row, "base_salary", None)
+                if base_salary is None:
+                    raise ValueError("Missing base_salary")
+                batch.append((name, _text(row, "position"), to_minor(base_salary),
+                              _join_date(row)))
+            except ValueError as e:
+                rejects.write(line, row, str(e))
+                continue
+            names.add(name)
+        conn.executemany("""INSERT INTO employees (name, position, base_salary, join_date)
+                            VALUES (?, ?, ?, ?)""", batch)
+        return len(batch)
+
+    return _run_import(db, path, chunk_size, reject_path, write_chunk)
+
+
+def import_financial_records(db, path, chunk_size=DEFAULT_CHUNK_SIZE, reject_path=None):
+    # Columns: employee_id or name, month, year, and optionally base_salary,
+    # overtime_hours, overtime_pay, incentives, advances, loans, net_salary.
+    # Missing pay figures are computed the same way as a manual save.
+    with db.connection() as conn:
+        employees = conn.execute(
+            "SELECT id, name, base_salary, position FROM employees").fetchall()
+    ids_by_name = {name: emp_id for emp_id, name, _, _ in employees}
+    base_salaries = {emp_id: salary / MINOR_UNITS for emp_id, _, salary, _ in employees}
+    positions = {emp_id: position for emp_id, _, _, position in employees}
+
+    def resolve_employee(row):
+        if row.get("employee_id") not in (None, ""):
+            try:
+                emp_id = int(float(row["employee_id"]))
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid employee_id: {row['employee_id']!r}")
+            if emp_id not in base_salaries:
+                raise ValueError(f"Unknown employee_id: {emp_id}")
+            return emp_id
+        name = _text(row, "name")
+        if name not in ids_by_name:
+            raise ValueError(f"Unknown employee: {name}")
+        return ids_by_name[name]
+
+    def write_chunk(conn, chunk, rejects):
+        batch = []
+        for line, row in chunk:
+            try:
+                emp_id = resolve_employee(row)
+                month = normalize_month(_text(row, "month"))
+                year = normalize_year(_text(row, "year"))
+                check_writable(conn, year)
+                base_salary = _number(row, "base_salary", base_salaries[emp_id])
+                overtime_hours, overtime_pay, incentives, advances, loans = (
+                    _number(row, field, None) for field in MONEY_FIELDS)
+                rule = rules_for_period(conn, year, month).for_position(positions[emp_id])
+                computed_overtime, computed_net = rule.pay(
+                    base_salary, overtime_hours or 0.0, incentives or 0.0,
+                    advances or 0.0, loans or 0.0)
+                if overtime_pay is None:
+                    overtime_pay = computed_overtime
+                net_salary = row.get("net_salary")
+                if net_salary in (None, ""):
+                    net_salary = computed_net - computed_overtime + overtime_pay
+                else:
+                    try:
+                        net_salary = float(net_salary)
+                    except (TypeError, ValueError):
+                        raise ValueError(f"Invalid net_salary: {net_salary!r}")
+                record = (emp_id, month, year, to_minor(base_salary), overtime_hours or 0.0,
+                          to_minor(overtime_pay), to_minor(incentives or 0.0),
+                          to_minor(advances or 0.0), to_minor(loans or 0.0), to_minor(net_salary))
+            except ValueError as e:
+                rejects.write(line, row, str(e))
+                continue
+            batch.append(record)
+        conn.executemany(UPSERT_RECORD_SQL, batch)
+        return len(batch)
+
+    return _run_import(db, path, chunk_size, reject_path, write_chunk)
+
+
+IMPORTERS = {
+    "employees": import_employees,
+    "financial_records": import_financial_records,
+}
@@ -0,0 +1,302 @@
+from .cache import data_version_triggers
+from .money import round_minor, to_minor
+from .records import normalize_month, normalize_year
+from .summaries import compare_rows
+
+# Loans and salary advances with their repayment schedules. A loan is repaid
+# by a fixed installment every payroll month from its start month until the
+# principal is covered; an advance defaults to a single installment of the
+# whole amount. Payroll posts each month's installment to loan_repayments
+# and adds it to the record's loans/advances deduction.
+#
+# Balances are kept incrementally by triggers, in the same way as the report
+# summaries:
+#   loans.repaid                  sum of the loan's repayments
+#   loan_repayments.balance_after outstanding after that month (a stored
+#                                 running balance, so "as of" queries read
+#                                 one row per loan instead of the history)
+#   employee_loan_balances        principal and repaid per employee and kind,
+#                                 so "what does X still owe" is one lookup
+# All amounts are integer cents (finance.money), so a loan is repaid exactly
+# when repaid reaches principal.
+LOAN_KINDS = ("loan", "advance")
+
+LEDGER_TABLES = [
+    '''CREATE TABLE IF NOT EXISTS loans
+       (id INTEGER PRIMARY KEY,
+        employee_id INTEGER NOT NULL,
+        kind TEXT NOT NULL CHECK (kind IN ('loan', 'advance')),
+        principal INTEGER NOT NULL CHECK (principal > 0),
+        installment INTEGER NOT NULL CHECK (installment > 0),
+        start_year INTEGER NOT NULL,
+        start_month INTEGER NOT NULL,
+        repaid INTEGER NOT NULL DEFAULT 0,
+        issued_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        note TEXT)''',
+    '''CREATE INDEX IF NOT EXISTS idx_loans_employee ON loans (employee_id)''',
+    '''CREATE TABLE IF NOT EXISTS loan_repayments
+       (loan_id INTEGER NOT NULL,
+        year INTEGER NOT NULL,
+        month INTEGER NOT NULL,
+        amount INTEGER NOT NULL,
+        balance_after INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (loan_id, year, month)) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS employee_loan_balances
+       (employee_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        principal INTEGER NOT NULL,
+        repaid INTEGER NOT NULL,
+        PRIMARY KEY (employee_id, kind)) WITHOUT ROWID''',
+]
+
+# {row} is NEW or OLD inside a trigger body
+_ADD_EMPLOYEE_BALANCE = '''
+    INSERT INTO employee_loan_balances (employee_id, kind, principal, repaid)
+    VALUES ({row}.employee_id, {row}.kind, {row}.principal, {row}.repaid)
+    ON CONFLICT (employee_id, kind) DO UPDATE SET
+        principal = principal + excluded.principal,
+        repaid = repaid + excluded.repaid;
+'''
+
+_REMOVE_EMPLOYEE_BALANCE = '''
+    UPDATE employee_loan_balances SET
+        principal = principal - {row}.principal,
+        repaid = repaid - {row}.repaid
+    WHERE employee_id = {row}.employee_id AND kind = {row}.kind;
+    DELETE FROM employee_loan_balances
+    WHERE employee_id = {row}.employee_id AND kind = {row}.kind AND principal <= 0;
+'''
+
+LEDGER_TRIGGERS = [
+    # A repayment moves the loan's total and every later month's balance
+    '''CREATE TRIGGER IF NOT EXISTS loan_repayments_insert
+        AFTER INSERT ON loan_repayments
+        BEGIN
+            UPDATE loans SET repaid = repaid + NEW.amount WHERE id = NEW.loan_id;
+            UPDATE loan_repayments SET balance_after = balance_after - NEW.amount
+            WHERE loan_id = NEW.loan_id AND (year, month) > (NEW.year, NEW.month);
+            UPDATE loan_repayments SET balance_after = COALESCE(
+                (SELECT p.balance_after FROM loan_repayments p
+                 WHERE p.loan_id = NEW.loan_id AND (p.year, p.month) < (NEW.year, NEW.month)
+                 ORDER BY p.year DESC, p.month DESC LIMIT 1),
+                (SELECT principal FROM loans WHERE id = NEW.loan_id)) - NEW.amount
+            WHERE loan_id = NEW.loan_id AND year = NEW.year AND month = NEW.month;
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS loan_repayments_update
+        AFTER UPDATE OF amount ON loan_repayments
+        BEGIN
+            UPDATE loans SET repaid = repaid + NEW.amount - OLD.amount WHERE id = NEW.loan_id;
+            UPDATE loan_repayments SET balance_after = balance_after - (NEW.amount - OLD.amount)
+            WHERE loan_id = NEW.loan_id AND (year, month) >= (NEW.year, NEW.month);
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS loan_repayments_delete
+        AFTER DELETE ON loan_repayments
+        BEGIN
+            UPDATE loans SET repaid = repaid - OLD.amount WHERE id = OLD.loan_id;
+            UPDATE loan_repayments SET balance_after = balance_after + OLD.amount
+            WHERE loan_id = OLD.loan_id AND (year, month) > (OLD.year, OLD.month);
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS loans_balance_insert
+        AFTER INSERT ON loans
+        BEGIN {_ADD_EMPLOYEE_BALANCE.format(row="NEW")} END''',
+    f'''CREATE TRIGGER IF NOT EXISTS loans_balance_update
+        AFTER UPDATE OF employee_id, kind, principal, repaid ON loans
+        BEGIN
+            {_REMOVE_EMPLOYEE_BALANCE.format(row="OLD")}
+            {_ADD_EMPLOYEE_BALANCE.format(row="NEW")}
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS loans_principal_update
+        AFTER UPDATE OF principal ON loans
+        WHEN NEW.principal <> OLD.principal
+        BEGIN
+            UPDATE loan_repayments SET balance_after = balance_after + NEW.principal - OLD.principal
+            WHERE loan_id = NEW.id;
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS loans_balance_delete
+        AFTER DELETE ON loans
+        BEGIN
+            {_REMOVE_EMPLOYEE_BALANCE.format(row="OLD")}
+            DELETE FROM loan_repayments WHERE loan_id = OLD.id;
+        END''',
+] + data_version_triggers("loans", "loans") + data_version_triggers("loan_repayments", "loans")
+
+# Open loans and what each owes for a payroll month. A month that already
+# has a repayment posted (a re-run) counts it as still outstanding, so
+# re-running a month recomputes the same installment.
+SCHEDULED_SQL = '''
+    SELECT l.id, l.employee_id, l.kind,
+           MIN(l.installment, l.principal - l.repaid + COALESCE(r.amount, 0))
+    FROM loans l
+    LEFT JOIN loan_repayments r
+        ON r.loan_id = l.id AND r.year = :year AND r.month = :month
+    WHERE (l.start_year, l.start_month) <= (:year, :month)
+      AND l.principal - l.repaid + COALESCE(r.amount, 0) > 0
+'''
+
+POST_REPAYMENT_SQL = '''
+    INSERT INTO loan_repayments (loan_id, year, month, amount) VALUES (?, ?, ?, ?)
+    ON CONFLICT (loan_id, year, month) DO UPDATE SET amount = excluded.amount
+    WHERE amount <> excluded.amount
+'''
+
+# Balances at the end of a month from the stored running balances: one
+# index seek per loan rather than a sum over its repayment history
+OUTSTANDING_AS_OF_SQL = '''
+    SELECT l.employee_id, l.kind,
+           COALESCE((SELECT r.balance_after FROM loan_repayments r
+                     WHERE r.loan_id = l.id AND (r.year, r.month) <= (:year, :month)
+                     ORDER BY r.year DESC, r.month DESC LIMIT 1),
+                    l.principal) AS outstanding
+    FROM loans l
+    WHERE (l.start_year, l.start_month) <= (:year, :month)
+'''
+
+
+def create_ledger(conn):
+    for statement in LEDGER_TABLES + LEDGER_TRIGGERS:
+        conn.execute(statement)
+    _rebuild(conn)
+
+
+def _amount(value, name):
+    # Currency units in, cents out
+    try:
+        value = to_minor(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name}: {value!r}")
+    if value <= 0:
+        raise ValueError(f"{name.capitalize()} must be a positive amount")
+    return value
+
+
+def write_loan(conn, employee_id, kind, principal, start_month, start_year,
+               installment=None, note=None):
+    # Inserts inside the caller's transaction; returns the new loan id.
+    # Amounts are in currency units.
+    if kind not in LOAN_KINDS:
+        raise ValueError(f"Unknown kind: {kind!r} (expected loan or advance)")
+    principal = _amount(principal, "principal")
+    if installment in (None, ""):
+        if kind == "loan":
+            raise ValueError("Loans need a monthly installment")
+        installment = principal
+    else:
+        installment = _amount(installment, "installment")
+    if not conn.execute("SELECT 1 FROM employees WHERE id = ?", (employee_id,)).fetchone():
+        raise ValueError("Employee not found in database")
+    cursor = conn.execute("""INSERT INTO loans (employee_id, kind, principal, installment,
+                                                start_year, start_month, note)
+                             VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                          (employee_id, kind, principal, installment,
+                           normalize_year(start_year), normalize_month(start_month), note))
+    return cursor.lastrowid
+
+
+def issue_loan(db, employee_id, kind, principal, start_month, start_year,
+               installment=None, note=None):
+    with db.transaction() as conn:
+        return write_loan(conn, employee_id, kind, principal, start_month, start_year,
+                          installment, note)
+
+
+def scheduled_deductions(conn, year, month, employee_id=None):
+    # [(loan_id, employee_id, kind, cents)] due in a payroll month
+    sql, params = SCHEDULED_SQL, {"year": year, "month": month}
+    if employee_id is not None:
+        sql += " AND l.employee_id = :employee_id"
+        params["employee_id"] = employee_id
+    return conn.execute(sql, params).fetchall()
+
+
+def post_repayments(conn, year, month, repayments):
+    # repayments: (loan_id, cents) pairs; re-posting a month replaces it
+    conn.executemany(POST_REPAYMENT_SQL, ((loan_id, year, month, round_minor(amount))
+                                          for loan_id, amount in repayments))
+
+
+def repayment_share(gross, net, requested):
+    # Fraction of the requested deductions actually taken from pay; below 1
+    # when the pay rule caps deductions, and repayments shrink to match
+    if requested <= 0:
+        return 1.0
+    return min(1.0, (gross - net) / requested)
+
+
+def outstanding_balance(db, employee_id):
+    # {"loan": amount, "advance": amount} from the maintained balances
+    rows = db.execute("""SELECT kind, principal - repaid FROM employee_loan_balances
+                         WHERE employee_id = ?""", (employee_id,))
+    balances = dict.fromkeys(LOAN_KINDS, 0.0)
+    balances.update({kind: max(amount, 0) / 100 for kind, amount in rows})
+    return balances
+
+
+def employee_loans(db, employee_id):
+    # Amounts in currency units
+    return db.execute("""SELECT id, kind, principal / 100.0 AS principal,
+                                installment / 100.0 AS installment, repaid / 100.0 AS repaid,
+                                (principal - repaid) / 100.0 AS outstanding,
+                                start_year, start_month, issued_at, note
+                         FROM loans WHERE employee_id = ?
+                         ORDER BY start_year DESC, start_month DESC, id DESC""",
+                      (employee_id,))
+
+
+def loan_statement(db, loan_id):
+    # (year, month, amount, balance_after) for every posted month
+    return db.execute("""SELECT year, month, amount / 100.0 AS amount,
+                                balance_after / 100.0 AS balance_after
+                         FROM loan_repayments
+                         WHERE loan_id = ? ORDER BY year, month""", (loan_id,))
+
+
+# The maintained columns computed from scratch
+_REPAID_FROM_REPAYMENTS = '''
+    SELECT l.id AS id, COALESCE(SUM(r.amount), 0) AS repaid
+    FROM loans l LEFT JOIN loan_repayments r ON r.loan_id = l.id
+    GROUP BY l.id
+'''
+
+_BALANCES_FROM_LOANS = '''
+    SELECT employee_id, kind, SUM(principal), SUM(repaid)
+    FROM loans GROUP BY employee_id, kind
+'''
+
+_RUNNING_BALANCES = '''
+    SELECT r.loan_id AS loan_id, r.year AS year, r.month AS month,
+           l.principal - SUM(r.amount) OVER (PARTITION BY r.loan_id ORDER BY r.year, r.month)
+               AS balance
+    FROM loan_repayments r JOIN loans l ON l.id = r.loan_id
+'''
+
+
+def _rebuild(conn):
+    conn.execute(f"""UPDATE loans SET repaid = t.repaid
+                     FROM ({_REPAID_FROM_REPAYMENTS}) AS t
+                     WHERE loans.id = t.id""")
+    conn.execute("DELETE FROM employee_loan_balances")
+    conn.execute(f"INSERT INTO employee_loan_balances {_BALANCES_FROM_LOANS}")
+    conn.execute(f"""UPDATE loan_repayments SET balance_after = t.balance
+                     FROM ({_RUNNING_BALANCES}) AS t
+                     WHERE loan_repayments.loan_id = t.loan_id
+                       AND loan_repayments.year = t.year
+                       AND loan_repayments.month = t.month""")
+
+
+def rebuild_ledger(db):
+    with db.transaction() as conn:
+        _rebuild(conn)
+
+
+def verify_ledger(db):
+    # Returns (table, key, expected, stored) for every maintained value that
+    # disagrees with the raw loans and repayments; empty means consistent
+    with db.connection() as conn:
+        problems = compare_rows(conn, "loans.repaid", _REPAID_FROM_REPAYMENTS,
+                                "SELECT id, repaid FROM loans", 1)
+        problems += compare_rows(conn, "employee_loan_balances", _BALANCES_FROM_LOANS,
+                                 "SELECT * FROM employee_loan_balances", 2)
+        problems += compare_rows(conn, "loan_repayments.balance_after", _RUNNING_BALANCES,
+                                 "SELECT loan_id, year, month, balance_after "
+                                 "FROM loan_repayments", 3)
+    return problems
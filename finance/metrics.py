@@ -0,0 +1,286 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime
+from functools import wraps
+
+# Lightweight timing of SQL statements, reports, exports, screens and HTTP
+# requests into in-memory histograms. Off by default: set
+# EMPLOYEE_FINANCE_METRICS=1, pass --metrics to the CLI or tick the box on
+# the admin Diagnostics screen. While off, timed() code pays one attribute
+# check, and connections are plain sqlite3 connections.
+#
+# SQL is timed by InstrumentedConnection (Database.connect uses it while
+# metrics are on): a statement's time runs from execute() until its cursor
+# is exhausted, closed, re-executed or dropped, so fetchone/fetchmany/
+# fetchall are included; rows read by iterating the cursor are not.
+# Statements slower than slow_query_ms are logged with their EXPLAIN QUERY
+# PLAN, captured on the same connection with the same parameters.
+
+# Histogram bucket upper bounds in milliseconds; slower samples land in +Inf
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+SLOW_QUERY_MS = float(os.environ.get("EMPLOYEE_FINANCE_SLOW_MS", 100))
+SLOW_LOG_SIZE = 50
+# Statements are grouped by their text, whitespace collapsed and cut here
+SQL_NAME_LENGTH = 160
+
+_WHITESPACE = re.compile(r"\s+")
+# Only these are explained: EXPLAIN of some PRAGMAs has side effects
+_EXPLAINABLE = re.compile(r"\s*(SELECT|WITH|INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "total_ms", "max_ms")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def percentile(self, q):
+        # Upper bound of the bucket holding the q-th sample, capped at the max
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.counts):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "total_ms": self.total_ms,
+            "mean_ms": self.total_ms / self.count if self.count else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "max_ms": self.max_ms,
+            "buckets": dict(zip([*map(str, BUCKETS_MS), "+Inf"], self.counts)),
+        }
+
+
+class Metrics:
+    def __init__(self, enabled=False, slow_query_ms=SLOW_QUERY_MS):
+        self.enabled = enabled
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._slow = deque(maxlen=SLOW_LOG_SIZE)
+
+    def observe(self, kind, name, ms):
+        with self._lock:
+            histogram = self._histograms.get((kind, name))
+            if histogram is None:
+                histogram = self._histograms[(kind, name)] = Histogram()
+            histogram.observe(ms)
+
+    def observe_sql(self, conn, sql, params, ms, many=False):
+        name = _WHITESPACE.sub(" ", sql).strip()[:SQL_NAME_LENGTH]
+        self.observe("sql", name, ms)
+        if ms >= self.slow_query_ms:
+            plan = None if many else explain(conn, sql, params)
+            with self._lock:
+                self._slow.append({"ms": ms, "sql": _WHITESPACE.sub(" ", sql).strip(),
+                                   "plan": plan,
+                                   "at": datetime.now().isoformat(timespec="seconds")})
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._slow.clear()
+
+    def slowest(self, limit=50, kind=None):
+        # (kind, name, histogram dict), slowest single sample first
+        with self._lock:
+            items = [(k, n, h.as_dict()) for (k, n), h in self._histograms.items()
+                     if kind is None or k == kind]
+        items.sort(key=lambda item: item[2]["max_ms"], reverse=True)
+        return items[:limit]
+
+    def slow_queries(self):
+        with self._lock:
+            return sorted(self._slow, key=lambda entry: entry["ms"], reverse=True)
+
+    def snapshot(self):
+        with self._lock:
+            timings = [{"kind": k, "name": n, **h.as_dict()}
+                       for (k, n), h in sorted(self._histograms.items())]
+            slow = list(self._slow)
+        return {"enabled": self.enabled, "slow_query_ms": self.slow_query_ms,
+                "timings": timings, "slow_queries": slow}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        # Text exposition format; durations in seconds as Prometheus expects
+        lines = ["# HELP finance_duration_seconds Time spent per operation",
+                 "# TYPE finance_duration_seconds histogram"]
+        with self._lock:
+            items = sorted((k, n, list(h.counts), h.count, h.total_ms)
+                           for (k, n), h in self._histograms.items())
+        for kind, name, counts, count, total_ms in items:
+            labels = f'kind="{_label(kind)}",name="{_label(name)}"'
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS_MS, counts):
+                cumulative += bucket
+                lines.append(f'finance_duration_seconds_bucket{{{labels},le="{bound / 1000:g}"}} '
+                             f"{cumulative}")
+            lines.append(f'finance_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"finance_duration_seconds_sum{{{labels}}} {total_ms / 1000:.6f}")
+            lines.append(f"finance_duration_seconds_count{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        # .prom or .txt for Prometheus text, anything else JSON
+        text = (self.to_prometheus() if os.path.splitext(path)[1].lower() in (".prom", ".txt")
+                else self.to_json())
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+def _label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+metrics = Metrics(enabled=os.environ.get("EMPLOYEE_FINANCE_METRICS") == "1")
+
+
+class timed:
+    # Times a block (with timed(kind, name): ...) or, as a decorator, every
+    # call of a function, under the function's name unless one is given
+    __slots__ = ("kind", "name", "_started")
+
+    def __init__(self, kind, name=None):
+        self.kind = kind
+        self.name = name
+        self._started = None
+
+    def __enter__(self):
+        self._started = time.perf_counter() if metrics.enabled else None
+        return self
+
+    def __exit__(self, *exc):
+        if self._started is not None:
+            metrics.observe(self.kind, self.name, (time.perf_counter() - self._started) * 1000)
+
+    def __call__(self, func):
+        kind, name = self.kind, self.name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.observe(kind, name, (time.perf_counter() - started) * 1000)
+        return wrapper
+
+
+def explain(conn, sql, params=()):
+    # EXPLAIN QUERY PLAN details, or None for statements that have no plan.
+    # A plain cursor keeps the EXPLAIN itself out of the timings.
+    if not _EXPLAINABLE.match(sql):
+        return None
+    try:
+        cursor = sqlite3.Cursor(conn)
+        rows = cursor.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    except sqlite3.Error:
+        return None
+    return [row[-1] for row in rows] or None
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    _sql = None
+
+    def execute(self, sql, params=()):
+        self._finish()
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            self._sql, self._params, self._many = sql, params, False
+            self._elapsed = time.perf_counter() - started
+
+    def executemany(self, sql, seq_of_params):
+        self._finish()
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_params)
+        finally:
+            self._sql, self._params, self._many = sql, (), True
+            self._elapsed = time.perf_counter() - started
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._elapsed += time.perf_counter() - started
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        started = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._elapsed += time.perf_counter() - started
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._elapsed += time.perf_counter() - started
+        self._finish()
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+    def _finish(self):
+        if self._sql is None:
+            return
+        sql, self._sql = self._sql, None
+        if metrics.enabled:
+            metrics.observe_sql(self.connection, sql, self._params, self._elapsed * 1000,
+                                self._many)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    # Every statement runs on an InstrumentedCursor
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            if metrics.enabled:
+                metrics.observe("sql", "COMMIT", (time.perf_counter() - started) * 1000)
@@ -0,0 +1,174 @@
+import os
+
+from .archive import convert_archives_to_minor_units, create_archive_registry
+from .cache import create_data_versions
+from .ledger import create_ledger
+from .money import MONEY_COLUMNS, rebuild_in_minor_units
+from .records import normalize_month
+from .rules import create_pay_rules
+from .search import create_search_index
+from .summaries import create_summaries
+
+# Versioned schema migrations, applied in order on top of the base tables
+# created by init_database. The applied version lives in PRAGMA user_version
+# so existing database files are upgraded in place the next time they open.
+# A migration may return a callable, run once its transaction has committed
+# (e.g. to delete files it replaced).
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def register(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+    return register
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def latest_version():
+    return MIGRATIONS[-1][0]
+
+
+def migrate(db, target=None):
+    target = latest_version() if target is None else target
+    # An up-to-date file is only read, so starting up never takes the write lock
+    with db.connection() as conn:
+        version = current_version(conn)
+    if version >= target:
+        return []
+
+    applied = []
+    for version, description, func in MIGRATIONS:
+        if version > target:
+            break
+        # Each migration runs in its own transaction together with the
+        # version bump, so a failure leaves the file at the last good version.
+        # The version is checked again under the lock in case another
+        # process got there first.
+        with db.transaction() as conn:
+            if current_version(conn) >= version:
+                continue
+            after_commit = func(conn)
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+        if after_commit is not None:
+            after_commit()
+        applied.append((version, description))
+    return applied
+
+
+def _month_or_zero(value):
+    # Months that cannot be parsed are kept as 0 instead of losing the row
+    try:
+        return normalize_month(value)
+    except ValueError:
+        return 0
+
+
+@migration(1, "Integer month and unique (employee_id, year, month) on financial_records")
+def _normalize_financial_records(conn):
+    conn.create_function("normalize_month", 1, _month_or_zero, deterministic=True)
+
+    conn.execute('''CREATE TABLE financial_records_new
+                    (id INTEGER PRIMARY KEY,
+                     employee_id INTEGER,
+                     month INTEGER NOT NULL,
+                     year INTEGER NOT NULL,
+                     base_salary REAL NOT NULL,
+                     overtime_hours REAL DEFAULT 0,
+                     overtime_pay REAL DEFAULT 0,
+                     incentives REAL DEFAULT 0,
+                     advances REAL DEFAULT 0,
+                     loans REAL DEFAULT 0,
+                     net_salary REAL NOT NULL,
+                     UNIQUE (employee_id, year, month),
+                     FOREIGN KEY (employee_id) REFERENCES employees (id))''')
+
+    # Duplicated periods keep their most recently saved row
+    conn.execute('''INSERT INTO financial_records_new
+                    SELECT id, employee_id, normalize_month(month), CAST(year AS INTEGER),
+                           base_salary, overtime_hours, overtime_pay, incentives,
+                           advances, loans, net_salary
+                    FROM financial_records
+                    WHERE id IN (SELECT MAX(id) FROM financial_records
+                                 GROUP BY employee_id, CAST(year AS INTEGER),
+                                          normalize_month(month))''')
+
+    conn.execute("DROP TABLE financial_records")
+    conn.execute("ALTER TABLE financial_records_new RENAME TO financial_records")
+
+
+@migration(2, "Covering indexes for the report queries")
+def _add_report_indexes(conn):
+    # Monthly Payroll and Department Summary filter on (year, month), Employee
+    # Summary on year alone; all three read only these columns, so the index
+    # answers them without touching the table. The dashboard history query is
+    # served by the UNIQUE (employee_id, year, month) index from migration 1.
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_financial_records_period
+                    ON financial_records (year, month, employee_id, base_salary,
+                                          overtime_pay, incentives, advances,
+                                          loans, net_salary)''')
+    conn.execute("ANALYZE")
+
+
+@migration(3, "Trigger-maintained summary tables for the summary reports")
+def _add_summary_tables(conn):
+    create_summaries(conn)
+
+
+@migration(4, "Data version counters for report cache invalidation")
+def _add_data_versions(conn):
+    create_data_versions(conn)
+
+
+@migration(5, "Full-text search index over employee name and position")
+def _add_employee_search(conn):
+    create_search_index(conn)
+
+
+@migration(6, "Versioned pay rules")
+def _add_pay_rules(conn):
+    create_pay_rules(conn)
+
+
+@migration(7, "Loan and advance ledger with maintained balances")
+def _add_ledger(conn):
+    create_ledger(conn)
+
+
+@migration(8, "Registry of years archived to separate files")
+def _add_archive_registry(conn):
+    create_archive_registry(conn)
+
+
+@migration(9, "Money as integer minor units (cents)")
+def _money_in_minor_units(conn):
+    # Every trigger goes first: they mention the tables being rebuilt, and
+    # the rebuilds must not fire them. The maintained tables are then
+    # recreated with INTEGER totals and refilled from the converted rows.
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall():
+        conn.execute(f"DROP TRIGGER {name}")
+    for table in MONEY_COLUMNS:
+        rebuild_in_minor_units(conn, table)
+    for table in ("employee_year_summary", "position_month_summary", "employee_loan_balances"):
+        conn.execute(f"DROP TABLE {table}")
+
+    create_summaries(conn)
+    create_ledger(conn)
+    create_data_versions(conn)
+    create_search_index(conn)
+    # Cached reports from before hold the same figures, but start afresh
+    conn.execute("UPDATE data_versions SET version = version + 1")
+
+    replaced = convert_archives_to_minor_units(conn)
+
+    def remove_replaced_archives():
+        for path in replaced:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    return remove_replaced_archives
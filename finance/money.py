@@ -0,0 +1,115 @@
+import math
+import re
+
+# Money is stored as whole minor units (cents) in INTEGER columns, so sums in
+# SQL and in the summary triggers are exact however many rows they add up.
+# Amounts are converted at the edges: user input, CSV imports and pay-rule
+# results go in through to_minor, and queries that hand amounts to people
+# divide by 100.0 in SQL (or format_minor in Python). Pay rules still work in
+# currency units; what they return is rounded to the cent before it is
+# stored.
+MINOR_UNITS = 100
+
+# Every stored money column, by table
+MONEY_COLUMNS = {
+    "employees": ("base_salary",),
+    "financial_records": ("base_salary", "overtime_pay", "incentives", "advances",
+                          "loans", "net_salary"),
+    "loans": ("principal", "installment", "repaid"),
+    "loan_repayments": ("amount", "balance_after"),
+}
+
+
+def round_minor(value):
+    # Half away from zero, as on a payslip. The inner round() drops binary
+    # noise first, so 1.005 * 100 (100.49999...) still rounds to 101.
+    value = round(value, 6)
+    return int(math.copysign(math.floor(abs(value) + 0.5), value))
+
+
+def to_minor(amount):
+    # 1234.5, "1234.50" or 1234 -> 123450
+    try:
+        value = float(amount)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid amount: {amount!r}")
+    if not math.isfinite(value):
+        raise ValueError(f"Invalid amount: {amount!r}")
+    return round_minor(value * MINOR_UNITS)
+
+
+def from_minor(minor):
+    # 123456 -> 1234.56, for numbers handed on as currency units (e.g. a
+    # spreadsheet cell); one division, so the float is the nearest to the
+    # exact amount
+    return (minor or 0) / MINOR_UNITS
+
+
+def to_minor_array(amounts):
+    # to_minor over a NumPy array (or anything array-like), as int64
+    import numpy as np
+
+    values = np.round(np.asarray(amounts, dtype=np.float64) * MINOR_UNITS, 6)
+    return (np.sign(values) * np.floor(np.abs(values) + 0.5)).astype(np.int64)
+
+
+def sum_minor_by(codes, minor, size):
+    # Exact totals of int64 cents per group code. bincount adds in float64,
+    # which is exact while no running total can pass 2**53 cents; past that
+    # the slower np.add.at adds in int64.
+    import numpy as np
+
+    minor = np.asarray(minor, dtype=np.int64)
+    if np.abs(minor).sum(dtype=np.float64) < 2 ** 52:
+        return np.bincount(codes, weights=minor, minlength=size).astype(np.int64)
+    totals = np.zeros(size, dtype=np.int64)
+    np.add.at(totals, codes, minor)
+    return totals
+
+
+def format_minor(minor):
+    # 123456 -> "1,234.56", exact for any number of cents
+    minor = int(minor or 0)
+    units, cents = divmod(abs(minor), MINOR_UNITS)
+    return f"{'-' if minor < 0 else ''}{units:,}.{cents:02d}"
+
+
+def _to_minor_or_null(value):
+    return None if value is None else to_minor(value)
+
+
+def rebuild_in_minor_units(conn, table, columns=None):
+    # SQLite cannot change a column's type in place. Creates the table again
+    # from its own DDL with the money columns as INTEGER, copies every row
+    # across in cents and puts its indexes back. Triggers that mention the
+    # table have to be dropped first and recreated afterwards. Tables whose
+    # money columns are INTEGER already (created by newer code) are left.
+    # Registers a to_minor() SQL function on conn.
+    columns = MONEY_COLUMNS[table] if columns is None else columns
+    types = {row[1]: row[2].upper() for row in conn.execute(f"PRAGMA table_info({table})")}
+    conn.create_function("to_minor", 1, _to_minor_or_null, deterministic=True)
+    if all(types.get(column) == "INTEGER" for column in columns):
+        return
+    ddl = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                       (table,)).fetchone()[0]
+    indexes = [sql for (sql,) in conn.execute(
+        """SELECT sql FROM sqlite_master
+           WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL""", (table,))]
+
+    for column in columns:
+        ddl, found = re.subn(rf"\b({column}\s+)REAL\b", r"\1INTEGER", ddl, flags=re.IGNORECASE)
+        if not found:
+            raise ValueError(f"{table}.{column} is not a REAL column")
+    ddl, found = re.subn(rf"^CREATE TABLE\s+[\"'`\[]?{table}[\"'`\]]?",
+                         f"CREATE TABLE {table}_new", ddl, flags=re.IGNORECASE)
+    if not found:
+        raise ValueError(f"Unexpected definition of {table}")
+
+    names = list(types)
+    values = ", ".join(f"to_minor({name})" if name in columns else name for name in names)
+    conn.execute(ddl)
+    conn.execute(f"INSERT INTO {table}_new ({', '.join(names)}) SELECT {values} FROM {table}")
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+    for statement in indexes:
+        conn.execute(statement)
@@ -0,0 +1,384 @@
+import multiprocessing
+import os
+import re
+import sqlite3
+import struct
+import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+
+from .archive import records_schema
+from .metrics import timed
+from .money import from_minor, to_minor
+from .records import normalize_year
+from .reports import ReportCancelled, ReportJob, prepare_report
+
+# The year-end pack: every month's Monthly Payroll, the Employee Summary and
+# one sheet per department in a single .xlsx, behind a Summary sheet (totals
+# per month) and a Departments sheet (salary per department and month, from
+# the monthly Department Summary reports).
+#
+# Each query runs in a worker process on its own read-only connection, and
+# the worker also renders its rows as finished worksheet XML: turning cells
+# into XML is most of the cost of a workbook, so it has to happen in parallel
+# for the pack to scale with cores. So is compressing it, so workers hand
+# back deflated parts and the parent only appends them to the .xlsx (a zip)
+# in whatever order they arrive. That is why the pack writes SpreadsheetML
+# and the zip container itself instead of going through openpyxl and
+# zipfile like a single-sheet export.
+
+DEPARTMENT_SQL = """
+    SELECT e.name, f.month, f.base_salary / 100.0 AS base_salary,
+           f.overtime_pay / 100.0 AS overtime_pay, f.incentives / 100.0 AS incentives,
+           f.advances / 100.0 AS advances, f.loans / 100.0 AS loans,
+           f.net_salary / 100.0 AS net_salary
+    FROM employees e
+    JOIN {schema}.financial_records f ON e.id = f.employee_id
+    WHERE f.year = ? AND e.position = ?
+    ORDER BY e.name, f.month
+"""
+
+PACK_DEPARTMENTS_SQL = """
+    SELECT DISTINCT position FROM {schema}.position_month_summary
+    WHERE year = ? ORDER BY position
+"""
+
+# Money columns of Monthly Payroll, totalled per month on the Summary sheet
+PAYROLL_TOTALS = ("base_salary", "overtime_pay", "incentives", "advances", "loans",
+                  "net_salary")
+
+# Excel limits sheet names to 31 characters and forbids []:*?/\
+SHEET_NAME_LENGTH = 31
+_SHEET_NAME_INVALID = re.compile(r"[\[\]:*?/\\]")
+# Control characters other than tab and newlines are not allowed in XML
+_XML_INVALID = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+_XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+# zlib level for the parts; several times faster than the default for files
+# a little larger
+PACK_COMPRESSLEVEL = 1
+# Without ZIP64 records every offset and size must fit in 32 bits
+ZIP_LIMIT = 0xFFFFFFFF
+
+_conn = None
+
+
+class PackResult:
+    def __init__(self, path, sheets, rows, seconds, workers):
+        self.path = path
+        self.sheets = sheets
+        self.rows = rows
+        self.seconds = seconds
+        self.workers = workers
+
+    def __repr__(self):
+        return (f"PackResult({self.path}: {self.sheets} sheets, {self.rows} rows "
+                f"in {self.seconds:.3f}s on {self.workers} workers)")
+
+
+def _column_letters(count):
+    letters = []
+    for i in range(count):
+        name, n = "", i + 1
+        while n:
+            n, r = divmod(n - 1, 26)
+            name = chr(65 + r) + name
+        letters.append(name)
+    return letters
+
+
+def sheet_xml(columns, rows):
+    # One worksheet part: a header row, then the rows. Strings are inline so
+    # sheets need no shared string table and can be rendered independently.
+    letters = _column_letters(len(columns))
+    parts = [_XML_DECLARATION, f'<worksheet xmlns="{_MAIN_NS}"><sheetData>']
+    for n, row in enumerate([columns, *rows], start=1):
+        parts.append(f'<row r="{n}">')
+        for letter, value in zip(letters, row):
+            if value is None:
+                continue
+            if isinstance(value, str):
+                text = escape(_XML_INVALID.sub("", value))
+                parts.append(f'<c r="{letter}{n}" t="inlineStr"><is><t>{text}</t></is></c>')
+            else:
+                parts.append(f'<c r="{letter}{n}"><v>{value!r}</v></c>')
+        parts.append("</row>")
+    parts.append("</sheetData></worksheet>")
+    return "".join(parts).encode("utf-8")
+
+
+def deflate_part(data):
+    # (raw deflate stream, CRC-32, uncompressed size) of one package part
+    compressor = zlib.compressobj(PACK_COMPRESSLEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(), zlib.crc32(data), len(data)
+
+
+class PackageWriter:
+    # Appends already-deflated parts to a zip file; the central directory is
+    # written on close.
+    _DOS_DATE = 0x21  # 1980-01-01
+
+    def __init__(self, path):
+        self._file = open(path, "wb")
+        self._entries = []
+
+    def write(self, name, part):
+        compressed, crc, size = part
+        name = name.encode("utf-8")
+        offset = self._file.tell()
+        if max(offset + len(compressed), size) > ZIP_LIMIT:
+            raise ValueError("The annual pack is too large for an .xlsx file")
+        self._file.write(struct.pack("<IHHHHHIIIHH", 0x04034B50, 20, 0, 8, 0, self._DOS_DATE,
+                                     crc, len(compressed), size, len(name), 0))
+        self._file.write(name)
+        self._file.write(compressed)
+        self._entries.append((name, crc, len(compressed), size, offset))
+
+    def close(self):
+        start = self._file.tell()
+        for name, crc, compressed_size, size, offset in self._entries:
+            self._file.write(struct.pack("<IHHHHHHIIIHHHHHII", 0x02014B50, 20, 20, 0, 8, 0,
+                                         self._DOS_DATE, crc, compressed_size, size,
+                                         len(name), 0, 0, 0, 0, 0, offset))
+            self._file.write(name)
+        end = self._file.tell()
+        self._file.write(struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, len(self._entries),
+                                     len(self._entries), end - start, start, 0))
+        self._file.close()
+
+    def abort(self):
+        self._file.close()
+
+
+def _open_readonly(path):
+    conn = sqlite3.connect(f"file:{quote(os.path.abspath(path))}?mode=ro", uri=True,
+                           isolation_level=None)
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA cache_size=-20000")
+    return conn
+
+
+def _init_worker(path):
+    # One read-only connection per worker process, reused for every task
+    global _conn
+    _conn = _open_readonly(path)
+
+
+def _run_task(task):
+    # Runs in a worker: (kind, key, year) -> (task, deflated sheet, rows, extra).
+    # extra is the month's totals for Monthly Payroll and (department,
+    # employees, total) for Department Summary, whose only use is the
+    # Departments sheet. Totals are exact sums in cents (finance.money); the
+    # reports show currency units, which to_minor turns back into cents.
+    kind, key, year = task
+    if kind == "department":
+        schema = records_schema(_conn, year)
+        cursor = _conn.execute(DEPARTMENT_SQL.format(schema=schema), (year, key))
+    else:
+        query, params = prepare_report(_conn, kind, key or 1, year)
+        cursor = _conn.execute(query, params)
+    columns = [d[0] for d in cursor.description]
+    rows = cursor.fetchall()
+    if kind == "Department Summary":
+        return task, None, len(rows), [(department, employees, to_minor(total))
+                                       for department, employees, _, total in rows]
+    extra = None
+    if kind == "Monthly Payroll":
+        indexes = [columns.index(c) for c in PAYROLL_TOTALS]
+        extra = [len(rows)] + [sum(to_minor(row[i] or 0) for row in rows) for i in indexes]
+    return task, deflate_part(sheet_xml(columns, rows)), len(rows), extra
+
+
+def sheet_name(text, taken):
+    name = _SHEET_NAME_INVALID.sub("_", text)[:SHEET_NAME_LENGTH]
+    candidate, n = name, 2
+    while candidate.lower() in taken:
+        suffix = f" ({n})"
+        candidate = name[:SHEET_NAME_LENGTH - len(suffix)] + suffix
+        n += 1
+    taken.add(candidate.lower())
+    return candidate
+
+
+def pack_tasks(conn, year):
+    # (task, sheet title) in workbook order, after the two summary sheets;
+    # the monthly Department Summary reports have no sheet of their own
+    schema = records_schema(conn, year)
+    departments = [row[0] for row in
+                   conn.execute(PACK_DEPARTMENTS_SQL.format(schema=schema), (year,))]
+    tasks = [(("Employee Summary", None, year), "Employee Summary")]
+    tasks += [(("Monthly Payroll", month, year), f"Payroll {month:02d}")
+              for month in range(1, 13)]
+    tasks += [(("department", position, year), f"Dept {position}")
+              for position in departments]
+    tasks += [(("Department Summary", month, year), None) for month in range(1, 13)]
+    return tasks
+
+
+@timed("export", "annual pack")
+def build_annual_pack(db, year, path, workers=None, progress=None, cancelled=None):
+    # Writes the year's pack to path (.xlsx). A failed or cancelled build
+    # leaves no partial file.
+    year = normalize_year(year)
+    if os.path.splitext(path)[1].lower() != ".xlsx":
+        raise ValueError("The annual pack is an Excel workbook (.xlsx)")
+    started = time.perf_counter()
+    with db.connection() as conn:
+        tasks = pack_tasks(conn, year)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks)))
+
+    taken = set()
+    titles = [sheet_name("Summary", taken), sheet_name("Departments", taken)]
+    sheet_numbers = {}
+    for task, title in tasks:
+        if title:
+            titles.append(sheet_name(title, taken))
+            sheet_numbers[task] = len(titles)
+    month_totals = {}
+    department_totals = {}
+    rows = 0
+
+    # Spawned workers: forking a process that runs Tk or pool threads is unsafe
+    executor = ProcessPoolExecutor(max_workers=workers,
+                                   mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_worker, initargs=(db.path,))
+    package = PackageWriter(path)
+    try:
+        pending = {executor.submit(_run_task, task) for task, _ in tasks}
+        finished = 0
+        while pending:
+            done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+            if cancelled and cancelled():
+                raise ReportCancelled()
+            for future in done:
+                task, part, count, extra = future.result()
+                kind, key, _ = task
+                if kind == "Monthly Payroll":
+                    month_totals[key] = extra
+                elif kind == "Department Summary":
+                    for department, employees, total in extra:
+                        department_totals.setdefault(department, {})[key] = (employees, total)
+                if part is not None:
+                    package.write(f"xl/worksheets/sheet{sheet_numbers[task]}.xml", part)
+                    rows += count
+                finished += 1
+                if progress:
+                    progress(finished, len(tasks))
+
+        package.write("xl/worksheets/sheet1.xml", deflate_part(_summary_sheet(month_totals)))
+        package.write("xl/worksheets/sheet2.xml",
+                      deflate_part(_departments_sheet(department_totals)))
+        for name, data in _package_parts(titles):
+            package.write(name, deflate_part(data.encode("utf-8")))
+        package.close()
+    except BaseException:
+        executor.shutdown(wait=False, cancel_futures=True)
+        package.abort()
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    executor.shutdown()
+    return PackResult(path, len(titles), rows, time.perf_counter() - started, workers)
+
+
+class AnnualPackJob(ReportJob):
+    # Builds a pack from a ReportRunner thread, cancellable like an export.
+    # The work happens in worker processes, so no pooled connection is held
+    # while it runs.
+    def __init__(self, year, path, workers=None):
+        super().__init__("Annual Pack", None, normalize_year(year))
+        if os.path.splitext(path)[1].lower() != ".xlsx":
+            raise ValueError("The annual pack is an Excel workbook (.xlsx)")
+        self.path = path
+        self.workers = workers
+        self.finished = 0
+        self.total = 0
+
+    def run(self, db):
+        if self.cancelled:
+            raise ReportCancelled()
+        return build_annual_pack(db, self.year, self.path, self.workers,
+                                 progress=self._progress, cancelled=lambda: self.cancelled)
+
+    def _progress(self, finished, total):
+        self.finished = finished
+        self.total = total
+
+
+def _summary_sheet(month_totals):
+    # month_totals: month -> [employees, *totals in cents]
+    rows = []
+    year_totals = [0] * (len(PAYROLL_TOTALS) + 1)
+    for month in range(1, 13):
+        totals = month_totals.get(month) or [0] * len(year_totals)
+        rows.append([month, totals[0], *map(from_minor, totals[1:])])
+        year_totals = [a + b for a, b in zip(year_totals, totals)]
+    rows.append(["Year", year_totals[0], *map(from_minor, year_totals[1:])])
+    return sheet_xml(["month", "employees", *PAYROLL_TOTALS], rows)
+
+
+def _departments_sheet(department_totals):
+    # Total salary per department and month, then the year's total and the
+    # average headcount over the months the department was paid
+    rows = []
+    for department in sorted(department_totals):
+        months = department_totals[department]
+        total = sum(t for _, t in months.values())
+        headcount = sum(c for c, _ in months.values()) / len(months)
+        rows.append([department,
+                     *(from_minor(months[m][1]) if m in months else None for m in range(1, 13)),
+                     from_minor(total), round(headcount, 1)])
+    return sheet_xml(["department", *(f"{m:02d}" for m in range(1, 13)),
+                      "total_salary", "avg_employees"], rows)
+
+
+def _package_parts(titles):
+    # Everything but the worksheets: content types, relationships, the sheet
+    # list and a minimal stylesheet
+    sheet = "application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"
+    yield ("[Content_Types].xml", (
+        _XML_DECLARATION
+        + '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" '
+        'ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/'
+        'vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/'
+        'vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        + "".join(f'<Override PartName="/xl/worksheets/sheet{n}.xml" ContentType="{sheet}"/>'
+                  for n in range(1, len(titles) + 1))
+        + "</Types>"))
+    yield ("_rels/.rels", (
+        _XML_DECLARATION + f'<Relationships xmlns="{_PKG_REL_NS}">'
+        f'<Relationship Id="rId1" Type="{_REL_NS}/officeDocument" Target="xl/workbook.xml"/>'
+        "</Relationships>"))
+    yield ("xl/workbook.xml", (
+        _XML_DECLARATION + f'<workbook xmlns="{_MAIN_NS}" xmlns:r="{_REL_NS}"><sheets>'
+        + "".join(f'<sheet name="{escape(title, {chr(34): "&quot;"})}" sheetId="{n}" '
+                  f'r:id="rId{n}"/>'
+                  for n, title in enumerate(titles, start=1))
+        + "</sheets></workbook>"))
+    yield ("xl/_rels/workbook.xml.rels", (
+        _XML_DECLARATION + f'<Relationships xmlns="{_PKG_REL_NS}">'
+        + "".join(f'<Relationship Id="rId{n}" Type="{_REL_NS}/worksheet" '
+                  f'Target="worksheets/sheet{n}.xml"/>'
+                  for n in range(1, len(titles) + 1))
+        + f'<Relationship Id="rId{len(titles) + 1}" Type="{_REL_NS}/styles" '
+          'Target="styles.xml"/></Relationships>'))
+    yield ("xl/styles.xml", (
+        _XML_DECLARATION + f'<styleSheet xmlns="{_MAIN_NS}">'
+        '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/></cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        "</styleSheet>"))
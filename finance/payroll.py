@@ -0,0 +1,256 @@
+import time
+
+# NumPy and pandas are imported inside the batch functions so that the GUI,
+# the CLI and single-record saves start without paying for them.
+from .archive import check_writable
+from .ledger import LOAN_KINDS, post_repayments, repayment_share, scheduled_deductions
+from .money import MINOR_UNITS, MONEY_COLUMNS, to_minor, to_minor_array
+from .records import RECORD_COLUMNS, UPSERT_RECORD_SQL, normalize_amount, normalize_month, normalize_year
+from .rules import rules_for_period
+
+HOURS_PER_MONTH = 160
+OVERTIME_MULTIPLIER = 1.5
+
+ADJUSTMENT_COLUMNS = ("overtime_hours", "incentives", "advances", "loans")
+
+
+def calculate_pay(base_salary, overtime_hours=0, incentives=0, advances=0, loans=0):
+    # The built-in formula, used when no pay rules are saved (see
+    # finance.rules). Works the same on plain floats and on NumPy columns.
+    hourly_rate = base_salary / HOURS_PER_MONTH
+    overtime_pay = overtime_hours * hourly_rate * OVERTIME_MULTIPLIER
+    net_salary = base_salary + overtime_pay + incentives - advances - loans
+    return overtime_pay, net_salary
+
+
+class PayrollRunResult:
+    def __init__(self, month, year, rows, seconds, skipped=0):
+        self.month = month
+        self.year = year
+        self.rows = rows
+        self.seconds = seconds
+        # Employees left alone because their month was already saved
+        self.skipped = skipped
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else float("inf")
+
+    def __repr__(self):
+        return (f"PayrollRunResult({self.year}-{self.month:02d}: {self.rows} rows, "
+                f"{self.skipped} skipped, in {self.seconds:.3f}s, "
+                f"{self.rows_per_second:,.0f} rows/s)")
+
+
+def load_adjustments(path):
+    # Reads an adjustments CSV/XLSX file into a list of dicts for run_payroll
+    from .importer import iter_rows
+
+    return [row for _, row in iter_rows(path)]
+
+
+def _prepare_adjustments(conn, adjustments):
+    import pandas as pd
+
+    if adjustments is None:
+        empty = {"employee_id": pd.Series(dtype="int64")}
+        empty.update({column: pd.Series(dtype="float64") for column in ADJUSTMENT_COLUMNS})
+        return pd.DataFrame(empty)
+
+    adjustments = pd.DataFrame(adjustments)
+    if "employee_id" not in adjustments.columns:
+        if "name" not in adjustments.columns:
+            raise ValueError("Adjustments need an 'employee_id' or 'name' column")
+        ids = dict(conn.execute("SELECT name, id FROM employees").fetchall())
+        adjustments["employee_id"] = adjustments["name"].map(ids)
+        unknown = adjustments.loc[adjustments["employee_id"].isna(), "name"]
+        if len(unknown):
+            raise ValueError(f"Unknown employees: {', '.join(map(str, unknown[:10]))}")
+
+    for column in ADJUSTMENT_COLUMNS:
+        if column not in adjustments.columns:
+            adjustments[column] = 0.0
+        adjustments[column] = pd.to_numeric(adjustments[column], errors="raise").fillna(0.0)
+        if (adjustments[column] < 0).any():
+            raise ValueError(f"Negative values in '{column}'")
+
+    adjustments["employee_id"] = pd.to_numeric(adjustments["employee_id"], errors="raise").astype("int64")
+    if adjustments["employee_id"].duplicated().any():
+        raise ValueError("Adjustments list the same employee more than once")
+    return adjustments[["employee_id", *ADJUSTMENT_COLUMNS]]
+
+
+def _add_scheduled(adjustments, due):
+    # Adds ledger installments (loan_id, employee_id, kind, cents) to the
+    # advances and loans columns, keeping employees without adjustments
+    import pandas as pd
+
+    due = pd.DataFrame(due, columns=["loan_id", "employee_id", "kind", "amount"])
+    due["amount"] /= MINOR_UNITS
+    scheduled = (due.pivot_table(index="employee_id", columns="kind", values="amount",
+                                 aggfunc="sum", fill_value=0.0)
+                 .reindex(columns=list(LOAN_KINDS), fill_value=0.0)
+                 .reset_index())
+    adjustments = adjustments.merge(scheduled, on="employee_id", how="outer")
+    adjustments[list(ADJUSTMENT_COLUMNS)] = adjustments[list(ADJUSTMENT_COLUMNS)].fillna(0.0)
+    adjustments["advances"] += adjustments.pop("advance").fillna(0.0)
+    adjustments["loans"] += adjustments.pop("loan").fillna(0.0)
+    return adjustments
+
+
+def _scheduled_repayments(frame, positions, due, rules):
+    # The installments actually taken: all of them unless the pay rule's
+    # deduction cap left part of the requested deductions unpaid
+    import numpy as np
+
+    def amounts(column):
+        return frame[column].to_numpy(dtype=np.float64) / MINOR_UNITS
+
+    zeros = np.zeros(len(frame))
+    _, gross = rules.compute(positions, amounts("base_salary"),
+                             frame["overtime_hours"].to_numpy(dtype=np.float64),
+                             amounts("incentives"), zeros, zeros)
+    requested = amounts("advances") + amounts("loans")
+    taken = gross - amounts("net_salary")
+    share = np.ones(len(frame))
+    np.divide(taken, requested, out=share, where=requested > 0)
+    shares = dict(zip(frame["employee_id"].tolist(), np.minimum(share, 1.0).tolist()))
+    return [(loan_id, amount * shares[employee_id])
+            for loan_id, employee_id, _, amount in due if employee_id in shares]
+
+
+def compute_payroll(employees, adjustments, month, year, rules=None):
+    # employees: employee_id, position, base_salary (cents); adjustments:
+    # employee_id + ADJUSTMENT_COLUMNS in currency units; rules: a
+    # finance.rules.RuleSet (default formula when None). Returns the records
+    # with money in cents, ready to store.
+    import numpy as np
+
+    frame = employees.merge(adjustments, on="employee_id", how="left", validate="one_to_one")
+    frame[list(ADJUSTMENT_COLUMNS)] = frame[list(ADJUSTMENT_COLUMNS)].fillna(0.0)
+
+    compute = calculate_pay if rules is None else (
+        lambda *columns: rules.compute(frame["position"].to_numpy(), *columns))
+    overtime_pay, net_salary = compute(
+        frame["base_salary"].to_numpy(dtype=np.float64) / MINOR_UNITS,
+        frame["overtime_hours"].to_numpy(dtype=np.float64),
+        frame["incentives"].to_numpy(dtype=np.float64),
+        frame["advances"].to_numpy(dtype=np.float64),
+        frame["loans"].to_numpy(dtype=np.float64),
+    )
+    frame["overtime_pay"] = to_minor_array(overtime_pay)
+    frame["net_salary"] = to_minor_array(net_salary)
+    for column in ("incentives", "advances", "loans"):
+        frame[column] = to_minor_array(frame[column])
+    frame["month"] = month
+    frame["year"] = year
+    return frame[list(RECORD_COLUMNS)]
+
+
+def run_payroll(db, month, year, adjustments=None, overwrite=False):
+    # Computes and saves the month for every employee in one transaction.
+    # Adjustments may be a DataFrame or a list of dicts keyed by employee_id
+    # (or name); employees without an entry get their plain base salary.
+    # Employees whose month is already saved are skipped, adjustments and
+    # all, so a run never wipes figures entered by hand; overwrite=True
+    # recomputes and replaces them too.
+    import pandas as pd
+
+    month = normalize_month(month)
+    year = normalize_year(year)
+    started = time.perf_counter()
+
+    with db.transaction() as conn:
+        check_writable(conn, year)
+        employees = pd.read_sql_query(
+            "SELECT id AS employee_id, position, base_salary FROM employees", conn)
+        adjustments = _prepare_adjustments(conn, adjustments)
+
+        unknown = set(adjustments["employee_id"]) - set(employees["employee_id"])
+        if unknown:
+            raise ValueError(f"Unknown employee ids: {sorted(unknown)[:10]}")
+
+        skipped = 0
+        if not overwrite:
+            saved = {employee_id for (employee_id,) in conn.execute(
+                "SELECT employee_id FROM financial_records WHERE year = ? AND month = ?",
+                (year, month))}
+            if saved:
+                keep = ~employees["employee_id"].isin(saved)
+                skipped = len(employees) - int(keep.sum())
+                employees = employees[keep].reset_index(drop=True)
+                adjustments = adjustments[~adjustments["employee_id"].isin(saved)]
+
+        # Installments due on the loan ledger are deducted on top
+        known = set(employees["employee_id"])
+        due = [d for d in scheduled_deductions(conn, year, month) if d[1] in known]
+        if due:
+            adjustments = _add_scheduled(adjustments, due)
+
+        rules = rules_for_period(conn, year, month)
+        frame = compute_payroll(employees, adjustments, month, year, rules)
+        if due:
+            post_repayments(conn, year, month, _scheduled_repayments(
+                frame, employees["position"].to_numpy(), due, rules))
+        # tolist() hands sqlite3 plain Python ints/floats instead of NumPy scalars
+        rows = zip(*(frame[column].tolist() for column in RECORD_COLUMNS))
+        conn.executemany(UPSERT_RECORD_SQL, rows)
+
+    return PayrollRunResult(month, year, len(frame), time.perf_counter() - started, skipped)
+
+
+def write_financial_record(conn, employee_id, month, year, overtime_hours=0.0,
+                           incentives=0.0, advances=0.0, loans=0.0):
+    # Computes and upserts one employee's month inside the caller's
+    # transaction; amounts are in currency units, both in and in the saved
+    # row returned as a dict
+    if not employee_id:
+        raise ValueError("Please select an employee")
+    month = normalize_month(month)
+    year = normalize_year(year)
+    # Checked as run_payroll and the importer check them
+    overtime_hours, incentives, advances, loans = (
+        normalize_amount(value, field) for value, field in
+        zip((overtime_hours, incentives, advances, loans), ADJUSTMENT_COLUMNS))
+    check_writable(conn, year)
+
+    result = conn.execute("SELECT base_salary, position FROM employees WHERE id=?",
+                          (employee_id,)).fetchone()
+    if not result:
+        raise ValueError("Employee not found in database")
+    base_salary, position = result
+    incentives, advances, loans = map(to_minor, (incentives, advances, loans))
+
+    # Installments due on the loan ledger are deducted on top
+    due = scheduled_deductions(conn, year, month, employee_id)
+    for _, _, kind, amount in due:
+        if kind == "advance":
+            advances += amount
+        else:
+            loans += amount
+
+    # Pay rules work in currency units
+    rule = rules_for_period(conn, year, month).for_position(position)
+    overtime_pay, net_salary = rule.pay(
+        base_salary / MINOR_UNITS, overtime_hours, incentives / MINOR_UNITS,
+        advances / MINOR_UNITS, loans / MINOR_UNITS)
+    if due:
+        _, gross = rule.pay(base_salary / MINOR_UNITS, overtime_hours, incentives / MINOR_UNITS)
+        share = repayment_share(gross, net_salary, (advances + loans) / MINOR_UNITS)
+        post_repayments(conn, year, month,
+                        [(loan_id, amount * share) for loan_id, _, _, amount in due])
+    row = (employee_id, month, year, base_salary, overtime_hours,
+           to_minor(overtime_pay), incentives, advances, loans, to_minor(net_salary))
+    # Save record, replacing any earlier one for the same month
+    conn.execute(UPSERT_RECORD_SQL, row)
+    saved = dict(zip(RECORD_COLUMNS, row))
+    for column in MONEY_COLUMNS["financial_records"]:
+        saved[column] /= MINOR_UNITS
+    return saved
+
+
+def save_financial_record(db, employee_id, month, year, overtime_hours=0.0,
+                          incentives=0.0, advances=0.0, loans=0.0):
+    with db.transaction() as conn:
+        return write_financial_record(conn, employee_id, month, year, overtime_hours,
+                                      incentives, advances, loans)
@@ -0,0 +1,333 @@
+import calendar
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import lru_cache
+from html import escape
+
+from .archive import records_schema
+from .ledger import OUTSTANDING_AS_OF_SQL
+from .metrics import timed
+from .money import format_minor
+from .records import normalize_month, normalize_year
+from .reports import ReportCancelled, ReportJob
+
+# One HTML payslip per employee and month. Templates use {{field}}
+# placeholders (PAYSLIP_FIELDS) and are compiled once into a str.format
+# string, so rendering a slip is a single C-level format call. The default
+# template prints one slip per A5 page, so printing the files, or running
+# them through any HTML-to-PDF converter, gives PDF payslips.
+#
+# Bulk runs stream the month's records from SQLite in batches and render
+# them in worker processes, keeping only a few batches in flight. A
+# manifest in the output directory remembers a digest of each slip's data
+# and the template, so a re-run only renders slips whose figures changed.
+
+PAYSLIP_SQL = """
+    SELECT e.id, e.name, e.position, e.join_date, f.month, f.year,
+           f.base_salary, f.overtime_hours, f.overtime_pay, f.incentives,
+           f.advances, f.loans, f.net_salary,
+           COALESCE(b.loans_outstanding, 0), COALESCE(b.advances_outstanding, 0)
+    FROM {schema}.financial_records f
+    JOIN employees e ON e.id = f.employee_id
+    LEFT JOIN (SELECT employee_id,
+                      SUM(CASE WHEN kind = 'loan' THEN outstanding ELSE 0 END)
+                          AS loans_outstanding,
+                      SUM(CASE WHEN kind = 'advance' THEN outstanding ELSE 0 END)
+                          AS advances_outstanding
+               FROM (""" + OUTSTANDING_AS_OF_SQL + """)
+               GROUP BY employee_id) b ON b.employee_id = e.id
+    WHERE f.year = :year AND f.month = :month {employees}
+    ORDER BY e.id
+"""
+
+PAYSLIP_COLUMNS = ("employee_id", "name", "position", "join_date", "month", "year",
+                   "base_salary", "overtime_hours", "overtime_pay", "incentives",
+                   "advances", "loans", "net_salary", "loans_outstanding",
+                   "advances_outstanding")
+# Read in cents and formatted exactly (finance.money)
+MONEY_COLUMNS = {"base_salary", "overtime_pay", "incentives", "advances", "loans",
+                 "net_salary", "loans_outstanding", "advances_outstanding"}
+# Everything a template can use: the columns plus these derived values
+PAYSLIP_FIELDS = PAYSLIP_COLUMNS + ("period", "gross_pay", "total_deductions")
+
+PAYSLIP_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>Payslip {{period}} - {{name}}</title>
+<style>
+  @page { size: A5; margin: 12mm; }
+  body { font-family: Arial, sans-serif; font-size: 10pt; color: #333; }
+  h1 { font-size: 14pt; color: #2196F3; margin: 0 0 4mm; }
+  table { width: 100%; border-collapse: collapse; margin-bottom: 4mm; }
+  th, td { padding: 1.5mm 2mm; border-bottom: 1px solid #ddd; text-align: left; }
+  td.amount { text-align: right; }
+  tr.total td { font-weight: bold; border-top: 2px solid #333; }
+</style>
+</head>
+<body>
+<h1>Payslip - {{period}}</h1>
+<table>
+  <tr><th>Employee</th><td>{{name}} (ID {{employee_id}})</td></tr>
+  <tr><th>Position</th><td>{{position}}</td></tr>
+  <tr><th>Joined</th><td>{{join_date}}</td></tr>
+</table>
+<table>
+  <tr><th>Earnings</th><th></th></tr>
+  <tr><td>Base salary</td><td class="amount">{{base_salary}}</td></tr>
+  <tr><td>Overtime ({{overtime_hours}} h)</td><td class="amount">{{overtime_pay}}</td></tr>
+  <tr><td>Incentives</td><td class="amount">{{incentives}}</td></tr>
+  <tr class="total"><td>Gross pay</td><td class="amount">{{gross_pay}}</td></tr>
+</table>
+<table>
+  <tr><th>Deductions</th><th></th></tr>
+  <tr><td>Advances</td><td class="amount">{{advances}}</td></tr>
+  <tr><td>Loan repayments</td><td class="amount">{{loans}}</td></tr>
+  <tr class="total"><td>Total deductions</td><td class="amount">{{total_deductions}}</td></tr>
+</table>
+<table>
+  <tr class="total"><td>Net pay</td><td class="amount">{{net_salary}}</td></tr>
+  <tr><td>Loans outstanding</td><td class="amount">{{loans_outstanding}}</td></tr>
+  <tr><td>Advances outstanding</td><td class="amount">{{advances_outstanding}}</td></tr>
+</table>
+</body>
+</html>
+"""
+
+PAYSLIP_BATCH = 500
+# Batches queued per worker; bounds the rows held in memory
+BATCHES_IN_FLIGHT = 2
+MANIFEST_NAME = ".payslips.json"
+
+_PLACEHOLDER = re.compile(r"{{\s*(\w+)\s*}}")
+
+_template = None
+
+
+class PayslipResult:
+    def __init__(self, directory, rendered, unchanged, seconds, workers):
+        self.directory = directory
+        self.rendered = rendered
+        self.unchanged = unchanged
+        self.seconds = seconds
+        self.workers = workers
+
+    @property
+    def payslips_per_second(self):
+        return self.rendered / self.seconds if self.seconds else float("inf")
+
+    def __repr__(self):
+        return (f"PayslipResult({self.directory}: {self.rendered} rendered, "
+                f"{self.unchanged} unchanged in {self.seconds:.3f}s on {self.workers} workers)")
+
+
+@lru_cache(maxsize=8)
+def compile_template(text):
+    # {{field}} placeholders -> a str.format string; literal braces (CSS)
+    # are doubled so only the placeholders are substituted
+    pieces = _PLACEHOLDER.split(text)
+    unknown = sorted(set(pieces[1::2]) - set(PAYSLIP_FIELDS))
+    if unknown:
+        raise ValueError(f"Unknown payslip fields: {', '.join(unknown)} "
+                         f"(use {', '.join(PAYSLIP_FIELDS)})")
+    out = []
+    for i, piece in enumerate(pieces):
+        out.append("{" + piece + "}" if i % 2 else piece.replace("{", "{{").replace("}", "}}"))
+    return "".join(out)
+
+
+def load_template(path=None):
+    if path is None:
+        return PAYSLIP_TEMPLATE
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def template_digest(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def payslip_context(row):
+    context = {}
+    for name, value in zip(PAYSLIP_COLUMNS, row):
+        if name in MONEY_COLUMNS:
+            context[name] = format_minor(value)
+        elif isinstance(value, str):
+            context[name] = escape(value)
+        elif isinstance(value, float):
+            context[name] = f"{value:g}"
+        else:
+            context[name] = "" if value is None else value
+    month, year = row[4], row[5]
+    base, overtime, incentives, advances, loans = (v or 0 for v in row[6:7] + row[8:12])
+    context["period"] = f"{calendar.month_name[month]} {year}"
+    context["gross_pay"] = format_minor(base + overtime + incentives)
+    context["total_deductions"] = format_minor(advances + loans)
+    return context
+
+
+def render_payslip(row, template=PAYSLIP_TEMPLATE):
+    return compile_template(template).format_map(payslip_context(row))
+
+
+def payslip_filename(row):
+    return f"payslip_{row[5]}-{row[4]:02d}_{row[0]}.html"
+
+
+def payslip_digest(row):
+    # Changes whenever anything printed on the slip changes
+    return hashlib.blake2b(repr(row).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def iter_payslips(conn, month, year, employee_ids=None, batch_size=PAYSLIP_BATCH):
+    # Streams the month's payslip rows (PAYSLIP_COLUMNS) in employee order
+    month = normalize_month(month)
+    year = normalize_year(year)
+    params = {"year": year, "month": month}
+    employees = ""
+    if employee_ids is not None:
+        employees = "AND f.employee_id IN (SELECT value FROM json_each(:employee_ids))"
+        params["employee_ids"] = json.dumps([int(i) for i in employee_ids])
+    sql = PAYSLIP_SQL.format(schema=records_schema(conn, year), employees=employees)
+    cursor = conn.execute(sql, params)
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cursor.close()
+
+
+def _write_batch(directory, rows, template):
+    compiled = compile_template(template)
+    for row in rows:
+        path = os.path.join(directory, payslip_filename(row))
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(compiled.format_map(payslip_context(row)))
+    return len(rows)
+
+
+def _init_worker(template):
+    global _template
+    _template = template
+
+
+def _render_batch(directory, rows):
+    # Runs in a worker process; the template was compiled on first use
+    return _write_batch(directory, rows, _template)
+
+
+def _read_manifest(directory, digest):
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # A different template invalidates every slip
+    return manifest.get("slips", {}) if manifest.get("template") == digest else {}
+
+
+def _write_manifest(directory, digest, slips):
+    path = os.path.join(directory, MANIFEST_NAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"template": digest, "slips": slips}, f)
+    os.replace(path + ".tmp", path)
+
+
+@timed("export", "payslips")
+def generate_payslips(db, month, year, directory, template=None, workers=None,
+                      employee_ids=None, force=False, progress=None, cancelled=None):
+    # Renders the month's payslips into directory. Unless force is set, slips
+    # whose data and template are unchanged since the last run (and whose
+    # file still exists) are skipped. Small runs render in this process;
+    # worker processes start once there is more than one batch.
+    template = template or PAYSLIP_TEMPLATE
+    compile_template(template)  # template errors surface before any work
+    digest = template_digest(template)
+    os.makedirs(directory, exist_ok=True)
+    previous = {} if force else _read_manifest(directory, digest)
+    slips = dict(previous)
+    workers = max(1, workers or os.cpu_count() or 1)
+    started = time.perf_counter()
+    rendered = unchanged = 0
+    executor = None
+    pending = set()
+
+    def drain(limit):
+        nonlocal rendered
+        while len(pending) > limit:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.remove(future)
+                rendered += future.result()
+                if progress:
+                    progress(rendered, unchanged)
+
+    batch = []
+    try:
+        with db.connection() as conn:
+            for row in iter_payslips(conn, month, year, employee_ids):
+                key = str(row[0])
+                row_digest = payslip_digest(row)
+                if (previous.get(key) == row_digest
+                        and os.path.exists(os.path.join(directory, payslip_filename(row)))):
+                    unchanged += 1
+                    continue
+                slips[key] = row_digest
+                batch.append(row)
+                if len(batch) < PAYSLIP_BATCH:
+                    continue
+                if cancelled and cancelled():
+                    raise ReportCancelled()
+                if executor is None:
+                    # Spawned, not forked: the caller may be running Tk or threads
+                    executor = ProcessPoolExecutor(
+                        max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_init_worker, initargs=(template,))
+                pending.add(executor.submit(_render_batch, directory, batch))
+                batch = []
+                drain(workers * BATCHES_IN_FLIGHT)
+        if batch:
+            if executor is None:
+                rendered += _write_batch(directory, batch, template)
+            else:
+                pending.add(executor.submit(_render_batch, directory, batch))
+        drain(0)
+        if progress:
+            progress(rendered, unchanged)
+        _write_manifest(directory, digest, slips)
+    except BaseException:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    if executor is not None:
+        executor.shutdown()
+    return PayslipResult(directory, rendered, unchanged, time.perf_counter() - started,
+                         workers if executor is not None else 1)
+
+
+class PayslipJob(ReportJob):
+    # Runs generate_payslips from a ReportRunner thread, cancellable
+    def __init__(self, month, year, directory, force=False):
+        super().__init__("Payslips", normalize_month(month), normalize_year(year))
+        self.directory = directory
+        self.force = force
+        self.rendered = 0
+        self.unchanged = 0
+
+    def run(self, db):
+        if self.cancelled:
+            raise ReportCancelled()
+        return generate_payslips(db, self.month, self.year, self.directory, force=self.force,
+                                 progress=self._progress, cancelled=lambda: self.cancelled)
+
+    def _progress(self, rendered, unchanged):
+        self.rendered = rendered
+        self.unchanged = unchanged
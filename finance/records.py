@@ -0,0 +1,69 @@
+import calendar
+import math
+
+RECORD_COLUMNS = ("employee_id", "month", "year", "base_salary", "overtime_hours",
+                  "overtime_pay", "incentives", "advances", "loans", "net_salary")
+
+# One row per employee per month. Saving the same period again replaces the
+# figures instead of adding a duplicate payroll line.
+UPSERT_RECORD_SQL = """
+    INSERT INTO financial_records
+        (employee_id, month, year, base_salary, overtime_hours,
+         overtime_pay, incentives, advances, loans, net_salary)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (employee_id, year, month) DO UPDATE SET
+        base_salary = excluded.base_salary,
+        overtime_hours = excluded.overtime_hours,
+        overtime_pay = excluded.overtime_pay,
+        incentives = excluded.incentives,
+        advances = excluded.advances,
+        loans = excluded.loans,
+        net_salary = excluded.net_salary
+"""
+
+_MONTH_NAMES = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+_MONTH_NAMES.update({name.lower(): i for i, name in enumerate(calendar.month_abbr) if name})
+
+
+def normalize_month(value):
+    # Accepts 3, "3", "03", "March" or "mar" and returns 3
+    if isinstance(value, int) and not isinstance(value, bool):
+        month = value
+    else:
+        text = str(value).strip().lower()
+        if text in _MONTH_NAMES:
+            month = _MONTH_NAMES[text]
+        else:
+            try:
+                month = int(float(text))
+            except ValueError:
+                raise ValueError(f"Invalid month: {value!r}")
+    if not 1 <= month <= 12:
+        raise ValueError(f"Invalid month: {value!r}")
+    return month
+
+
+def normalize_year(value):
+    try:
+        year = int(str(value).strip())
+    except ValueError:
+        raise ValueError(f"Invalid year: {value!r}")
+    if not 1900 <= year <= 9999:
+        raise ValueError(f"Invalid year: {value!r}")
+    return year
+
+
+def normalize_amount(value, field):
+    # Hours or a currency amount entered for a record: a non-negative
+    # number, blank meaning 0
+    if value is None or str(value).strip() == "":
+        return 0.0
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {field}: {value!r}")
+    if not math.isfinite(number):
+        raise ValueError(f"Invalid {field}: {value!r}")
+    if number < 0:
+        raise ValueError(f"Negative {field}: {value!r}")
+    return number
@@ -0,0 +1,355 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from .archive import records_schema
+from .cache import data_version
+from .ledger import OUTSTANDING_AS_OF_SQL
+from .metrics import timed
+from .records import normalize_month, normalize_year
+
+REPORT_TYPES = ["Monthly Payroll", "Employee Summary", "Department Summary",
+                "Outstanding Loans"]
+
+# Money is stored in cents (finance.money); every report shows currency units
+REPORT_QUERIES = {
+    "Monthly Payroll": """
+        SELECT e.name, e.position, f.base_salary / 100.0 as base_salary,
+               f.overtime_pay / 100.0 as overtime_pay, f.incentives / 100.0 as incentives,
+               f.advances / 100.0 as advances, f.loans / 100.0 as loans,
+               f.net_salary / 100.0 as net_salary
+        FROM employees e
+        JOIN {schema}.financial_records f ON e.id = f.employee_id
+        WHERE f.month = ? AND f.year = ?
+    """,
+    # Both summaries read the trigger-maintained tables from finance.summaries.
+    # {schema} is "main", or an archived year's attached file (finance.archive)
+    "Employee Summary": """
+        SELECT e.name, e.position,
+               s.total_net_salary / 100.0 / s.record_count as avg_salary,
+               s.total_overtime_pay / 100.0 as total_overtime,
+               s.total_incentives / 100.0 as total_incentives
+        FROM {schema}.employee_year_summary s
+        JOIN employees e ON e.id = s.employee_id
+        WHERE s.year = ?
+    """,
+    "Department Summary": """
+        SELECT s.position as department,
+               s.employee_count as employee_count,
+               s.total_net_salary / 100.0 / s.employee_count as avg_salary,
+               s.total_net_salary / 100.0 as total_salary
+        FROM {schema}.position_month_summary s
+        WHERE s.month = ? AND s.year = ?
+    """,
+    # Balances at the end of the month from the ledger's running balances
+    # (finance.ledger); ?1/?2 keep the usual (month, year) parameters
+    "Outstanding Loans": f"""
+        SELECT e.name, e.position,
+               SUM(CASE WHEN b.kind = 'loan' THEN b.outstanding ELSE 0 END) / 100.0
+                   as loans_outstanding,
+               SUM(CASE WHEN b.kind = 'advance' THEN b.outstanding ELSE 0 END) / 100.0
+                   as advances_outstanding,
+               SUM(b.outstanding) / 100.0 as total_outstanding
+        FROM ({OUTSTANDING_AS_OF_SQL.replace(":year", "?2").replace(":month", "?1")}) b
+        JOIN employees e ON e.id = b.employee_id
+        GROUP BY e.id
+        HAVING SUM(b.outstanding) > 0
+    """,
+}
+
+# Every report's first column is unique within its result (employee name or
+# department), so it breaks ties when paging on any other sort column.
+REPORT_KEYS = {
+    "Monthly Payroll": "name",
+    "Employee Summary": "name",
+    "Department Summary": "department",
+    "Outstanding Loans": "name",
+}
+
+DEFAULT_PAGE_SIZE = 200
+CACHED_PAGES = 16
+# SQLite VM instructions between cancellation checks
+PROGRESS_STEPS = 10000
+
+
+class ReportCancelled(Exception):
+    pass
+
+
+def report_query(report_type, month, year, schema="main"):
+    if report_type not in REPORT_QUERIES:
+        raise ValueError(f"Unknown report type: {report_type}")
+    year = normalize_year(year)
+    if report_type == "Employee Summary":
+        params = (year,)
+    else:
+        params = (normalize_month(month), year)
+    return REPORT_QUERIES[report_type].format(schema=schema), params
+
+
+def report_schema(conn, report_type, year):
+    # Where the report's year lives; attaches its archive to conn if needed
+    if "{schema}" not in REPORT_QUERIES[report_type]:
+        return "main"
+    return records_schema(conn, year)
+
+
+def prepare_report(conn, report_type, month, year):
+    # report_query against the hot tables or the year's archive
+    _, params = report_query(report_type, month, year)
+    return report_query(report_type, month, year,
+                        report_schema(conn, report_type, params[-1]))
+
+
+def fetch_report(conn, report_type, month, year):
+    # Whole report as a DataFrame; pandas is only loaded when this is used
+    import pandas as pd
+
+    query, params = prepare_report(conn, report_type, month, year)
+    with timed("dataframe", report_type):
+        return pd.read_sql_query(query, conn, params=params)
+
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+class ReportPager:
+    # Serves any window of a report's rows without materializing the rest.
+    # Pages are fetched with keyset pagination (WHERE (sort, key) > last seen)
+    # so scrolling forward never re-reads skipped rows; a jump to a page whose
+    # predecessor has not been seen falls back to OFFSET once, after which
+    # its neighbours are keyset again. Sorting is pushed down to SQLite.
+    # With a ReportCache, counts and pages are shared between pagers for the
+    # same report until the underlying data changes.
+    def __init__(self, db, report_type, month, year, page_size=DEFAULT_PAGE_SIZE,
+                 cache=None):
+        self.db = db
+        self.report_type = report_type
+        self.cache = cache
+        _, params = report_query(report_type, month, year)
+        with db.connection() as conn:
+            self.schema = report_schema(conn, report_type, params[-1])
+        self.query, self.params = report_query(report_type, month, year, self.schema)
+        # params end with the normalized year; month is left out for the
+        # yearly report so every month shares its entries. The database path
+        # keeps entries apart when an on-disk cache serves several files.
+        self.cache_key = (os.path.abspath(db.path), report_type, *self.params)
+        self.key = REPORT_KEYS[report_type]
+        self.page_size = page_size
+        self.columns = None
+        self.sort_column = self.key
+        self.descending = False
+        self._count = None
+        self._pages = OrderedDict()
+        self._boundaries = {}
+
+    def _execute(self, sql, params, conn=None):
+        if conn is not None:
+            self._attach(conn)
+            return conn.execute(sql, params)
+        with self.db.connection() as conn:
+            self._attach(conn)
+            cursor = conn.execute(sql, params)
+            return _FetchedCursor(cursor.description, cursor.fetchall())
+
+    def _attach(self, conn):
+        # Any pooled connection may serve a page; an archived year is attached
+        # to each once and stays attached
+        if self.schema != "main":
+            records_schema(conn, self.params[-1])
+
+    def load_columns(self, conn=None):
+        # Column names only, which is all sort() needs
+        if self.columns is None:
+            cursor = self._execute(f"SELECT * FROM ({self.query}) LIMIT 0", self.params, conn)
+            self.columns = [d[0] for d in cursor.description]
+            cursor.fetchall()
+        return self.columns
+
+    def prefetch(self, conn=None):
+        # Column names, row count and the first page, e.g. on a worker thread
+        self.load_columns(conn)
+        self.count(conn)
+        self._page(0, conn)
+
+    def _cached(self, key, conn, load):
+        if self.cache is None:
+            return load()
+        if conn is None:
+            with self.db.connection() as c:
+                version = data_version(c, self.params[-1])
+        else:
+            version = data_version(conn, self.params[-1])
+        value = self.cache.get(key, version)
+        if value is None:
+            value = load()
+            self.cache.put(key, version, value)
+        return value
+
+    def count(self, conn=None):
+        if self._count is None:
+            self._count = self._cached(
+                (*self.cache_key, "count"), conn,
+                lambda: self._execute(f"SELECT COUNT(*) FROM ({self.query})",
+                                      self.params, conn).fetchone()[0])
+        return self._count
+
+    def sort(self, column, descending=False):
+        if column not in self.columns:
+            raise ValueError(f"Unknown column: {column}")
+        self.sort_column = column
+        self.descending = descending
+        self._pages.clear()
+        self._boundaries.clear()
+
+    def rows(self, start, stop):
+        start = max(0, start)
+        stop = min(stop, self.count())
+        result = []
+        for index in range(start // self.page_size, (stop - 1) // self.page_size + 1):
+            page = self._page(index)
+            offset = index * self.page_size
+            result.extend(page[max(start - offset, 0):stop - offset])
+        return result
+
+    def _order_columns(self):
+        if self.sort_column == self.key:
+            return [self.key]
+        return [self.sort_column, self.key]
+
+    def _page(self, index, conn=None):
+        if index in self._pages:
+            self._pages.move_to_end(index)
+            return self._pages[index]
+
+        order_columns = self._order_columns()
+        direction = " DESC" if self.descending else ""
+        order_by = ", ".join(_quote(c) + direction for c in order_columns)
+        sql = f"SELECT * FROM ({self.query})"
+        params = list(self.params)
+
+        boundary = self._boundaries.get(index)
+        if index > 0 and boundary is not None:
+            columns = ", ".join(_quote(c) for c in order_columns)
+            marks = ", ".join("?" for _ in order_columns)
+            sql += f" WHERE ({columns}) {'<' if self.descending else '>'} ({marks})"
+            params.extend(boundary)
+            sql += f" ORDER BY {order_by} LIMIT ?"
+            params.append(self.page_size)
+        else:
+            sql += f" ORDER BY {order_by} LIMIT ? OFFSET ?"
+            params.extend((self.page_size, index * self.page_size))
+
+        page = self._cached(
+            (*self.cache_key, self.sort_column, self.descending, self.page_size, index),
+            conn, lambda: self._execute(sql, params, conn).fetchall())
+        if page:
+            positions = [self.columns.index(c) for c in order_columns]
+            self._boundaries[index + 1] = tuple(page[-1][i] for i in positions)
+
+        self._pages[index] = page
+        if len(self._pages) > CACHED_PAGES:
+            self._pages.popitem(last=False)
+        return page
+
+
+class _FetchedCursor:
+    # Lets _execute release its pooled connection before the caller reads
+    def __init__(self, description, rows):
+        self.description = description
+        self._rows = rows
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return self._rows
+
+
+class ReportJob:
+    def __init__(self, report_type, month, year, cache=None):
+        self.report_type = report_type
+        self.month = month
+        self.year = year
+        self.cache = cache
+        self.future = None
+        self._cancel = threading.Event()
+        self._conn = None
+        self._conn_lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+        if self.future is not None:
+            self.future.cancel()
+        # Interrupt aborts a statement that is already running; the progress
+        # handler catches a cancel that lands before execute() starts.
+        with self._conn_lock:
+            if self._conn is not None:
+                self._conn.interrupt()
+
+    def done(self):
+        return self.future is not None and self.future.done()
+
+    def result(self):
+        return self.future.result()
+
+    def run(self, db):
+        if self.cancelled:
+            raise ReportCancelled()
+        with db.connection() as conn, timed("report", self.report_type):
+            with self._conn_lock:
+                self._conn = conn
+            conn.set_progress_handler(lambda: 1 if self._cancel.is_set() else 0,
+                                      PROGRESS_STEPS)
+            try:
+                result = self.work(db, conn)
+            except sqlite3.OperationalError as e:
+                if self.cancelled:
+                    raise ReportCancelled() from e
+                raise
+            finally:
+                conn.set_progress_handler(None, 0)
+                with self._conn_lock:
+                    self._conn = None
+        if self.cancelled:
+            raise ReportCancelled()
+        return result
+
+    def work(self, db, conn):
+        # Runs on the worker thread with a cancellable connection
+        pager = ReportPager(db, self.report_type, self.month, self.year, cache=self.cache)
+        pager.prefetch(conn)
+        return pager
+
+
+class ReportRunner:
+    # Runs report queries on worker threads. SQLite releases the GIL while a
+    # statement executes, so threads overlap fine and share the pooled
+    # connections. One connection is always left free for the UI thread.
+    def __init__(self, db, max_workers=None, cache=None):
+        # Imported here so the CLI can read REPORT_TYPES without it
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.db = db
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or max(1, db.pool_size - 1),
+            thread_name_prefix="report")
+
+    def submit(self, report_type, month, year):
+        # Validate on the caller's thread so input errors surface immediately
+        report_query(report_type, month, year)
+        return self.run_job(ReportJob(report_type, month, year, cache=self.cache))
+
+    def run_job(self, job):
+        job.future = self._executor.submit(job.run, self.db)
+        return job
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,361 @@
+import json
+import math
+import time
+from functools import lru_cache
+
+from .money import MINOR_UNITS, sum_minor_by, to_minor_array
+
+# Pay rules as data. A rule set has a default rule and optional per-position
+# overrides; each saved rule set is a new version in pay_rules with the
+# period it takes effect from, and saves use the version in force for the
+# record's month. With no rule set saved, DEFAULT_CONFIG reproduces the
+# original formula: 160 hours a month, overtime at 1.5x, and
+# net = base + overtime + incentives - advances - loans.
+#
+#   {"default": {"hours_per_month": 160,
+#                "overtime_tiers": [[10, 1.5], [null, 2.0]],   # [up to hours, multiplier]
+#                "overtime_cap_hours": 40,        # hours beyond this are unpaid
+#                "incentive_cap": 1000,           # incentives above this are cut
+#                "deduction_cap_pct": 50},        # advances + loans at most 50% of gross
+#    "positions": {"Manager": {"overtime_tiers": [[null, 1.0]]}}}
+
+DEFAULT_RULE = {
+    "hours_per_month": 160,
+    "overtime_tiers": [[None, 1.5]],
+    "overtime_cap_hours": None,
+    "incentive_cap": None,
+    "deduction_cap_pct": None,
+}
+
+DEFAULT_CONFIG = {"default": DEFAULT_RULE, "positions": {}}
+
+PAY_RULES_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS pay_rules
+       (version INTEGER PRIMARY KEY,
+        effective_year INTEGER NOT NULL,
+        effective_month INTEGER NOT NULL,
+        config TEXT NOT NULL,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP)''',
+    '''CREATE INDEX IF NOT EXISTS idx_pay_rules_effective
+       ON pay_rules (effective_year, effective_month, version)''',
+]
+
+
+def _number(value, name, minimum=0.0, optional=False):
+    if value is None and optional:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value < minimum:
+        raise ValueError(f"Invalid {name}: {value!r}")
+    return float(value)
+
+
+class PayRule:
+    def __init__(self, hours_per_month, overtime_tiers, overtime_cap_hours=None,
+                 incentive_cap=None, deduction_cap_pct=None):
+        self.hours_per_month = _number(hours_per_month, "hours_per_month", 1.0)
+        self.overtime_cap_hours = _number(overtime_cap_hours, "overtime_cap_hours", optional=True)
+        self.incentive_cap = _number(incentive_cap, "incentive_cap", optional=True)
+        self.deduction_cap_pct = _number(deduction_cap_pct, "deduction_cap_pct", optional=True)
+        if self.deduction_cap_pct is not None and self.deduction_cap_pct > 100:
+            raise ValueError(f"Invalid deduction_cap_pct: {deduction_cap_pct!r}")
+
+        # Tiers as (lower, upper, multiplier) hour bands; the last is open-ended
+        if not overtime_tiers:
+            raise ValueError("overtime_tiers must not be empty")
+        self.tiers = []
+        lower = 0.0
+        for i, tier in enumerate(overtime_tiers):
+            try:
+                up_to, multiplier = tier
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid overtime tier: {tier!r}")
+            last = i == len(overtime_tiers) - 1
+            upper = math.inf if up_to is None else _number(up_to, "overtime tier limit")
+            if (up_to is None) != last or upper <= lower:
+                raise ValueError("Overtime tiers must rise and end with an open tier (null)")
+            self.tiers.append((lower, upper, _number(multiplier, "overtime multiplier")))
+            lower = upper
+
+    @classmethod
+    def from_config(cls, config):
+        unknown = set(config) - set(DEFAULT_RULE)
+        if unknown:
+            raise ValueError(f"Unknown pay rule settings: {', '.join(sorted(unknown))}")
+        return cls(**{**DEFAULT_RULE, **config})
+
+    def pay(self, base_salary, overtime_hours=0, incentives=0, advances=0, loans=0):
+        # Scalar version of RuleSet.compute for single saves; returns
+        # (overtime_pay, net_salary)
+        hourly_rate = base_salary / self.hours_per_month
+        hours = overtime_hours
+        if self.overtime_cap_hours is not None:
+            hours = min(hours, self.overtime_cap_hours)
+        overtime_pay = 0.0
+        for lower, upper, multiplier in self.tiers:
+            overtime_pay += max(min(hours, upper) - lower, 0.0) * hourly_rate * multiplier
+        if self.incentive_cap is not None:
+            incentives = min(incentives, self.incentive_cap)
+
+        if self.deduction_cap_pct is None:
+            net_salary = base_salary + overtime_pay + incentives - advances - loans
+        else:
+            gross = base_salary + overtime_pay + incentives
+            net_salary = gross - min(advances + loans, gross * self.deduction_cap_pct / 100)
+        return overtime_pay, net_salary
+
+
+class RuleSet:
+    def __init__(self, config=None, version=None):
+        config = DEFAULT_CONFIG if config is None else config
+        if not isinstance(config, dict) or set(config) - {"default", "positions"}:
+            raise ValueError("Pay rules need a 'default' rule and optional 'positions'")
+        self.config = config
+        self.version = version
+        default = config.get("default") or {}
+        self.default = PayRule.from_config(default)
+        self.positions = {
+            position: PayRule.from_config({**default, **overrides})
+            for position, overrides in (config.get("positions") or {}).items()
+        }
+
+    def for_position(self, position):
+        return self.positions.get(position, self.default)
+
+    def compute(self, positions, base_salary, overtime_hours, incentives, advances, loans):
+        # Vectorized pay over whole NumPy columns; positions is an array of
+        # position names. Returns (overtime_pay, net_salary) arrays.
+        import numpy as np
+
+        names, codes = np.unique(np.asarray(positions, dtype=object).astype(str),
+                                 return_inverse=True)
+        return self.compute_coded(names, codes, base_salary, overtime_hours,
+                                  incentives, advances, loans)
+
+    def compute_coded(self, names, codes, base_salary, overtime_hours, incentives,
+                      advances, loans):
+        # As compute, with positions already factorized into names[codes].
+        # Per-rule parameters are gathered into small tables and broadcast to
+        # the rows by rule index, so the cost is a few array passes however
+        # many positions have their own rule.
+        import numpy as np
+
+        rules = [self.default] + list(self.positions.values())
+        lookup = {position: i + 1 for i, position in enumerate(self.positions)}
+        index = np.array([lookup.get(name, 0) for name in names], dtype=np.intp)[codes]
+
+        def table(getter, missing=np.inf):
+            values = [getter(rule) for rule in rules]
+            return np.array([missing if v is None else v for v in values], dtype=np.float64)[index]
+
+        width = max(len(rule.tiers) for rule in rules)
+        lowers = np.full((len(rules), width), np.inf)
+        widths = np.zeros((len(rules), width))
+        multipliers = np.zeros((len(rules), width))
+        for r, rule in enumerate(rules):
+            for t, (lower, upper, multiplier) in enumerate(rule.tiers):
+                lowers[r, t] = lower
+                widths[r, t] = upper - lower
+                multipliers[r, t] = multiplier
+
+        base_salary = np.asarray(base_salary, dtype=np.float64)
+        incentives = np.asarray(incentives, dtype=np.float64)
+        advances = np.asarray(advances, dtype=np.float64)
+        loans = np.asarray(loans, dtype=np.float64)
+        hourly_rate = base_salary / table(lambda r: r.hours_per_month)
+        hours = np.minimum(np.asarray(overtime_hours, dtype=np.float64),
+                           table(lambda r: r.overtime_cap_hours))
+        in_tier = np.minimum(np.maximum(hours[:, None] - lowers[index], 0.0), widths[index])
+        overtime_pay = (in_tier * hourly_rate[:, None] * multipliers[index]).sum(axis=1)
+        incentives = np.minimum(incentives, table(lambda r: r.incentive_cap))
+
+        net_salary = base_salary + overtime_pay + incentives - advances - loans
+        cap_pct = table(lambda r: r.deduction_cap_pct, np.nan)
+        capped = ~np.isnan(cap_pct)
+        if capped.any():
+            gross = base_salary + overtime_pay + incentives
+            limited = gross - np.minimum(advances + loans, gross * cap_pct / 100)
+            net_salary = np.where(capped, limited, net_salary)
+        return overtime_pay, net_salary
+
+
+DEFAULT_RULES = RuleSet()
+
+
+def create_pay_rules(conn):
+    for statement in PAY_RULES_SCHEMA:
+        conn.execute(statement)
+
+
+@lru_cache(maxsize=64)
+def _parse(version, config_text):
+    return RuleSet(json.loads(config_text), version)
+
+
+def rules_for_period(conn, year, month):
+    # The rule set in force for a payroll month
+    row = conn.execute("""SELECT version, config FROM pay_rules
+                          WHERE (effective_year, effective_month) <= (?, ?)
+                          ORDER BY effective_year DESC, effective_month DESC, version DESC
+                          LIMIT 1""", (year, month)).fetchone()
+    return _parse(*row) if row else DEFAULT_RULES
+
+
+def save_rules(db, config, effective_year, effective_month):
+    # Validates and stores a new version; returns its version number
+    from .records import normalize_month, normalize_year
+
+    RuleSet(config)
+    with db.transaction() as conn:
+        cursor = conn.execute("""INSERT INTO pay_rules (effective_year, effective_month, config)
+                                 VALUES (?, ?, ?)""",
+                              (normalize_year(effective_year), normalize_month(effective_month),
+                               json.dumps(config, sort_keys=True)))
+    return cursor.lastrowid
+
+
+def list_rules(db):
+    return db.execute("""SELECT version, effective_year, effective_month, created_at, config
+                         FROM pay_rules ORDER BY version""")
+
+
+# What-if simulation
+
+class PayrollHistory:
+    # financial_records joined with employees as NumPy columns, loaded once
+    # and then re-priced under any number of rule sets. Money columns are
+    # int64 cents, as stored.
+    MONEY = ("base_salary", "current_base_salary", "incentives", "advances", "loans",
+             "net_salary")
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns["net_salary"])
+
+    @classmethod
+    def load(cls, db, year=None):
+        import numpy as np
+
+        from .archive import archived_years, attach_year, records_schema
+
+        sql = """SELECT e.position, f.base_salary, e.base_salary,
+                        COALESCE(f.overtime_hours, 0), COALESCE(f.incentives, 0),
+                        COALESCE(f.advances, 0), COALESCE(f.loans, 0), f.net_salary
+                 FROM {schema}.financial_records f
+                 JOIN employees e ON e.id = f.employee_id"""
+        params = ()
+        if year is not None:
+            sql += " WHERE f.year = ?"
+            params = (int(year),)
+        with db.connection() as conn:
+            # One year reads wherever it lives; the whole history also reads
+            # every archived year, attaching each as it comes
+            if year is not None:
+                rows = conn.execute(sql.format(schema=records_schema(conn, int(year))),
+                                    params).fetchall()
+            else:
+                rows = conn.execute(sql.format(schema="main")).fetchall()
+                for archived, path in sorted(archived_years(conn).items()):
+                    schema = attach_year(conn, archived, path)
+                    rows += conn.execute(sql.format(schema=schema)).fetchall()
+        names = ("position", "base_salary", "current_base_salary", "overtime_hours",
+                 "incentives", "advances", "loans", "net_salary")
+        columns = list(zip(*rows)) or [()] * len(names)
+        data = {}
+        data["position_names"], data["position_codes"] = np.unique(
+            np.array(columns[0], dtype=str), return_inverse=True)
+        for name, values in zip(names[1:], columns[1:]):
+            data[name] = np.array(values, dtype=np.int64 if name in cls.MONEY else np.float64)
+        return cls(data)
+
+    @classmethod
+    def from_snapshot(cls, snapshot, year=None):
+        # The columns of a finance.snapshot.Snapshot: memory-mapped rather
+        # than copied, unless only one year is wanted. current_base_salary
+        # is as of the export.
+        import numpy as np
+
+        names = cls.MONEY + ("overtime_hours", "position")
+        if year is None:
+            data = {name: snapshot[name] for name in names}
+        else:
+            rows = snapshot["year"] == int(year)
+            data = {name: snapshot[name][rows] for name in names}
+        data["position_names"] = np.array(snapshot.positions, dtype=str)
+        data["position_codes"] = data.pop("position")
+        return cls(data)
+
+
+class SimulationResult:
+    def __init__(self, by_position, rows, seconds):
+        self.by_position = by_position
+        self.rows = rows
+        self.seconds = seconds
+
+    @property
+    def current_total(self):
+        return math.fsum(p["current_total"] for p in self.by_position)
+
+    @property
+    def simulated_total(self):
+        return math.fsum(p["simulated_total"] for p in self.by_position)
+
+    def __repr__(self):
+        return (f"SimulationResult({self.rows} rows in {self.seconds:.3f}s: "
+                f"{self.current_total:,.2f} -> {self.simulated_total:,.2f})")
+
+
+def parse_raises(values):
+    # ["5", "Manager=10"] -> (5.0, {"Manager": 10.0}): a bare number raises
+    # everyone, POSITION=PCT overrides it for one position
+    everyone, positions = 0.0, {}
+    for value in values or ():
+        position, _, pct = value.strip().rpartition("=")
+        try:
+            pct = float(pct)
+        except ValueError:
+            raise ValueError(f"Invalid raise: {value!r}")
+        if position.strip():
+            positions[position.strip()] = pct
+        else:
+            everyone = pct
+    return everyone, positions
+
+
+def simulate(history, rules=None, raise_pct=0.0, position_raises=None, projection=False):
+    # Re-prices every record in history under rules (default: the built-in
+    # formula) with a % raise for everyone, overridden per position by
+    # position_raises. projection=True prices the records on today's base
+    # salaries instead of the ones recorded at the time, i.e. "this year
+    # again, at current pay".
+    import numpy as np
+
+    started = time.perf_counter()
+    rules = rules or DEFAULT_RULES
+    columns = history.columns
+    names, inverse = columns["position_names"], columns["position_codes"]
+
+    raises = position_raises or {}
+    pct = np.array([float(raises.get(name, raise_pct or 0.0)) for name in names])[inverse]
+    base = columns["current_base_salary" if projection else "base_salary"] / MINOR_UNITS
+    base *= 1 + pct / 100
+
+    # Rules price in currency units; the results are rounded to the cent as
+    # a payroll save would store them, and totalled exactly
+    _, net = rules.compute_coded(names, inverse, base, columns["overtime_hours"],
+                                 columns["incentives"] / MINOR_UNITS,
+                                 columns["advances"] / MINOR_UNITS,
+                                 columns["loans"] / MINOR_UNITS)
+
+    current = sum_minor_by(inverse, columns["net_salary"], len(names))
+    simulated = sum_minor_by(inverse, to_minor_array(net), len(names))
+    counts = np.bincount(inverse, minlength=len(names))
+    by_position = [
+        {"position": str(name), "records": int(count), "current_total": before / MINOR_UNITS,
+         "simulated_total": after / MINOR_UNITS, "change": (after - before) / MINOR_UNITS,
+         "change_pct": (after - before) / before * 100 if before else 0.0}
+        for name, count, before, after in zip(names, counts, current.tolist(), simulated.tolist())
+        if count
+    ]
+    return SimulationResult(by_position, len(history), time.perf_counter() - started)
@@ -0,0 +1,58 @@
+import os
+
+from .migrations import current_version, latest_version, migrate
+
+
+def create_tables(c):
+    # Create users table
+    c.execute('''CREATE TABLE IF NOT EXISTS users
+                (id INTEGER PRIMARY KEY,
+                 username TEXT UNIQUE NOT NULL,
+                 password TEXT NOT NULL,
+                 role TEXT NOT NULL)''')
+
+    # Create employees table
+    c.execute('''CREATE TABLE IF NOT EXISTS employees
+                (id INTEGER PRIMARY KEY,
+                 name TEXT UNIQUE NOT NULL,
+                 position TEXT NOT NULL,
+                 base_salary REAL NOT NULL,
+                 join_date DATE NOT NULL)''')
+
+    # Create financial_records table
+    c.execute('''CREATE TABLE IF NOT EXISTS financial_records
+                (id INTEGER PRIMARY KEY,
+                 employee_id INTEGER,
+                 month TEXT NOT NULL,
+                 year INTEGER NOT NULL,
+                 base_salary REAL NOT NULL,
+                 overtime_hours REAL DEFAULT 0,
+                 overtime_pay REAL DEFAULT 0,
+                 incentives REAL DEFAULT 0,
+                 advances REAL DEFAULT 0,
+                 loans REAL DEFAULT 0,
+                 net_salary REAL NOT NULL,
+                 FOREIGN KEY (employee_id) REFERENCES employees (id))''')
+
+
+def init_database(db):
+    # Base tables as first released, then every pending migration. A file
+    # already at the latest version is left alone without taking the write lock.
+    with db.connection() as conn:
+        if current_version(conn) >= latest_version():
+            return []
+    with db.transaction() as conn:
+        create_tables(conn.cursor())
+    return migrate(db)
+
+
+def check_database(db):
+    # For commands that only read: fails with a hint instead of creating or
+    # upgrading the file, which would need the write lock
+    if not os.path.exists(db.path):
+        raise ValueError(f"No database at {db.path}; run `python -m finance init` first")
+    with db.connection() as conn:
+        version = current_version(conn)
+    if version < latest_version():
+        raise ValueError(f"{db.path} is at schema version {version}, this version needs "
+                         f"{latest_version()}; run `python -m finance init` to upgrade it")
@@ -0,0 +1,103 @@
+import re
+
+DEFAULT_LIMIT = 10
+# Matches beyond which results are returned unranked
+RANK_CANDIDATES = 500
+
+# Full-text index over employee name and position for type-ahead search.
+# It is an external-content FTS5 table, so it stores only the index and
+# reads names back from employees; triggers keep it in sync. The prefix
+# option pre-builds indexes for 1-3 character prefixes, which is what a
+# user has typed after the first few keystrokes.
+SEARCH_SCHEMA = [
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS employees_fts USING fts5
+       (name, position, content='employees', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='1 2 3')''',
+    '''CREATE TRIGGER IF NOT EXISTS employees_fts_insert AFTER INSERT ON employees
+       BEGIN
+           INSERT INTO employees_fts (rowid, name, position)
+           VALUES (NEW.id, NEW.name, NEW.position);
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS employees_fts_delete AFTER DELETE ON employees
+       BEGIN
+           INSERT INTO employees_fts (employees_fts, rowid, name, position)
+           VALUES ('delete', OLD.id, OLD.name, OLD.position);
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS employees_fts_update
+       AFTER UPDATE OF name, position ON employees
+       BEGIN
+           INSERT INTO employees_fts (employees_fts, rowid, name, position)
+           VALUES ('delete', OLD.id, OLD.name, OLD.position);
+           INSERT INTO employees_fts (rowid, name, position)
+           VALUES (NEW.id, NEW.name, NEW.position);
+       END''',
+    "INSERT INTO employees_fts (employees_fts) VALUES ('rebuild')",
+]
+
+# Used instead when SQLite was built without FTS5: a case-insensitive
+# name index that answers prefix searches as a range scan.
+FALLBACK_SCHEMA = [
+    "CREATE INDEX IF NOT EXISTS idx_employees_name_nocase ON employees (name COLLATE NOCASE)",
+]
+
+
+def fts5_available(conn):
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp._fts5_probe")
+        return True
+    except Exception:
+        return False
+
+
+def create_search_index(conn):
+    schema = SEARCH_SCHEMA if fts5_available(conn) else FALLBACK_SCHEMA
+    for statement in schema:
+        conn.execute(statement)
+
+
+def _has_fts(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'employees_fts'").fetchone() is not None
+
+
+def _match_expression(text):
+    # "jo dev" -> "jo"* AND "dev"*: every typed word must prefix a word of
+    # the name or position
+    words = re.findall(r"\w+", text)
+    return " AND ".join('"' + word.replace('"', '""') + '"*' for word in words)
+
+
+def search_employees(db, text, limit=DEFAULT_LIMIT):
+    # Returns up to limit (id, name, position) rows, best matches first
+    text = (text or "").strip()
+    if not text:
+        return []
+    with db.connection() as conn:
+        if _has_fts(conn):
+            expression = _match_expression(text)
+            if not expression:
+                return []
+            # Ranking scores every match, which for the first keystroke or two
+            # can be most of the table. Past RANK_CANDIDATES matches the input
+            # is too unspecific for ranking to help, so take index order.
+            candidates = conn.execute("""SELECT rowid FROM employees_fts
+                                         WHERE employees_fts MATCH ? LIMIT ?""",
+                                      (expression, RANK_CANDIDATES + 1)).fetchall()
+            if len(candidates) > RANK_CANDIDATES:
+                ids = [rowid for (rowid,) in candidates[:limit]]
+                return conn.execute(f"""SELECT id, name, position FROM employees
+                                        WHERE id IN ({", ".join("?" * len(ids))})
+                                        ORDER BY name""", ids).fetchall()
+            return conn.execute("""SELECT e.id, e.name, e.position
+                                   FROM employees_fts
+                                   JOIN employees e ON e.id = employees_fts.rowid
+                                   WHERE employees_fts MATCH ?
+                                   ORDER BY rank, e.name
+                                   LIMIT ?""", (expression, limit)).fetchall()
+        # Range scan on the NOCASE index: name >= text and name < text + U+10FFFF
+        return conn.execute("""SELECT id, name, position FROM employees
+                               WHERE name >= ? COLLATE NOCASE
+                                 AND name < ? COLLATE NOCASE
+                               ORDER BY name COLLATE NOCASE
+                               LIMIT ?""", (text, text + "\U0010ffff", limit)).fetchall()
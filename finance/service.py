@@ -0,0 +1,317 @@
+import asyncio
+import json
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from .cache import ReportCache
+from .db import Database
+from .employees import employee_history, get_employee_for_user
+from .ledger import outstanding_balance
+from .metrics import metrics, timed
+from .payroll import write_financial_record
+from .reports import REPORT_TYPES, ReportPager
+from .schema import init_database
+from .search import search_employees
+from .users import authenticate
+from .writer import GroupCommitWriter
+
+# A small HTTP/1.1 JSON service on plain asyncio. Reads run on a bounded
+# thread pool sharing the pooled SQLite connections; every write goes
+# through the GroupCommitWriter, so concurrent clients never fight over
+# SQLite's write lock and their saves share commits.
+#
+#   POST /login          {"username", "password"}      -> {"token", "role"}
+#   GET  /dashboard      employee's details, recent records and loan balances
+#   GET  /reports/<type>?month=&year=&offset=&limit=&sort=&desc=   (admin)
+#   POST /records        {"employee_id", "month", "year", ...}   (admin)
+#   GET  /employees/search?q=&limit=                             (admin)
+#   GET  /metrics?format=json|prometheus   timings (admin; finance.metrics)
+#   GET  /health
+
+DEFAULT_WORKERS = 8
+MAX_BODY = 1024 * 1024
+MAX_PAGE = 1000
+SESSION_TTL = 8 * 3600
+MAX_SESSIONS = 10000
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden",
+               404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+               500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class PlainText(str):
+    # A handler result sent as text/plain instead of JSON
+    pass
+
+
+class Request:
+    def __init__(self, method, path, query, headers, body):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        if not self.body:
+            return {}
+        try:
+            data = json.loads(self.body)
+        except ValueError:
+            raise HTTPError(400, "Request body is not valid JSON")
+        if not isinstance(data, dict):
+            raise HTTPError(400, "Request body must be a JSON object")
+        return data
+
+    def arg(self, name, default=None):
+        values = self.query.get(name)
+        return values[0] if values else default
+
+
+class PayrollService:
+    def __init__(self, db, workers=DEFAULT_WORKERS, cache=None):
+        self.db = db
+        self.cache = cache if cache is not None else ReportCache()
+        self.readers = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="reader")
+        self.writer = GroupCommitWriter(db)
+        # token -> session, oldest first: every session lives SESSION_TTL,
+        # so insertion order is also expiry order
+        self.sessions = {}
+        self.routes = {
+            ("GET", "/health"): self.health,
+            ("POST", "/login"): self.login,
+            ("GET", "/dashboard"): self.dashboard,
+            ("POST", "/records"): self.save_record,
+            ("GET", "/employees/search"): self.search,
+            ("GET", "/metrics"): self.metrics,
+        }
+
+    async def read(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.readers, func, *args)
+
+    # Sessions
+
+    def _session(self, request, role=None):
+        header = request.headers.get("authorization", "")
+        token = header[7:] if header.lower().startswith("bearer ") else None
+        session = self.sessions.get(token)
+        if session is None or session["expires"] < time.monotonic():
+            self.sessions.pop(token, None)
+            raise HTTPError(401, "Login required")
+        if role and session["role"] != role:
+            raise HTTPError(403, "Not allowed for this user")
+        return session
+
+    def _start_session(self, username, role):
+        # Expired sessions are dropped on each login, and past MAX_SESSIONS
+        # the oldest go too, so a long-running service does not keep every
+        # token it ever issued
+        now = time.monotonic()
+        while self.sessions:
+            token, session = next(iter(self.sessions.items()))
+            if session["expires"] >= now and len(self.sessions) < MAX_SESSIONS:
+                break
+            del self.sessions[token]
+        token = secrets.token_urlsafe(24)
+        self.sessions[token] = {"username": username, "role": role,
+                                "expires": now + SESSION_TTL}
+        return token
+
+    # Handlers
+
+    async def health(self, request):
+        return {"status": "ok"}
+
+    async def login(self, request):
+        data = request.json()
+        username, password = data.get("username"), data.get("password")
+        if not username or not password:
+            raise HTTPError(400, "Please fill in all fields")
+        role = await self.read(authenticate, self.db, username, password)
+        if not role:
+            raise HTTPError(401, "Invalid username or password")
+        return {"token": self._start_session(username, role), "role": role}
+
+    async def dashboard(self, request):
+        session = self._session(request)
+
+        def load():
+            employee = get_employee_for_user(self.db, session["username"])
+            if not employee:
+                return {"employee": None, "records": [], "outstanding": None}
+            keys = ("id", "name", "position", "base_salary", "join_date")
+            columns = ("month", "year", "base_salary", "overtime_pay", "incentives",
+                       "advances", "loans", "net_salary")
+            return {
+                "employee": dict(zip(keys, employee)),
+                "records": [dict(zip(columns, r)) for r in employee_history(self.db, employee[0])],
+                "outstanding": outstanding_balance(self.db, employee[0]),
+            }
+
+        return await self.read(load)
+
+    async def report(self, request, report_type):
+        self._session(request, "admin")
+        try:
+            offset = max(0, int(request.arg("offset", 0)))
+            limit = min(MAX_PAGE, max(1, int(request.arg("limit", 100))))
+        except ValueError:
+            raise HTTPError(400, "offset and limit must be integers")
+
+        def load():
+            pager = ReportPager(self.db, report_type, request.arg("month"),
+                                request.arg("year"), cache=self.cache)
+            # Sorting first, so only the requested order's pages are queried
+            pager.load_columns()
+            if request.arg("sort"):
+                pager.sort(request.arg("sort"), request.arg("desc") in ("1", "true"))
+            rows = pager.rows(offset, offset + limit)
+            return {"columns": pager.columns, "total": pager.count(),
+                    "offset": offset, "rows": [list(r) for r in rows]}
+
+        return await self.read(load)
+
+    async def search(self, request):
+        self._session(request, "admin")
+        try:
+            limit = min(MAX_PAGE, max(1, int(request.arg("limit", 10))))
+        except ValueError:
+            raise HTTPError(400, "limit must be an integer")
+        rows = await self.read(search_employees, self.db, request.arg("q", ""), limit)
+        return {"employees": [{"id": i, "name": n, "position": p} for i, n, p in rows]}
+
+    async def save_record(self, request):
+        self._session(request, "admin")
+        data = request.json()
+        try:
+            amounts = [float(data.get(field) or 0)
+                       for field in ("overtime_hours", "incentives", "advances", "loans")]
+        except (TypeError, ValueError):
+            raise HTTPError(400, "Please enter valid numbers for all financial fields")
+        return await asyncio.wrap_future(self.writer.submit(
+            write_financial_record, data.get("employee_id"),
+            data.get("month"), data.get("year"), *amounts))
+
+    async def metrics(self, request):
+        self._session(request, "admin")
+        if request.arg("format") == "prometheus":
+            return PlainText(metrics.to_prometheus())
+        return metrics.snapshot()
+
+    async def dispatch(self, request):
+        handler = self.routes.get((request.method, request.path))
+        if handler:
+            with timed("http", f"{request.method} {request.path}"):
+                return await handler(request)
+        if request.path.startswith("/reports/"):
+            if request.method != "GET":
+                raise HTTPError(405, "Use GET")
+            report_type = request.path[len("/reports/"):].replace("-", " ").replace("_", " ")
+            match = [t for t in REPORT_TYPES if t.lower() == report_type.lower()]
+            if not match:
+                raise HTTPError(404, f"Unknown report: {report_type}")
+            with timed("http", f"GET /reports/{match[0]}"):
+                return await self.report(request, match[0])
+        if any(path == request.path for _, path in self.routes):
+            raise HTTPError(405, "Method not allowed")
+        raise HTTPError(404, "Not found")
+
+    # HTTP plumbing
+
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, _ = line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length") or 0)
+        if length > MAX_BODY:
+            raise HTTPError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b""
+        url = urlsplit(target)
+        return Request(method.upper(), url.path.rstrip("/") or "/", parse_qs(url.query),
+                       headers, body)
+
+    @staticmethod
+    def _response(status, payload, keep_alive):
+        if isinstance(payload, PlainText):
+            body, content_type = payload.encode(), "text/plain; version=0.0.4"
+        else:
+            body, content_type = json.dumps(payload, default=str).encode(), "application/json"
+        head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        return head.encode() + body
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await self._read_request(reader)
+                    if request is None:
+                        break
+                    keep_alive = request.headers.get("connection", "").lower() != "close"
+                    status, payload = 200, await self.dispatch(request)
+                except HTTPError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except ValueError as e:
+                    status, payload = 400, {"error": str(e)}
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except Exception as e:
+                    status, payload = 500, {"error": f"An error occurred: {e}"}
+                writer.write(self._response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8080, ready=None):
+        server = await asyncio.start_server(self.handle_connection, host, port, backlog=1024)
+        if ready:
+            ready(server.sockets[0].getsockname()[:2])
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.writer.close()
+            self.readers.shutdown(wait=False)
+
+
+def run(db_path, host="127.0.0.1", port=8080, workers=DEFAULT_WORKERS):
+    # The writer has its own connection outside the pool
+    db = Database(db_path, pool_size=workers)
+    init_database(db)
+    service = PayrollService(db, workers)
+
+    def ready(address):
+        print(f"Listening on http://{address[0]}:{address[1]}", flush=True)
+
+    try:
+        asyncio.run(service.serve(host, port, ready))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        db.close()
@@ -0,0 +1,258 @@
+import json
+import os
+import time
+from datetime import datetime
+
+from .archive import archived_years, attach_year, records_schema
+from .cache import scope_versions
+from .money import MINOR_UNITS, sum_minor_by
+from .records import normalize_year
+
+# Columnar snapshots of the payroll history for analysis and what-if
+# simulation. A snapshot is one file holding every financial record (joined
+# with its employee) as a typed array per column, so it can be memory-mapped
+# and used as NumPy arrays without parsing or copying: opening a snapshot of
+# millions of records costs a header read, and pages load as columns are used.
+#
+# Layout, all little-endian:
+#   MAGIC, header length (uint64), JSON header, padding,
+#   then each column's values back to back, every column 64-byte aligned.
+# The header lists the columns (name, dtype, offset from the start of the
+# data), the row count, the position names the "position" codes index, and
+# the data versions of the tables it was taken from (finance.cache), so a
+# reader can tell when it is out of date. Money columns are int64 cents, as
+# stored (finance.money), and sum exactly.
+MAGIC = b"EFSNAP1\n"
+ALIGNMENT = 64
+CHUNK_ROWS = 65536
+
+SNAPSHOT_COLUMNS = (
+    ("employee_id", "<i8"),
+    ("year", "<i2"),
+    ("month", "<i1"),
+    ("position", "<i4"),
+    ("base_salary", "<i8"),
+    ("current_base_salary", "<i8"),
+    ("overtime_hours", "<f8"),
+    ("overtime_pay", "<i8"),
+    ("incentives", "<i8"),
+    ("advances", "<i8"),
+    ("loans", "<i8"),
+    ("net_salary", "<i8"),
+)
+
+# The record columns read from SQL; position and current_base_salary come
+# from the employees table, looked up by employee_id in NumPy
+SNAPSHOT_SQL = """
+    SELECT f.employee_id, f.year, f.month, f.base_salary, COALESCE(f.overtime_hours, 0),
+           COALESCE(f.overtime_pay, 0), COALESCE(f.incentives, 0),
+           COALESCE(f.advances, 0), COALESCE(f.loans, 0), f.net_salary
+    FROM {schema}.financial_records f
+    JOIN employees e ON e.id = f.employee_id
+    {where}
+    ORDER BY f.year, f.month, f.employee_id
+"""
+
+SNAPSHOT_COUNT_SQL = """
+    SELECT COUNT(*) FROM {schema}.financial_records f
+    JOIN employees e ON e.id = f.employee_id
+    {where}
+"""
+_SQL_COLUMNS = ("employee_id", "year", "month", "base_salary", "overtime_hours",
+                "overtime_pay", "incentives", "advances", "loans", "net_salary")
+
+# Scopes whose data versions a snapshot records
+SNAPSHOT_SCOPES = ("employees", "financial_records")
+
+
+class SnapshotResult:
+    def __init__(self, path, rows, size, seconds):
+        self.path = path
+        self.rows = rows
+        self.size = size
+        self.seconds = seconds
+
+    def __repr__(self):
+        return (f"SnapshotResult({self.path}: {self.rows} records, {self.size:,} bytes "
+                f"in {self.seconds:.3f}s)")
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _employee_lookup(conn, positions):
+    # (position code, base salary) arrays indexed by employee id; -1 where
+    # there is no such employee
+    import numpy as np
+
+    rows = conn.execute("SELECT id, position, base_salary FROM employees").fetchall()
+    size = max((row[0] for row in rows), default=0) + 1
+    codes = np.full(size, -1, dtype=np.int32)
+    salaries = np.zeros(size, dtype=np.int64)
+    index = {position: code for code, position in enumerate(positions)}
+    for employee_id, position, salary in rows:
+        codes[employee_id] = index[position]
+        salaries[employee_id] = salary
+    return codes, salaries
+
+
+def _read_columns(conn, schema, where, params, employees):
+    # {column: array} for one source, filled chunk by chunk
+    import numpy as np
+
+    dtypes = dict(SNAPSHOT_COLUMNS)
+    rows = conn.execute(SNAPSHOT_COUNT_SQL.format(schema=schema, where=where),
+                        params).fetchone()[0]
+    arrays = {name: np.empty(rows, dtype=dtypes[name]) for name in _SQL_COLUMNS}
+    cursor = conn.execute(SNAPSHOT_SQL.format(schema=schema, where=where), params)
+    start = 0
+    while True:
+        chunk = cursor.fetchmany(CHUNK_ROWS)
+        if not chunk:
+            break
+        end = start + len(chunk)
+        for name, values in zip(_SQL_COLUMNS, zip(*chunk)):
+            arrays[name][start:end] = values
+        start = end
+
+    codes, salaries = employees
+    ids = arrays["employee_id"]
+    if start != rows or (len(ids) and (ids.max() >= len(codes) or (codes[ids] < 0).any())):
+        raise RuntimeError("The payroll tables changed while the snapshot was taken; try again")
+    arrays["position"] = codes[ids]
+    arrays["current_base_salary"] = salaries[ids]
+    return arrays
+
+
+def write_snapshot(db, path, year=None):
+    # Writes the records of one year, or of every year including archived
+    # ones, to path (replaced atomically)
+    started = time.perf_counter()
+    year = None if year is None else normalize_year(year)
+    params = () if year is None else (year,)
+    where = "" if year is None else "WHERE f.year = ?"
+    parts = []
+    with db.connection() as conn:
+        schema = "main" if year is None else records_schema(conn, year)
+        # The main database is read in one transaction, so its rows, the
+        # employees, the archive registry and the data versions agree.
+        # Archives are immutable and read afterwards (ATTACH is not allowed
+        # inside a transaction).
+        conn.execute("BEGIN")
+        try:
+            positions = [p for (p,) in conn.execute(
+                "SELECT DISTINCT position FROM employees ORDER BY position")]
+            employees = _employee_lookup(conn, positions)
+            versions = scope_versions(conn, SNAPSHOT_SCOPES)
+            archives = sorted(archived_years(conn).items()) if year is None else []
+            main = _read_columns(conn, schema, where, params, employees)
+        finally:
+            conn.execute("COMMIT")
+        for archived, archive_path in archives:
+            parts.append(_read_columns(conn, attach_year(conn, archived, archive_path),
+                                       where, params, employees))
+        parts.append(main)
+
+    # Each column is its parts back to back: archived years, then main
+    rows = sum(len(part["employee_id"]) for part in parts)
+    columns, offset = [], 0
+    for name, dtype in SNAPSHOT_COLUMNS:
+        columns.append({"name": name, "dtype": dtype, "offset": offset})
+        offset = _aligned(offset + sum(part[name].nbytes for part in parts))
+    header = json.dumps({
+        "format": 1,
+        "rows": rows,
+        "year": year,
+        "minor_units": MINOR_UNITS,
+        "positions": positions,
+        "columns": columns,
+        "data_versions": versions,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+    }).encode("utf-8")
+
+    partial = path + ".partial"
+    try:
+        with open(partial, "wb") as f:
+            f.write(MAGIC)
+            f.write(len(header).to_bytes(8, "little"))
+            f.write(header)
+            data_start = _aligned(f.tell())
+            for column in columns:
+                f.seek(data_start + column["offset"])
+                for part in parts:
+                    f.write(part[column["name"]].tobytes())
+            f.truncate(data_start + offset)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    os.replace(partial, path)
+    return SnapshotResult(path, rows, os.path.getsize(path), time.perf_counter() - started)
+
+
+class Snapshot:
+    # A snapshot file opened read-only; snapshot["net_salary"] is a NumPy
+    # array backed by the file's pages
+    def __init__(self, path, header, columns):
+        self.path = path
+        self.header = header
+        self._columns = columns
+
+    @classmethod
+    def open(cls, path):
+        import numpy as np
+
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a payroll snapshot")
+            length = int.from_bytes(f.read(8), "little")
+            header = json.loads(f.read(length))
+        if header.get("format") != 1:
+            raise ValueError(f"Unsupported snapshot format: {header.get('format')!r}")
+        data_start = _aligned(len(MAGIC) + 8 + length)
+        # One read-only mapping of the whole file; each column is a view
+        mapped = np.memmap(path, dtype=np.uint8, mode="r")
+        rows = header["rows"]
+        columns = {}
+        for column in header["columns"]:
+            dtype = np.dtype(column["dtype"])
+            start = data_start + column["offset"]
+            columns[column["name"]] = mapped[start:start + rows * dtype.itemsize].view(dtype)
+        return cls(path, header, columns)
+
+    def __len__(self):
+        return self.header["rows"]
+
+    def __getitem__(self, name):
+        return self._columns[name]
+
+    @property
+    def column_names(self):
+        return list(self._columns)
+
+    @property
+    def positions(self):
+        return self.header["positions"]
+
+    def totals(self, column, by="position"):
+        # {group: exact total in cents} of a money column, grouped by
+        # position name or by any integer column (year, month, employee_id)
+        import numpy as np
+
+        if by == "position":
+            keys = self.positions
+            codes = self["position"]
+        else:
+            keys, codes = np.unique(self[by], return_inverse=True)
+            keys = keys.tolist()
+        sums = sum_minor_by(codes, self[column], len(keys))
+        return {key: total for key, total in zip(keys, sums.tolist()) if total}
+
+    def is_current(self, db):
+        # False once employees or financial records changed after the export
+        with db.connection() as conn:
+            versions = scope_versions(conn, SNAPSHOT_SCOPES)
+        return [list(v) for v in versions] == self.header["data_versions"]
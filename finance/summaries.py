@@ -0,0 +1,238 @@
+import argparse
+
+# Pre-aggregated rows behind the Employee Summary and Department Summary
+# reports. Triggers on financial_records and employees keep them current on
+# every write path (manual save, payroll run, bulk import), so the reports
+# read a handful of rows instead of re-aggregating the whole history.
+#
+# financial_records is unique per (employee, year, month), so each record in
+# a position/month bucket is a distinct employee and employee_count is just
+# the number of records in it. Totals are in cents like the records
+# (see finance.money), so adding and removing rows never drifts.
+SUMMARY_TABLES = [
+    '''CREATE TABLE IF NOT EXISTS employee_year_summary
+       (employee_id INTEGER NOT NULL,
+        year INTEGER NOT NULL,
+        record_count INTEGER NOT NULL,
+        total_net_salary INTEGER NOT NULL,
+        total_overtime_pay INTEGER NOT NULL,
+        total_incentives INTEGER NOT NULL,
+        PRIMARY KEY (employee_id, year)) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS position_month_summary
+       (position TEXT NOT NULL,
+        year INTEGER NOT NULL,
+        month INTEGER NOT NULL,
+        employee_count INTEGER NOT NULL,
+        total_net_salary INTEGER NOT NULL,
+        PRIMARY KEY (year, month, position)) WITHOUT ROWID''',
+    '''CREATE INDEX IF NOT EXISTS idx_employee_year_summary_year
+       ON employee_year_summary (year, employee_id)''',
+]
+
+# Row-level building blocks; {row} is NEW or OLD inside a trigger body
+_ADD_EMPLOYEE_YEAR = '''
+    INSERT INTO employee_year_summary
+        (employee_id, year, record_count, total_net_salary,
+         total_overtime_pay, total_incentives)
+    SELECT {row}.employee_id, {row}.year, 1, {row}.net_salary,
+           COALESCE({row}.overtime_pay, 0), COALESCE({row}.incentives, 0)
+    WHERE EXISTS (SELECT 1 FROM employees WHERE id = {row}.employee_id)
+    ON CONFLICT (employee_id, year) DO UPDATE SET
+        record_count = record_count + 1,
+        total_net_salary = total_net_salary + excluded.total_net_salary,
+        total_overtime_pay = total_overtime_pay + excluded.total_overtime_pay,
+        total_incentives = total_incentives + excluded.total_incentives;
+'''
+
+_REMOVE_EMPLOYEE_YEAR = '''
+    UPDATE employee_year_summary SET
+        record_count = record_count - 1,
+        total_net_salary = total_net_salary - {row}.net_salary,
+        total_overtime_pay = total_overtime_pay - COALESCE({row}.overtime_pay, 0),
+        total_incentives = total_incentives - COALESCE({row}.incentives, 0)
+    WHERE employee_id = {row}.employee_id AND year = {row}.year;
+    DELETE FROM employee_year_summary
+    WHERE employee_id = {row}.employee_id AND year = {row}.year AND record_count <= 0;
+'''
+
+_ADD_POSITION_MONTH = '''
+    INSERT INTO position_month_summary
+        (position, year, month, employee_count, total_net_salary)
+    SELECT e.position, {row}.year, {row}.month, 1, {row}.net_salary
+    FROM employees e WHERE e.id = {row}.employee_id
+    ON CONFLICT (year, month, position) DO UPDATE SET
+        employee_count = employee_count + 1,
+        total_net_salary = total_net_salary + excluded.total_net_salary;
+'''
+
+_REMOVE_POSITION_MONTH = '''
+    UPDATE position_month_summary SET
+        employee_count = employee_count - 1,
+        total_net_salary = total_net_salary - {row}.net_salary
+    WHERE year = {row}.year AND month = {row}.month
+      AND position = (SELECT position FROM employees WHERE id = {row}.employee_id);
+    DELETE FROM position_month_summary
+    WHERE year = {row}.year AND month = {row}.month AND employee_count <= 0;
+'''
+
+SUMMARY_TRIGGERS = [
+    f'''CREATE TRIGGER IF NOT EXISTS financial_records_summary_insert
+        AFTER INSERT ON financial_records
+        BEGIN
+            {_ADD_EMPLOYEE_YEAR.format(row="NEW")}
+            {_ADD_POSITION_MONTH.format(row="NEW")}
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS financial_records_summary_delete
+        AFTER DELETE ON financial_records
+        BEGIN
+            {_REMOVE_EMPLOYEE_YEAR.format(row="OLD")}
+            {_REMOVE_POSITION_MONTH.format(row="OLD")}
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS financial_records_summary_update
+        AFTER UPDATE ON financial_records
+        BEGIN
+            {_REMOVE_EMPLOYEE_YEAR.format(row="OLD")}
+            {_REMOVE_POSITION_MONTH.format(row="OLD")}
+            {_ADD_EMPLOYEE_YEAR.format(row="NEW")}
+            {_ADD_POSITION_MONTH.format(row="NEW")}
+        END''',
+    # A change of position moves the employee's months between buckets
+    '''CREATE TRIGGER IF NOT EXISTS employees_summary_position
+        AFTER UPDATE OF position ON employees
+        WHEN OLD.position IS NOT NEW.position
+        BEGIN
+            UPDATE position_month_summary SET
+                employee_count = employee_count - 1,
+                total_net_salary = total_net_salary - (
+                    SELECT f.net_salary FROM financial_records f
+                    WHERE f.employee_id = NEW.id
+                      AND f.year = position_month_summary.year
+                      AND f.month = position_month_summary.month)
+            WHERE position = OLD.position
+              AND (year, month) IN (SELECT year, month FROM financial_records
+                                    WHERE employee_id = NEW.id);
+            DELETE FROM position_month_summary
+            WHERE position = OLD.position AND employee_count <= 0;
+            INSERT INTO position_month_summary
+                (position, year, month, employee_count, total_net_salary)
+            SELECT NEW.position, year, month, 1, net_salary
+            FROM financial_records WHERE employee_id = NEW.id
+            ON CONFLICT (year, month, position) DO UPDATE SET
+                employee_count = employee_count + 1,
+                total_net_salary = total_net_salary + excluded.total_net_salary;
+        END''',
+    # Records loaded before their employee start counting once it exists
+    '''CREATE TRIGGER IF NOT EXISTS employees_summary_insert
+        AFTER INSERT ON employees
+        BEGIN
+            INSERT INTO employee_year_summary
+                (employee_id, year, record_count, total_net_salary,
+                 total_overtime_pay, total_incentives)
+            SELECT employee_id, year, COUNT(*), SUM(net_salary),
+                   SUM(COALESCE(overtime_pay, 0)), SUM(COALESCE(incentives, 0))
+            FROM financial_records WHERE employee_id = NEW.id
+            GROUP BY year;
+            INSERT INTO position_month_summary
+                (position, year, month, employee_count, total_net_salary)
+            SELECT NEW.position, year, month, 1, net_salary
+            FROM financial_records WHERE employee_id = NEW.id
+            ON CONFLICT (year, month, position) DO UPDATE SET
+                employee_count = employee_count + 1,
+                total_net_salary = total_net_salary + excluded.total_net_salary;
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS employees_summary_delete
+        AFTER DELETE ON employees
+        BEGIN
+            UPDATE position_month_summary SET
+                employee_count = employee_count - 1,
+                total_net_salary = total_net_salary - (
+                    SELECT f.net_salary FROM financial_records f
+                    WHERE f.employee_id = OLD.id
+                      AND f.year = position_month_summary.year
+                      AND f.month = position_month_summary.month)
+            WHERE position = OLD.position
+              AND (year, month) IN (SELECT year, month FROM financial_records
+                                    WHERE employee_id = OLD.id);
+            DELETE FROM position_month_summary
+            WHERE position = OLD.position AND employee_count <= 0;
+            DELETE FROM employee_year_summary WHERE employee_id = OLD.id;
+        END''',
+]
+
+# The same aggregates computed from the raw tables
+_EMPLOYEE_YEAR_FROM_RECORDS = '''
+    SELECT f.employee_id, f.year, COUNT(*), SUM(f.net_salary),
+           SUM(COALESCE(f.overtime_pay, 0)), SUM(COALESCE(f.incentives, 0))
+    FROM employees e
+    JOIN financial_records f ON e.id = f.employee_id
+    GROUP BY f.employee_id, f.year
+'''
+
+_POSITION_MONTH_FROM_RECORDS = '''
+    SELECT e.position, f.year, f.month, COUNT(DISTINCT e.id), SUM(f.net_salary)
+    FROM employees e
+    JOIN financial_records f ON e.id = f.employee_id
+    GROUP BY e.position, f.year, f.month
+'''
+
+
+def create_summaries(conn):
+    for statement in SUMMARY_TABLES + SUMMARY_TRIGGERS:
+        conn.execute(statement)
+    _rebuild(conn)
+
+
+def _rebuild(conn):
+    conn.execute("DELETE FROM employee_year_summary")
+    conn.execute("DELETE FROM position_month_summary")
+    conn.execute(f"INSERT INTO employee_year_summary {_EMPLOYEE_YEAR_FROM_RECORDS}")
+    conn.execute(f"INSERT INTO position_month_summary {_POSITION_MONTH_FROM_RECORDS}")
+
+
+def rebuild_summaries(db):
+    with db.transaction() as conn:
+        _rebuild(conn)
+
+
+def compare_rows(conn, label, expected_sql, stored_sql, key_size):
+    # Diffs a maintained table against the query that computes it from the
+    # raw data, both keyed on their first key_size columns. Returns (label,
+    # key, expected, stored) per key that differs. Shared by the summary and
+    # ledger verifiers.
+    def load(sql):
+        return {row[:key_size]: row[key_size:] for row in conn.execute(sql)}
+
+    expected, stored = load(expected_sql), load(stored_sql)
+    problems = []
+    for key in expected.keys() | stored.keys():
+        want, got = expected.get(key), stored.get(key)
+        if want != got:
+            problems.append((label, key, want, got))
+    return problems
+
+
+def verify_summaries(db):
+    # Returns (table, key, expected, stored) for every bucket that disagrees
+    # with the raw data; an empty list means the summaries are correct.
+    with db.connection() as conn:
+        problems = compare_rows(conn, "employee_year_summary", _EMPLOYEE_YEAR_FROM_RECORDS,
+                                "SELECT * FROM employee_year_summary", 2)
+        problems += compare_rows(conn, "position_month_summary", _POSITION_MONTH_FROM_RECORDS,
+                                 "SELECT position, year, month, employee_count, total_net_salary "
+                                 "FROM position_month_summary", 3)
+    return problems
+
+
+def main(argv=None):
+    # Same as "python -m finance summaries ..."
+    from .cli import main as cli_main
+
+    parser = argparse.ArgumentParser(description="Rebuild or verify the report summary tables")
+    parser.add_argument("command", choices=["rebuild", "verify"])
+    parser.add_argument("--db")
+    args = parser.parse_args(argv)
+    return cli_main((["--db", args.db] if args.db else []) + ["summaries", args.command])
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
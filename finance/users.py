@@ -0,0 +1,21 @@
+import sqlite3
+
+
+def authenticate(db, username, password):
+    # Returns the user's role, or None when the credentials do not match
+    result = db.fetchone("SELECT role FROM users WHERE username=? AND password=?",
+                         (username, password))
+    return result[0] if result else None
+
+
+def register_user(db, username, password, role="employee"):
+    if not username or not password:
+        raise ValueError("Please fill in all fields")
+    if role not in ("employee", "admin"):
+        raise ValueError(f"Invalid role: {role}")
+    try:
+        with db.transaction() as conn:
+            conn.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
+                         (username, password, role))
+    except sqlite3.IntegrityError:
+        raise ValueError("Username already exists")
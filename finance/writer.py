@@ -0,0 +1,117 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+DEFAULT_MAX_BATCH = 256
+DEFAULT_MAX_DELAY = 0.005
+
+_STOP = object()
+
+
+class GroupCommitWriter:
+    # One background thread that owns all record writes. Callers from any
+    # thread submit a write function and get a Future back; the thread packs
+    # whatever has queued up (up to max_batch, waiting at most max_delay
+    # after the first write) into one transaction and one commit.
+    #
+    # Each write runs in its own SAVEPOINT, so a write that fails validation
+    # is rolled back alone and only its caller sees the error. Futures are
+    # resolved after COMMIT returns, so a caller never hears "saved" for a
+    # write that could still be lost. The writer's connection runs with
+    # synchronous=FULL: every group commit is durable, and the fsync is
+    # shared by the whole group instead of paid per record.
+    def __init__(self, db, max_batch=DEFAULT_MAX_BATCH, max_delay=DEFAULT_MAX_DELAY,
+                 synchronous="FULL"):
+        self.db = db
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._conn = db.connect(synchronous=synchronous)
+        self._queue = queue.Queue()
+        self._closed = False
+        self.commits = 0
+        self.writes = 0
+        self._thread = threading.Thread(target=self._run, name="group-commit-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, func, *args, **kwargs):
+        # func(conn, *args, **kwargs) runs inside the group transaction
+        if self._closed:
+            raise RuntimeError("Writer is closed")
+        future = Future()
+        self._queue.put((func, args, kwargs, future))
+        return future
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                break
+            self._commit(batch)
+        self._conn.close()
+
+    def _commit(self, batch):
+        conn = self._conn
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for func, args, kwargs, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT write")
+                try:
+                    result = func(conn, *args, **kwargs)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write")
+                    conn.execute("RELEASE write")
+                    outcomes.append((future, None, e))
+                else:
+                    conn.execute("RELEASE write")
+                    outcomes.append((future, result, None))
+            conn.execute("COMMIT")
+        except Exception as e:
+            # The group as a whole failed (database locked, disk full):
+            # nobody was saved. If BEGIN itself failed no write has started,
+            # so pending futures are moved to running first; cancelled ones
+            # are left as they are.
+            if conn.in_transaction:
+                conn.rollback()
+            for _, _, _, future in batch:
+                if future.done():
+                    continue
+                if future.running() or future.set_running_or_notify_cancel():
+                    future.set_exception(e)
+            return
+
+        self.commits += 1
+        self.writes += sum(1 for _, _, error in outcomes if error is None)
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def close(self):
+        # Finishes everything already submitted, then stops the thread
+        if not self._closed:
+            self._closed = True
+            self._queue.put(_STOP)
+            self._thread.join()
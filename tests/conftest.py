@@ -0,0 +1,30 @@
+import pytest
+
+from finance import Database
+from finance.employees import add_employee
+from finance.schema import init_database
+
+
+@pytest.fixture
+def blank_db(tmp_path):
+    # A database file with no tables yet
+    db = Database(str(tmp_path / "finance.db"))
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def db(blank_db):
+    init_database(blank_db)
+    return blank_db
+
+
+
+@pytest.fixture
+def staff(db):
+    # {name: employee id} for a small team over two positions
+    return {
+        "ana": add_employee(db, "ana", "Engineer", 4200.50, "2023-01-10"),
+        "ben": add_employee(db, "ben", "Engineer", 3900, "2023-03-01"),
+        "cy": add_employee(db, "cy", "Manager", 5100.25, "2022-07-15"),
+    }
@@ -0,0 +1,94 @@
+from finance.ledger import (issue_loan, loan_statement, outstanding_balance, rebuild_ledger,
+                            verify_ledger)
+from finance.payroll import run_payroll, save_financial_record
+from finance.rules import save_rules
+
+
+def _deductions(db, employee_id):
+    return db.execute("""SELECT month, advances, loans FROM financial_records
+                         WHERE employee_id = ? ORDER BY year, month""", (employee_id,))
+
+
+def test_installments_repay_a_loan_exactly(db, staff):
+    ana = staff["ana"]
+    loan = issue_loan(db, ana, "loan", 1000.10, 1, 2024, installment=333.37)
+
+    for month in range(1, 6):
+        run_payroll(db, month, 2024)
+
+    assert verify_ledger(db) == []
+    assert [row[2] for row in _deductions(db, ana)] == [33337, 33337, 33336, 0, 0]
+    assert loan_statement(db, loan) == [(2024, 1, 333.37, 666.73), (2024, 2, 333.37, 333.36),
+                                        (2024, 3, 333.36, 0.0)]
+    assert outstanding_balance(db, ana) == {"loan": 0.0, "advance": 0.0}
+
+
+def test_running_balances_follow_reruns_and_back_dated_months(db, staff):
+    ben = staff["ben"]
+    loan = issue_loan(db, ben, "loan", 900, 1, 2024, installment=200)
+    issue_loan(db, ben, "advance", 150, 2, 2024)
+
+    save_financial_record(db, ben, 3, 2024)
+    save_financial_record(db, ben, 1, 2024)
+    assert verify_ledger(db) == []
+    # Re-saving a month re-posts it rather than adding a second installment
+    save_financial_record(db, ben, 3, 2024, incentives=10)
+    run_payroll(db, 2, 2024)
+    assert verify_ledger(db) == []
+
+    # The advance, due from February, was first taken in March, saved earlier
+    assert [row[1:] for row in _deductions(db, ben)] == [(0, 20000), (0, 20000), (15000, 20000)]
+    assert [row[3] for row in loan_statement(db, loan)] == [700.0, 500.0, 300.0]
+    assert outstanding_balance(db, ben) == {"loan": 300.0, "advance": 0.0}
+
+
+def test_deductions_capped_by_pay_rules(db, staff):
+    cy = staff["cy"]
+    save_rules(db, {"default": {"deduction_cap_pct": 10}}, 2024, 1)
+    issue_loan(db, cy, "loan", 2000, 1, 2024, installment=1000)
+
+    run_payroll(db, 1, 2024)
+
+    # The record shows the installment asked for, but only 10% of 5,100.25
+    # comes off the pay (510.02 once net pay is rounded to the cent), and
+    # only that is posted to the loan
+    assert db.execute("SELECT loans, net_salary FROM financial_records "
+                      "WHERE employee_id = ?", (cy,)) == [(100000, 459023)]
+    assert verify_ledger(db) == []
+    assert outstanding_balance(db, cy)["loan"] == 1489.98
+
+
+def test_direct_edits_keep_the_ledger_consistent(db, staff):
+    ana, ben = staff["ana"], staff["ben"]
+    loan = issue_loan(db, ana, "loan", 600, 1, 2024, installment=100)
+    issue_loan(db, ben, "loan", 500, 1, 2024, installment=250)
+    for month in range(1, 4):
+        run_payroll(db, month, 2024, overwrite=True)
+
+    with db.transaction() as conn:
+        conn.execute("UPDATE loan_repayments SET amount = 5000 WHERE loan_id = ? AND month = 2",
+                     (loan,))
+        conn.execute("DELETE FROM loan_repayments WHERE loan_id = ? AND month = 1", (loan,))
+        conn.execute("UPDATE loans SET principal = 80000 WHERE id = ?", (loan,))
+    assert verify_ledger(db) == []
+
+    with db.transaction() as conn:
+        conn.execute("UPDATE loans SET employee_id = ? WHERE id = ?", (ben, loan))
+    assert verify_ledger(db) == []
+
+    with db.transaction() as conn:
+        conn.execute("DELETE FROM loans WHERE id = ?", (loan,))
+    assert verify_ledger(db) == []
+    assert db.execute("SELECT COUNT(*) FROM loan_repayments WHERE loan_id = ?", (loan,)) == [(0,)]
+
+
+def test_verify_reports_drift_and_rebuild_fixes_it(db, staff):
+    loan = issue_loan(db, staff["ana"], "loan", 600, 1, 2024, installment=100)
+    run_payroll(db, 1, 2024)
+    run_payroll(db, 2, 2024)
+    with db.transaction() as conn:
+        conn.execute("UPDATE loan_repayments SET balance_after = 0 WHERE loan_id = ?", (loan,))
+
+    assert {problem[0] for problem in verify_ledger(db)} == {"loan_repayments.balance_after"}
+    rebuild_ledger(db)
+    assert verify_ledger(db) == []
@@ -0,0 +1,85 @@
+from finance.ledger import verify_ledger
+from finance.migrations import MIGRATIONS, current_version, latest_version, migrate
+from finance.schema import create_tables, init_database
+from finance.summaries import verify_summaries
+
+# Rows as the first release saved them: month as free text, year possibly
+# text, money as REAL, and the same period saved twice
+BASELINE_EMPLOYEES = [
+    (1, "ana", "Engineer", 4200.5, "2023-01-10"),
+    (2, "ben", "Engineer", 3900.0, "2023-03-01"),
+    (3, "cy", "Manager", 5100.25, "2022-07-15"),
+]
+BASELINE_RECORDS = [
+    (1, 1, "March", 2024, 4200.5, 0, 0, 0, 0, 0, 4200.5),
+    (2, 1, "03", "2024", 4200.5, 4, 157.52, 100, 0, 0, 4458.02),
+    (3, 2, "3", 2024, 3900.0, 0, 0, 0, 250, 0, 3650.0),
+    (4, 3, "Apr", 2024, 5100.25, 0, 0, 0.005, 0, 0, 1234.565),
+    (5, 3, "Smarch", 2024, 5100.25, 0, 0, 0, 0, 0, 5100.25),
+]
+
+
+def _baseline(db):
+    with db.transaction() as conn:
+        create_tables(conn.cursor())
+        conn.executemany("INSERT INTO employees VALUES (?, ?, ?, ?, ?)", BASELINE_EMPLOYEES)
+        conn.executemany("INSERT INTO financial_records VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         BASELINE_RECORDS)
+
+
+def test_baseline_database_migrates_to_latest(blank_db):
+    _baseline(blank_db)
+
+    applied = migrate(blank_db)
+
+    assert [version for version, _ in applied] == [m[0] for m in MIGRATIONS]
+    with blank_db.connection() as conn:
+        assert current_version(conn) == latest_version()
+        records = conn.execute("""SELECT id, employee_id, year, month, base_salary,
+                                         overtime_pay, incentives, advances, net_salary
+                                  FROM financial_records ORDER BY id""").fetchall()
+        salaries = conn.execute("SELECT id, base_salary FROM employees ORDER BY id").fetchall()
+        types = conn.execute("""SELECT DISTINCT typeof(base_salary), typeof(net_salary),
+                                       typeof(month), typeof(year)
+                                FROM financial_records""").fetchall()
+
+    # The duplicated March keeps its latest row; an unreadable month is kept as 0
+    assert records == [
+        (2, 1, 2024, 3, 420050, 15752, 10000, 0, 445802),
+        (3, 2, 2024, 3, 390000, 0, 0, 25000, 365000),
+        (4, 3, 2024, 4, 510025, 0, 1, 0, 123457),
+        (5, 3, 2024, 0, 510025, 0, 0, 0, 510025),
+    ]
+    assert salaries == [(1, 420050), (2, 390000), (3, 510025)]
+    assert types == [("integer", "integer", "integer", "integer")]
+    assert verify_summaries(blank_db) == []
+    assert verify_ledger(blank_db) == []
+
+
+def test_migrate_is_a_no_op_when_up_to_date(blank_db):
+    _baseline(blank_db)
+    migrate(blank_db)
+
+    assert migrate(blank_db) == []
+    assert init_database(blank_db) == []
+
+
+def test_migrate_stops_at_target(blank_db):
+    _baseline(blank_db)
+
+    applied = migrate(blank_db, target=2)
+
+    assert [version for version, _ in applied] == [1, 2]
+    with blank_db.connection() as conn:
+        assert current_version(conn) == 2
+        assert conn.execute("SELECT typeof(net_salary) FROM financial_records "
+                            "WHERE id = 2").fetchone() == ("real",)
+    assert [version for version, _ in migrate(blank_db)] == [m[0] for m in MIGRATIONS[2:]]
+
+
+def test_fresh_database_is_created_at_latest(db):
+    with db.connection() as conn:
+        assert current_version(conn) == latest_version()
+        columns = {row[1]: row[2] for row in conn.execute("PRAGMA table_info(financial_records)")}
+    assert columns["month"] == "INTEGER"
+    assert columns["net_salary"] == "INTEGER"
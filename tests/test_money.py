@@ -0,0 +1,71 @@
+import math
+
+import numpy as np
+import pytest
+
+from finance.money import (format_minor, from_minor, round_minor, sum_minor_by, to_minor,
+                           to_minor_array)
+
+HALF_CENTS = [
+    (0.005, 1),
+    (0.015, 2),
+    (1.005, 101),       # 100.49999... in binary
+    (2.675, 268),       # 267.49999...
+    (1234.565, 123457),
+    (-0.005, -1),
+    (-1.005, -101),
+    (0.0049999, 0),
+    (-0.0049999, 0),
+    (0.0050001, 1),
+]
+
+
+@pytest.mark.parametrize("amount, cents", HALF_CENTS)
+def test_to_minor_rounds_half_cents_away_from_zero(amount, cents):
+    assert to_minor(amount) == cents
+    assert to_minor(str(amount)) == cents
+
+
+def test_to_minor_array_matches_to_minor():
+    amounts = [amount for amount, _ in HALF_CENTS] + [0, 3900, 4458.02, 1e9 + 0.005]
+
+    converted = to_minor_array(amounts)
+
+    assert converted.dtype == np.int64
+    assert converted.tolist() == [to_minor(amount) for amount in amounts]
+
+
+@pytest.mark.parametrize("amount, cents", [(1234, 123400), ("1234.50", 123450), (" 7 ", 700),
+                                            (0, 0), (-0.0, 0)])
+def test_to_minor_accepts_numbers_and_text(amount, cents):
+    assert to_minor(amount) == cents
+
+
+@pytest.mark.parametrize("amount", [None, "", "abc", "1,234.50", math.nan, math.inf, -math.inf])
+def test_to_minor_rejects_invalid_amounts(amount):
+    with pytest.raises(ValueError, match="Invalid amount"):
+        to_minor(amount)
+
+
+def test_round_minor():
+    assert [round_minor(v) for v in (0.5, 1.5, 2.5, -0.5, -2.5, 0.4999)] == [1, 2, 3, -1, -3, 0]
+    # Binary noise below a millionth of a cent is dropped before rounding
+    assert round_minor(100.49999999999999) == 101
+
+
+def test_format_and_from_minor():
+    assert format_minor(123456789) == "1,234,567.89"
+    assert format_minor(-5) == "-0.05"
+    assert format_minor(None) == "0.00"
+    assert from_minor(445802) == 4458.02
+    assert from_minor(None) == 0
+
+
+def test_sum_minor_by_is_exact():
+    codes = np.array([0, 1, 0, 2, 1])
+    cents = np.array([1, 2, 3, 4, 5], dtype=np.int64)
+    assert sum_minor_by(codes, cents, 4).tolist() == [4, 7, 4, 0]
+
+    # Past 2**53 cents float64 bincount would lose the odd cents
+    big = np.array([2 ** 60 + 1, 2 ** 60 + 1, 3], dtype=np.int64)
+    assert sum_minor_by(np.array([0, 0, 1]), big, 2).tolist() == [2 ** 61 + 2, 3]
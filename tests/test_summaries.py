@@ -0,0 +1,86 @@
+import pytest
+
+from finance.payroll import run_payroll, save_financial_record
+from finance.summaries import rebuild_summaries, verify_summaries
+
+
+def _department_summary(db, year, month):
+    return db.execute("""SELECT position, employee_count, total_net_salary
+                         FROM position_month_summary WHERE year = ? AND month = ?
+                         ORDER BY position""", (year, month))
+
+
+@pytest.fixture
+def payroll(db, staff):
+    # Two months for everyone, with some adjustments on top
+    run_payroll(db, 1, 2024, [{"employee_id": staff["ana"], "overtime_hours": 6,
+                               "incentives": 120.10}])
+    run_payroll(db, 2, 2024, [{"employee_id": staff["cy"], "advances": 300}])
+    return staff
+
+
+def test_inserts(db, payroll):
+    save_financial_record(db, payroll["ben"], 3, 2024, incentives=49.99)
+
+    assert verify_summaries(db) == []
+    assert _department_summary(db, 2024, 3) == [("Engineer", 1, 394999)]
+
+
+def test_updates(db, payroll):
+    save_financial_record(db, payroll["ana"], 1, 2024, overtime_hours=1.5)
+    run_payroll(db, 2, 2024, [{"employee_id": payroll["ben"], "loans": 75.5}], overwrite=True)
+    with db.transaction() as conn:
+        conn.execute("UPDATE financial_records SET net_salary = net_salary + 1, year = 2023 "
+                     "WHERE employee_id = ? AND month = 2", (payroll["cy"],))
+
+    assert verify_summaries(db) == []
+
+
+def test_deletes(db, payroll):
+    with db.transaction() as conn:
+        conn.execute("DELETE FROM financial_records WHERE employee_id = ? AND month = 1",
+                     (payroll["ben"],))
+        conn.execute("DELETE FROM financial_records WHERE month = 2")
+
+    assert verify_summaries(db) == []
+    assert _department_summary(db, 2024, 2) == []
+    assert db.execute("SELECT COUNT(*) FROM employee_year_summary")[0] == (2,)
+
+
+def test_position_changes(db, payroll):
+    with db.transaction() as conn:
+        conn.execute("UPDATE employees SET position = 'Manager' WHERE id = ?", (payroll["ana"],))
+        conn.execute("UPDATE employees SET position = 'Director' WHERE id = ?", (payroll["cy"],))
+
+    assert verify_summaries(db) == []
+    assert [row[:2] for row in _department_summary(db, 2024, 1)] == [
+        ("Director", 1), ("Engineer", 1), ("Manager", 1)]
+
+
+def test_employees_added_and_removed(db, payroll):
+    # Records loaded before their employee (a bulk import) count once it exists
+    with db.transaction() as conn:
+        conn.execute("""INSERT INTO financial_records
+                            (employee_id, month, year, base_salary, net_salary)
+                        VALUES (99, 1, 2024, 250000, 250000)""")
+    assert verify_summaries(db) == []
+    with db.transaction() as conn:
+        conn.execute("""INSERT INTO employees (id, name, position, base_salary, join_date)
+                        VALUES (99, 'dee', 'Engineer', 250000, '2024-01-01')""")
+    assert verify_summaries(db) == []
+    assert _department_summary(db, 2024, 1)[0][:2] == ("Engineer", 3)
+
+    with db.transaction() as conn:
+        conn.execute("DELETE FROM employees WHERE id = ?", (payroll["cy"],))
+    assert verify_summaries(db) == []
+
+
+def test_verify_reports_drift_and_rebuild_fixes_it(db, payroll):
+    with db.transaction() as conn:
+        conn.execute("UPDATE position_month_summary SET total_net_salary = total_net_salary + 1 "
+                     "WHERE position = 'Manager' AND month = 1")
+
+    assert [problem[:2] for problem in verify_summaries(db)] == [
+        ("position_month_summary", ("Manager", 2024, 1))]
+    rebuild_summaries(db)
+    assert verify_summaries(db) == []
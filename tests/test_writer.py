@@ -0,0 +1,53 @@
+import sqlite3
+
+import pytest
+
+from finance import Database
+from finance.employees import write_employee
+from finance.schema import init_database
+from finance.writer import GroupCommitWriter
+
+
+@pytest.fixture
+def writer(tmp_path):
+    # Short busy_timeout so a held lock fails the group quickly
+    db = Database(str(tmp_path / "finance.db"), pragmas={"busy_timeout": 50})
+    init_database(db)
+    writer = GroupCommitWriter(db)
+    yield writer
+    writer.close()
+    db.close()
+
+
+def _names(writer):
+    return [name for (name,) in writer.db.execute("SELECT name FROM employees ORDER BY id")]
+
+
+def test_writes_in_a_group_fail_alone(writer):
+    futures = [writer.submit(write_employee, "ana", "Engineer", 4200, "2023-01-10"),
+               writer.submit(write_employee, "ana", "Engineer", 4200, "2023-01-10"),
+               writer.submit(write_employee, "ben", "Engineer", 3900, "2023-03-01")]
+
+    assert futures[0].result(timeout=5) == 1
+    with pytest.raises(sqlite3.IntegrityError):
+        futures[1].result(timeout=5)
+    assert futures[2].result(timeout=5)
+    assert _names(writer) == ["ana", "ben"]
+
+
+def test_every_caller_hears_when_begin_fails(writer):
+    locker = sqlite3.connect(writer.db.path, isolation_level=None)
+    locker.execute("BEGIN IMMEDIATE")
+    try:
+        futures = [writer.submit(write_employee, name, "Engineer", 3000, "2024-01-01")
+                   for name in ("ana", "ben", "cy")]
+        for future in futures:
+            with pytest.raises(sqlite3.OperationalError, match="locked"):
+                future.result(timeout=5)
+    finally:
+        locker.execute("ROLLBACK")
+        locker.close()
+
+    # The writer carries on once the lock is released
+    assert writer.submit(write_employee, "dee", "Engineer", 3000, "2024-01-01").result(timeout=5)
+    assert _names(writer) == ["dee"]